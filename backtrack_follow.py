@@ -3,132 +3,146 @@
 #Will move backwards whenever a person is too close
 #If the person’s width is ≥ 90% of the frame width
 #Or if the person’s height is ≥ 90% of the frame height
+#Reversing and turning wait for free space on the occupancy grid (occupancy_grid.py)
 
 import cv2
-import socket
-import depthai as dai
-from cvzone.PoseModule import PoseDetector
-from cvzone.HandTrackingModule import HandDetector
+from command_sender import CommandSender
+from frame_source import DepthAISource
+from pose_tracker import PoseTracker
+from occupancy_grid import OccupancyGrid, guard, intrinsics_from_device
+from startup import warm_up
+from tracing import span
+from hand_roi import RoiHandDetector
+from follower_runtime import COLOR_GREEN, COLOR_PURPLE, COLOR_RED, person_box, run_follower
 
 # TCP Connection Setup
 ROBOT_IP = "100.87.161.11"
 PORT = 9999
-client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-client_socket.connect((ROBOT_IP, PORT))
-print("[Follower] Connected to robot.")
-
-# Initialize pose and hand detectors
-pose_detector = PoseDetector()
-hand_detector = HandDetector(detectionCon=0.8, maxHands=1)  # Adjust detectionCon if needed
-
-# Create pipeline and camera
-pipeline = dai.Pipeline()
-cam = pipeline.createColorCamera()
-cam.setPreviewSize(1280, 720)  # Higher resolution for better range
-cam.setInterleaved(False)
-cam.setBoardSocket(dai.CameraBoardSocket.CAM_A)
-xout = pipeline.createXLinkOut()
-xout.setStreamName("video")
-cam.preview.link(xout.input)
 
 # Frame and movement setup
-frame_width = 1280
+frame_width = 1280   # camera preview (field of view) the thresholds were tuned on
 frame_height = 720
-frame_center = frame_width // 2
-center_tolerance = frame_width // 10  # acceptable range to go straight
+INFER_SIZE = (640, 360)   # detector input, scaled on the camera (see frame_source.py)
+DISPLAY_SIZE = None       # e.g. (1280, 720) for a separate, sharper display stream
+DISPLAY_EVERY = 2         # display stream carries every Nth camera frame
+POSE_MAX_INTERVAL = 6     # findPose at least every Nth frame, bbox tracked in between (pose_tracker.py)
+LATENCY_BUDGET = 0.15
+SHED_ORDER = ("hands", "draw", "resolution")  # shed in this order while over budget
+PROTOCOL = "legacy"       # or "binary": velocity messages with proportional steering (velocity_protocol.py)
+TRANSPORT = "tcp"         # or "udp": one datagram per message, binary protocol only (command_sender.py)
+USE_OCCUPANCY = True      # stereo depth -> occupancy grid; only turn/reverse into free space
+
+# Thresholds are fractions of the frame, so they hold at any resolution
+center_tolerance = 0.1  # acceptable range to go straight
 
 # Thresholds for distance zones (adjust for your space)
-LOWER_HEIGHT = 500   # Below this: move forward
-UPPER_HEIGHT = 1000   # Between these: sweet zone (stop)
+LOWER_HEIGHT = 500 / 720   # Below this: move forward (500 px at 720p)
+UPPER_HEIGHT = 1000 / 720   # Between these: sweet zone (stop)
 TOO_CLOSE_WIDTH_RATIO = 0.9   # If person fills 90% of frame
 TOO_CLOSE_HEIGHT_RATIO = 0.9
 
-# Colors (BGR)
-COLOR_GREEN = (0, 255, 0)
-COLOR_PURPLE = (255, 0, 255)
-COLOR_RED = (0, 0, 255)
-
-# State to track permanent stop after fist detection
-stopped = False
-
-# Run on device
-with dai.Device(pipeline) as device:
-    video_queue = device.getOutputQueue(name="video", maxSize=4, blocking=False)
-
-    try:
-        while True:
-            in_frame = video_queue.get()
-            frame = in_frame.getCvFrame()
-
-            # Pose detection
-            img = pose_detector.findPose(frame)
-            lmList, bboxInfo = pose_detector.findPosition(img, bboxWithHands=True)
-
-            # Hand detection and fist check (only if not stopped), now drawing landmarks and bbox
-            if not stopped:
-                hands, img = hand_detector.findHands(img, draw=True)  # draw=True draws landmarks & connections
-                
-                if hands:
-                    for hand in hands:
-                        # Draw bounding box around hand
-                        xH, yH, wH, hH = hand['bbox']
-                        cv2.rectangle(img, (xH, yH), (xH + wH, yH + hH), (255, 255, 0), 2)  # Cyan box
-
-                    hand = hands[0]
-                    fingers = hand_detector.fingersUp(hand)
-                    if sum(fingers) == 0:  # all fingers down = fist detected
-                        stopped = True
-                        print("[Follower] Fist detected - stopping permanently.")
-
-            if stopped:
-                command = 'x'  # Permanently stop
-                box_color = None
+# Hand detection runs on crops around the pose wrists (see hand_roi.py)
+HAND_CADENCE = 2            # look for a fist every Nth frame
+HAND_FULL_FRAME_EVERY = 5   # full-frame fallback after this many empty crop searches
+
+
+def build_detect(state):
+    """Create the pose and hand detectors and return detect(frame) -> (img, detection)."""
+    from cvzone.PoseModule import PoseDetector
+    from cvzone.HandTrackingModule import HandDetector
+    from detection_cache import cached
+
+    # Initialize pose and hand detectors
+    pose_detector = cached(warm_up(PoseDetector(), INFER_SIZE))
+    find_pose = state['pose_tracker'] = PoseTracker(pose_detector, max_interval=POSE_MAX_INTERVAL)
+    hand_detector = HandDetector(detectionCon=0.8, maxHands=1)  # Adjust detectionCon if needed
+    hand_detector = cached(warm_up(hand_detector, INFER_SIZE))
+    find_hands = state['hand_detector'] = RoiHandDetector(hand_detector, cadence=HAND_CADENCE,
+                                                          full_frame_every=HAND_FULL_FRAME_EVERY)
+
+    def detect(frame, depth=None):
+        # Obstacles around the robot, from the depth aligned to this frame
+        if depth is not None and 'grid' in state:
+            with span("occupancy"):
+                state['grid'].update(depth)
+
+        # Pose detection
+        with span("findPose"):
+            img, lmList, bboxInfo = find_pose(frame)
+
+        # Hand detection and fist check around the wrists (only if not stopped), drawing landmarks and bbox
+        hands = []
+        fist = False
+        scheduler = state.get('scheduler')
+        if not state['stopped']:
+            if scheduler is not None and scheduler.skip("hands"):
+                hands, fist = find_hands.last  # last result while the scheduler sheds hand detection
             else:
-                if bboxInfo is not None and 'bbox' in bboxInfo:
-                    x, y, w, h = bboxInfo['bbox']
-                    cx = x + w // 2
-                    offset = cx - frame_center
-
-                    # Movement logic and bounding box color
-                    if w >= TOO_CLOSE_WIDTH_RATIO * frame_width or h >= TOO_CLOSE_HEIGHT_RATIO * frame_height:
-                        command = 's'  # Move backward
-                        box_color = COLOR_RED
-                    elif LOWER_HEIGHT <= h <= UPPER_HEIGHT:
-                        command = 'x'  # Stop
-                        box_color = COLOR_PURPLE
-                    elif h < LOWER_HEIGHT:
-                        if abs(offset) < center_tolerance:
-                            command = 'w'  # Move forward
-                        elif offset < 0:
-                            command = 'a'  # Turn left
-                        else:
-                            command = 'd'  # Turn right
-                        box_color = COLOR_GREEN
-                    else:
-                        command = 'x'
-                        box_color = COLOR_PURPLE
-
-                    # Draw full bounding box and center dot
-                    cv2.rectangle(img, (x, y), (x + w, y + h), box_color, thickness=3)
-                    cv2.circle(img, (cx, y + h // 2), 6, (0, 0, 255), cv2.FILLED)
-                else:
-                    command = 'x'  # Stop if no person
-                    box_color = None
-
-            # Send command
-            try:
-                client_socket.sendall(command.encode())
-                print(f"[Follower] Sent command: {command}")
-            except Exception as e:
-                print(f"[Follower][TCP ERROR]: {e}")
-
-            # Show frame with pose and hand landmarks + bounding boxes
-            cv2.imshow("Follower View", img)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                client_socket.sendall('x'.encode())
-                break
-
-    finally:
-        client_socket.close()
-        cv2.destroyAllWindows()
-        print("[Follower] Shutdown complete.")
\ No newline at end of file
+                with span("findHands"):
+                    hands, fist = find_hands(img, lmList)  # all fingers down = fist detected
+
+            for hand in hands:
+                # Draw bounding box around hand
+                xH, yH, wH, hH = hand['bbox']
+                cv2.rectangle(img, (xH, yH), (xH + wH, yH + hH), (255, 255, 0), 2)  # Cyan box
+
+        return img, {'lmList': lmList, 'bboxInfo': bboxInfo, 'hands': hands, 'fist': fist,
+                     'frame_size': (frame.shape[1], frame.shape[0])}
+    return detect
+
+
+def decide(detection, state):
+    """Return (command, box_color) for one detection; a fist latches state['stopped']."""
+    if not state['stopped'] and detection['fist']:
+        state['stopped'] = True
+        print("[Follower] Fist detected - stopping permanently.")
+
+    if state['stopped']:
+        return 'x', None  # Permanently stop
+
+    box = person_box(detection, (frame_width, frame_height))
+    if box is None:
+        return 'x', None  # Stop if no person
+
+    offset, w, h = box
+
+    # Movement logic and bounding box color
+    if w >= TOO_CLOSE_WIDTH_RATIO or h >= TOO_CLOSE_HEIGHT_RATIO:
+        return guard(state.get('grid'), 's'), COLOR_RED  # Move backward
+    elif LOWER_HEIGHT <= h <= UPPER_HEIGHT:
+        return 'x', COLOR_PURPLE  # Stop
+    elif h < LOWER_HEIGHT:
+        if abs(offset) < center_tolerance:
+            command = 'w'  # Move forward
+        elif offset < 0:
+            command = 'a'  # Turn left
+        else:
+            command = 'd'  # Turn right
+        return guard(state.get('grid'), command), COLOR_GREEN
+    return 'x', COLOR_PURPLE
+
+
+def main():
+    sender = CommandSender(ROBOT_IP, PORT, protocol=PROTOCOL, transport=TRANSPORT).start()
+    camera = DepthAISource(frame_width, frame_height, infer_size=INFER_SIZE, display_size=DISPLAY_SIZE,
+                           display_every=DISPLAY_EVERY, depth=USE_OCCUPANCY)
+    # State to track permanent stop after fist detection
+    state = {'stopped': False}
+    grid = state['grid'] = OccupancyGrid()  # obstacles around the robot (see occupancy_grid.py)
+
+    def send(command, velocity=None):
+        grid.drive(command, velocity)  # dead-reckon the grid with what the robot was actually told
+        sender.send(command, velocity)
+
+    def on_open(video_queue):
+        if USE_OCCUPANCY:
+            grid.intrinsics = intrinsics_from_device(video_queue.device, INFER_SIZE)
+
+    run_follower(sender, camera, build_detect, decide, state, LATENCY_BUDGET, SHED_ORDER, send=send, on_open=on_open,
+                 reports=lambda video_queue: {"Pose tracking": state['pose_tracker'].report(),
+                                              "Occupancy": grid.report(),
+                                              "Hand detection": state['hand_detector'].report()})
+
+
+if __name__ == "__main__":
+    main()
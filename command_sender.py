@@ -0,0 +1,224 @@
+#Background command sender shared by the follower scripts and planner.py
+#The vision loop only records the command it wants; a worker thread sends it
+#when it changes (plus a keep-alive heartbeat), so a slow robot link never
+#stalls frame processing and repeated 'x'/'w' frames cost no network traffic
+#With protocol="binary" each command goes out as a framed velocity message with
+#a sequence number and its frame's capture timestamp (velocity_protocol.py);
+#"legacy" sends the single characters controller.py has always read.
+#transport="udp" sends each binary message as one datagram: no head-of-line
+#blocking behind a lost segment, and a lost message is replaced by the next
+#change or heartbeat (sent more often for UDP) rather than retransmitted late
+
+import socket
+import threading
+import time
+from typing import Optional
+
+from tracing import tracer
+from velocity_protocol import COMMAND_TWIST, FLAG_HEARTBEAT, encode
+
+PROTOCOLS = ("legacy", "binary")
+TRANSPORTS = ("tcp", "udp")
+UDP_HEARTBEAT = 0.1  # seconds; lost datagrams are only made up for by the next message
+
+
+class CommandSender:
+    """Change-only, coalescing TCP command sender with heartbeat and reconnect.
+
+    ``send`` never blocks: it overwrites the pending command, so if several
+    commands arrive while the link is busy only the newest one goes out.
+    With ``protocol="binary"`` a command is (character, (linear, angular)) and
+    changes when either does; heartbeats carry a new sequence number and the
+    capture timestamp of the newest frame that asked for the same command.
+    ``transport="udp"`` (binary only) sends datagrams instead of a TCP stream;
+    ``heartbeat`` then defaults to UDP_HEARTBEAT instead of 0.5 s.
+    """
+
+    def __init__(self, host: str, port: int, heartbeat: Optional[float] = None, name: str = "Follower",
+                 connect_timeout: float = 2.0, min_backoff: float = 0.25, max_backoff: float = 5.0,
+                 protocol: str = "legacy", transport: str = "tcp", verbose: bool = True):
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"Unknown protocol {protocol!r}, expected one of {PROTOCOLS}")
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown transport {transport!r}, expected one of {TRANSPORTS}")
+        if transport == "udp" and protocol != "binary":
+            raise ValueError("The udp transport needs protocol='binary' (datagrams carry the sequence numbers)")
+        if heartbeat is None:
+            heartbeat = UDP_HEARTBEAT if transport == "udp" else 0.5
+        self.host = host
+        self.port = port
+        self.heartbeat = heartbeat  # seconds between repeats of an unchanged command, 0 disables
+        self.name = name
+        self.connect_timeout = connect_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.protocol = protocol
+        self.transport = transport
+        self.verbose = verbose  # print every command sent
+        self._seq = 0  # binary message sequence number, heartbeats included
+
+        self._cond = threading.Condition()
+        self._desired = None  # command, or (command, velocity) with the binary protocol
+        self._desired_frame = (None, None)  # (seq, device timestamp) of the frame behind _desired
+        self._sent = None
+        self._last_send = 0.0
+        self._closing = False
+        self._sock: Optional[socket.socket] = None
+        self._thread = None
+        self.first_connected = None  # time.perf_counter() of the first successful connect
+
+        self.stats = {'requested': 0, 'sent': 0, 'heartbeats': 0, 'coalesced': 0,
+                      'connects': 0, 'errors': 0}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="command-sender", daemon=True)
+        self._thread.start()
+        return self
+
+    def _key(self, command, velocity=None):
+        if self.protocol == "legacy":
+            return command
+        if velocity is None:
+            velocity = COMMAND_TWIST.get(command, COMMAND_TWIST['x'])
+        return command, tuple(velocity)
+
+    def send(self, command: str, velocity=None):
+        """Record the newest command; returns immediately.
+
+        ``velocity`` is an optional (linear, angular) for the binary protocol,
+        the command's fixed speeds otherwise; the legacy protocol ignores it.
+        The calling thread's traced frame (see tracing.py) travels with the
+        command so the worker can record capture-to-wire latency.
+        """
+        command = self._key(command, velocity)
+        frame = tracer.current_frame()
+        with self._cond:
+            self.stats['requested'] += 1
+            if self._desired != self._sent and self._desired != command:
+                self.stats['coalesced'] += 1  # previous pending command was never sent
+            self._desired = command
+            self._desired_frame = frame
+            if command != self._sent:
+                self._cond.notify()
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    def close(self, final_command: Optional[str] = 'x', timeout: float = 2.0):
+        """Flush final_command (stop by default) and shut the worker down."""
+        with self._cond:
+            if final_command is not None:
+                self._desired = self._key(final_command)
+                self._desired_frame = (None, None)
+                self._sent = None  # always send the final command, even if unchanged
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._disconnect()
+
+    def _connect(self) -> bool:
+        try:
+            if self.transport == "udp":
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sock.connect((self.host, self.port))  # only fixes the destination; nothing is exchanged
+            else:
+                sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError as e:
+            print(f"[{self.name}][{self.transport.upper()} ERROR]: connect to {self.host}:{self.port} failed: {e}")
+            return False
+        sock.settimeout(self.connect_timeout)
+        self._sock = sock
+        self.stats['connects'] += 1
+        if self.first_connected is None:
+            self.first_connected = time.perf_counter()
+        print(f"[{self.name}] Connected to robot at {self.host}:{self.port}.")
+        return True
+
+    def _disconnect(self):
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _next_command(self):
+        """Wait for a changed command or a due heartbeat.
+
+        Returns (command, frame, is_heartbeat); frame is the (seq, timestamp)
+        of the newest frame that asked for the command.
+        """
+        with self._cond:
+            while True:
+                if self._desired is not None and self._desired != self._sent:
+                    return self._desired, self._desired_frame, False
+                if self._closing:
+                    return None, None, False
+                wait = None
+                if self.heartbeat > 0 and self._sent is not None:
+                    wait = self._last_send + self.heartbeat - time.monotonic()
+                    if wait <= 0:
+                        return self._sent, self._desired_frame, True
+                self._cond.wait(wait)
+
+    def _encode(self, command, frame, is_heartbeat) -> bytes:
+        if self.protocol == "legacy":
+            return command.encode()
+        _, (linear, angular) = command
+        self._seq += 1
+        return encode(self._seq, frame[1], linear, angular, FLAG_HEARTBEAT if is_heartbeat else 0)
+
+    def _run(self):
+        backoff = self.min_backoff
+        while True:
+            if self._sock is None:
+                if self._connect():
+                    backoff = self.min_backoff
+                    with self._cond:
+                        self._sent = None  # resend the current command on the new connection
+                else:
+                    with self._cond:
+                        if self._closing:
+                            return
+                        self._cond.wait(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+
+            command, frame, is_heartbeat = self._next_command()
+            if command is None:
+                return
+            started = time.monotonic()
+            try:
+                self._sock.sendall(self._encode(command, frame, is_heartbeat))
+            except OSError as e:
+                self.stats['errors'] += 1
+                print(f"[{self.name}][{self.transport.upper()} ERROR]: {e}")
+                self._disconnect()
+                continue
+
+            with self._cond:
+                self._sent = command
+                self._last_send = time.monotonic()
+                closing = self._closing and self._desired == command
+            if is_heartbeat:
+                self.stats['heartbeats'] += 1
+            else:
+                self.stats['sent'] += 1
+                seq, timestamp = frame
+                finished = time.monotonic()
+                tracer.record("sendall", started, finished, seq)
+                if timestamp is not None and 0.0 <= finished - timestamp < 60.0:
+                    tracer.record("capture_to_wire", timestamp, finished, seq)
+                if self.verbose and self.protocol == "legacy":
+                    print(f"[{self.name}] Sent command: {command}")
+                elif self.verbose:
+                    print(f"[{self.name}] Sent command: {command[0]} "
+                          f"(#{self._seq}, {command[1][0]:+.2f} m/s, {command[1][1]:+.2f} rad/s)")
+            if closing:
+                return
+
+    def report(self) -> str:
+        return ", ".join(f"{key} {value}" for key, value in self.stats.items())
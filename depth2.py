@@ -1,6 +1,8 @@
 import cv2
 import depthai as dai
 import numpy as np
+from disparity_lut import StereoView, lut_from_device
+from stream_sync import StreamSynchronizer
 
 def getFrame(queue):
     # Get frame from queue and convert to OpenCV format
@@ -63,31 +65,35 @@ if __name__ == "__main__":
         qLeft = device.getOutputQueue(name="left", maxSize=4, blocking=False)
         qRight = device.getOutputQueue(name="right", maxSize=4, blocking=False)
 
-        # Disparity range 0-95 -> map to 0-255 for visualization
-        disparityMultiplier = 255 / stereo.getMaxDisparity()
+        # All three come from the stereo node, so one capture shares a sequence number
+        sync = StreamSynchronizer({"depth": qDepth, "left": qLeft, "right": qRight})
+
+        # Disparity -> colour and disparity -> depth, set up once from the max disparity and calibration
+        lut = lut_from_device(device, stereo, 1280, 720)
+        view = StereoView()  # reused output buffers for the stereo view
 
         sideBySide = True  # toggle key
 
         print("Press 't' to toggle stereo view style. Press 'q' to quit.")
 
         while True:
-            # Get frames
-            disparity = getFrame(qDepth)
-            left = getFrame(qLeft)
-            right = getFrame(qRight)
-
-            # Normalize disparity for display
-            disparity_visual = (disparity * disparityMultiplier).astype(np.uint8)
-            disparity_colored = cv2.applyColorMap(disparity_visual, cv2.COLORMAP_JET)
-
-            # Show stereo view and disparity
-            if sideBySide:
-                stereo_view = np.hstack((left, right))
-                cv2.imshow("Stereo View", stereo_view)
-            else:
-                overlay = cv2.addWeighted(left, 0.5, right, 0.5, 0)
-                cv2.imshow("Stereo View", overlay)
-
+            # Get the newest matching disparity/left/right set
+            frames = sync.get()
+            disparity = frames["depth"].getCvFrame()
+            left = frames["left"].getCvFrame()
+            right = frames["right"].getCvFrame()
+
+            # Colour the disparity for display
+            disparity_colored = lut.colorize(disparity)
+
+            # Distance at the image center, straight from the depth table
+            h, w = disparity.shape
+            center_mm = lut.depth_at(disparity, w // 2, h // 2)
+            cv2.putText(disparity_colored, f"{center_mm / 1000:.2f} m", (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+
+            # Show stereo view (side by side or overlay) and disparity
+            cv2.imshow("Stereo View", view.compose(left, right, sideBySide))
             cv2.imshow("Disparity", disparity_colored)
 
             key = cv2.waitKey(1) & 0xFF
@@ -97,3 +103,4 @@ if __name__ == "__main__":
                 sideBySide = not sideBySide
 
         cv2.destroyAllWindows()
+        print(f"[Stereo] Sync: {sync.report()}")
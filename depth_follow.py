@@ -0,0 +1,118 @@
+#This version of the follow program measures the distance to the person with
+#the stereo depth camera instead of guessing it from the bounding-box height
+#Depth is aligned to the RGB frame on the camera, and the distance is the
+#median depth of the torso (see depth_distance.py)
+#Too close -> back away, in the stop zone -> turn to face, farther -> follow
+#Without valid depth it falls back to the bounding-box height zones
+
+from command_sender import CommandSender
+from depth_distance import DepthHistogram, target_distance
+from frame_source import DepthAISource
+from pose_tracker import PoseTracker
+from startup import warm_up
+from tracing import span
+from follower_runtime import COLOR_GREEN, COLOR_PURPLE, COLOR_RED, person_box, run_follower
+
+# TCP Connection Setup
+ROBOT_IP = "100.87.161.11"
+PORT = 9999
+
+# Frame and movement setup
+frame_width = 1280   # camera preview (field of view) the thresholds were tuned on
+frame_height = 720
+INFER_SIZE = (640, 360)   # detector input, scaled on the camera (see frame_source.py)
+DISPLAY_SIZE = None       # e.g. (1280, 720) for a separate, sharper display stream
+DISPLAY_EVERY = 2         # display stream carries every Nth camera frame
+POSE_MAX_INTERVAL = 6     # findPose at least every Nth frame, bbox tracked in between (pose_tracker.py)
+LATENCY_BUDGET = 0.15
+SHED_ORDER = ("draw", "resolution")  # no hand detection to shed
+PROTOCOL = "legacy"       # or "binary": velocity messages with proportional steering (velocity_protocol.py)
+TRANSPORT = "tcp"         # or "udp": one datagram per message, binary protocol only (command_sender.py)
+USES_DEPTH = True         # runs the stereo pair; detect() takes (frame, depth)
+
+# Thresholds are fractions of the frame, so they hold at any resolution
+center_tolerance = 0.1  # acceptable range to go straight
+
+# Distance zones in metres
+TOO_CLOSE_DISTANCE = 1.0   # closer than this: back away
+STOP_DISTANCE = 2.0        # between the two: stop and turn to face
+
+# Fallback zones when there is no valid depth (as in center_follow.py)
+LOWER_HEIGHT = 600 / 720
+UPPER_HEIGHT = 800 / 720
+TOO_CLOSE_HEIGHT_RATIO = 0.9
+
+
+def build_detect(state):
+    """Create the pose detector and return detect(frame, depth) -> (img, detection)."""
+    from cvzone.PoseModule import PoseDetector
+    from detection_cache import cached
+
+    pose_detector = cached(warm_up(PoseDetector(), INFER_SIZE))
+    find_pose = state['pose_tracker'] = PoseTracker(pose_detector, max_interval=POSE_MAX_INTERVAL)
+    histogram = DepthHistogram()
+
+    def detect(frame, depth=None):
+        # Pose detection
+        with span("findPose"):
+            img, lmList, bboxInfo = find_pose(frame)
+        detection = {'lmList': lmList, 'bboxInfo': bboxInfo, 'frame_size': (frame.shape[1], frame.shape[0]),
+                     'distance': None}
+
+        # Distance to the person from the aligned depth frame
+        if depth is not None and bboxInfo:
+            with span("depth.histogram"):
+                histogram.update(depth)
+            with span("depth.query"):
+                detection['distance'] = target_distance(histogram, detection, (frame_width, frame_height))
+        return img, detection
+    return detect
+
+
+def steer(offset, centered_command):
+    """Turn toward the person, or issue centered_command when they are centered."""
+    if abs(offset) < center_tolerance:
+        return centered_command
+    elif offset < 0:
+        return 'a'  # Turn left
+    return 'd'  # Turn right
+
+
+def decide(detection, state):
+    """Return (command, box_color) for one detection."""
+    box = person_box(detection, (frame_width, frame_height))
+    if box is None:
+        return 'x', None  # Stop if no person
+
+    offset, w, h = box
+    distance = detection.get('distance')
+
+    if distance is None:
+        # No valid depth on the person: judge distance by bbox height
+        if h >= TOO_CLOSE_HEIGHT_RATIO:
+            return steer(offset, 's'), COLOR_RED
+        elif LOWER_HEIGHT <= h <= UPPER_HEIGHT:
+            return steer(offset, 'x'), COLOR_PURPLE
+        elif h < LOWER_HEIGHT:
+            return steer(offset, 'w'), COLOR_GREEN
+        return 'x', COLOR_PURPLE
+
+    if distance < TOO_CLOSE_DISTANCE:
+        return steer(offset, 's'), COLOR_RED  # Back straight, or turn while backing
+    elif distance <= STOP_DISTANCE:
+        return steer(offset, 'x'), COLOR_PURPLE  # Hold distance, keep facing them
+    return steer(offset, 'w'), COLOR_GREEN  # Follow
+
+
+def main():
+    sender = CommandSender(ROBOT_IP, PORT, protocol=PROTOCOL, transport=TRANSPORT).start()
+    camera = DepthAISource(frame_width, frame_height, infer_size=INFER_SIZE, display_size=DISPLAY_SIZE,
+                           display_every=DISPLAY_EVERY, depth=True)
+    state = {}
+    run_follower(sender, camera, build_detect, decide, state, LATENCY_BUDGET, SHED_ORDER,
+                 reports=lambda video_queue: {"Pose tracking": state['pose_tracker'].report(),
+                                              "Depth sync": video_queue.sync.report()})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+#Content-addressed detection cache for replays and sweeps
+#Offline experiments run the same detectors on the same recorded frames over
+#and over. Wrapping a detector with cached() memoises its results on disk,
+#keyed by a hash of the frame's pixels plus the detector's identity: its class,
+#its constructor parameters (detectionCon, maxHands, ...), the model file's
+#size and mtime, and the library versions. A re-run of a session then only
+#hashes each frame and reads a few KB from the cache. Entries live in one
+#SQLite file, with least-recently-used entries evicted past `max_bytes`
+#
+#Wrappers keep the detector's interface, so the follower scripts use them
+#unchanged:
+#  PoseDetector        findPose + findPosition (cvzone)
+#  HandDetector        findHands, with fingersUp answered from the cached hand
+#  PoseHandsPerception perception(frame) (MediaPipe holistic / pose + hands)
+#  Segmenter           segmenter(frame), steer(frame) + last_mask() (planner UNet)
+#
+#Set FOLLOW_DETECTION_CACHE=~/.cache/follower.db (FOLLOW_DETECTION_CACHE_MB=2048)
+#and every follower and planner.py caches its detections.
+#MediaPipe's video mode tracks landmarks from the previous call, so a cache hit,
+#which skips that call, would change what the next miss returns. cached()
+#therefore rebuilds MediaPipe detectors in static-image mode: every result then
+#depends on its frame alone, whatever was served from the cache before it.
+#Cached runs match uncached static-image runs, not the live video-mode output
+#
+#Benchmark with a stand-in detector:  python3 detection_cache.py
+
+import argparse
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+import cv2
+import numpy as np
+
+CACHE_VERSION = 1  # bump when the stored layout of any wrapper's results changes
+DEFAULT_MAX_MB = 2048
+LIBRARIES = ("cvzone", "mediapipe", "torch", "onnxruntime")
+STATIC_FLAGS = ("staticMode", "mode", "static_image_mode")  # cvzone >= 1.6, older cvzone, perception.py
+_MISS = object()
+
+
+def frame_digest(frame, namespace=b""):
+    """SHA-256 (hardware accelerated on current CPUs) of the namespace, the frame's shape/dtype and its pixels."""
+    frame = np.ascontiguousarray(frame)
+    digest = hashlib.sha256(namespace)
+    digest.update(f"{frame.shape}{frame.dtype}".encode())
+    digest.update(memoryview(frame).cast("B"))
+    return digest.digest()[:16]
+
+
+def detector_identity(detector, **params):
+    """Namespace for one detector's results: class, scalar settings, model files and library versions."""
+    parts = [f"v{CACHE_VERSION}", f"{type(detector).__module__}.{type(detector).__qualname__}"]
+    settings = {key: value for key, value in vars(detector).items()
+                if isinstance(value, (bool, int, float, str, type(None))) and not key.startswith('_')}
+    settings.update(params)
+    for key in sorted(settings):
+        value = settings[key]
+        if isinstance(value, str) and os.path.isfile(value):
+            stat = os.stat(value)
+            value = f"{value}:{stat.st_size}:{stat.st_mtime_ns}"  # retrained weights get new entries
+        parts.append(f"{key}={value!r}")
+    for name in LIBRARIES:
+        if name in sys.modules:
+            parts.append(f"{name}={getattr(sys.modules[name], '__version__', '?')}")
+    return "|".join(parts).encode()
+
+
+class DetectionCache:
+    """Size-bounded LRU store of pickled detector results in one SQLite file."""
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_MB << 20, flush_every=256):
+        path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_every = flush_every
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")  # readers in other processes don't block the writer
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries "
+                         "(key BLOB PRIMARY KEY, value BLOB, size INTEGER, used INTEGER)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+        self._lock = threading.Lock()
+        self._touched = {}  # key -> last use, written back in batches
+        self.bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        self.stats = {'hits': 0, 'misses': 0, 'evicted': 0, 'hit_s': 0.0}
+
+    def get(self, key, default=None):
+        """Cached value for `key`, or `default`."""
+        started = time.perf_counter()
+        with self._lock:
+            row = self._db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return default
+            self._touched[key] = time.time_ns()
+            if len(self._touched) >= self.flush_every:
+                self._flush()
+            value = pickle.loads(zlib.decompress(row[0]))
+            self.stats['hits'] += 1
+            self.stats['hit_s'] += time.perf_counter() - started
+        return value
+
+    def put(self, key, value):
+        blob = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        with self._lock:
+            old = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                             (key, blob, len(blob), time.time_ns()))
+            self.bytes += len(blob) - (old[0] if old else 0)
+            if self.bytes > self.max_bytes:
+                self._evict()
+
+    def _flush(self):
+        if self._touched:
+            self._db.executemany("UPDATE entries SET used = ? WHERE key = ?",
+                                 [(used, key) for key, used in self._touched.items()])
+            self._touched.clear()
+
+    def _evict(self):
+        """Drop least recently used entries down to 90% of max_bytes."""
+        self._flush()
+        self.bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]  # other processes
+        target = self.max_bytes * 0.9
+        while self.bytes > target:
+            rows = self._db.execute("SELECT key, size FROM entries ORDER BY used LIMIT 256").fetchall()
+            if not rows:
+                break
+            victims = []
+            for key, size in rows:
+                victims.append((key,))
+                self.bytes -= size
+                if self.bytes <= target:
+                    break
+            self._db.executemany("DELETE FROM entries WHERE key = ?", victims)
+            self.stats['evicted'] += len(victims)
+
+    def memoize(self, key, compute):
+        """get(key), or compute(), stored under key."""
+        value = self.get(key, _MISS)
+        if value is _MISS:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def report(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        hit_ms = self.stats['hit_s'] * 1000 / max(1, self.stats['hits'])
+        return (f"{self.stats['hits']}/{lookups} hits ({hit_ms:.2f} ms each), {self.stats['evicted']} evicted, "
+                f"{self.bytes / 1e6:.2f}/{self.max_bytes / 1e6:.0f} MB")
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._db.close()
+
+
+class CachedPoseDetector:
+    """cvzone PoseDetector whose findPose + findPosition results come from the cache when it has them.
+
+    findPose only hashes the frame; the real detector runs (and draws on the
+    image) when findPosition misses. A cached frame is returned without the
+    skeleton drawn on it.
+    """
+
+    def __init__(self, detector, cache, **params):
+        self.detector = detector
+        self.cache = cache
+        self.namespace = detector_identity(detector, **params)
+        self._pending = None  # (img, draw, digest) from the last findPose
+
+    def findPose(self, img, draw=True):
+        self._pending = (img, draw, frame_digest(img, self.namespace))
+        return img
+
+    def findPosition(self, img, draw=True, bboxWithHands=False):
+        frame, draw_pose, digest = self._pending
+
+        def compute():
+            self.detector.findPose(frame, draw_pose)
+            return self.detector.findPosition(img, draw=draw, bboxWithHands=bboxWithHands)
+        return self.cache.memoize(digest + bytes([draw, bboxWithHands]), compute)
+
+    def __getattr__(self, name):
+        return getattr(self.detector, name)
+
+
+class CachedHandDetector:
+    """cvzone HandDetector with findHands results cached per image (or crop).
+
+    fingersUp() reads the detector's last MediaPipe results, which are stale
+    after a cache hit, so each hand carries its 'fingers' from the real run.
+    """
+
+    def __init__(self, detector, cache, **params):
+        self.detector = detector
+        self.cache = cache
+        self.namespace = detector_identity(detector, **params)
+
+    def findHands(self, img, draw=True, flipType=True):
+        key = frame_digest(img, self.namespace) + bytes([draw, flipType])
+        hands = self.cache.get(key, _MISS)
+        if hands is _MISS:
+            result = self.detector.findHands(img, draw=draw, flipType=flipType)
+            hands = result[0] if isinstance(result, tuple) else result
+            for hand in hands:
+                hand['fingers'] = self.detector.fingersUp(hand)
+            self.cache.put(key, hands)
+            return result
+        return (hands, img) if draw else hands
+
+    def fingersUp(self, hand):
+        return hand['fingers'] if 'fingers' in hand else self.detector.fingersUp(hand)
+
+    def __getattr__(self, name):
+        return getattr(self.detector, name)
+
+
+class CachedPerception:
+    """perception.PoseHandsPerception with its per-frame PoseHands cached."""
+
+    def __init__(self, perception, cache, **params):
+        self.perception = perception
+        self.cache = cache
+        self.namespace = detector_identity(perception, **params)
+
+    def __call__(self, frame):
+        return self.cache.memoize(frame_digest(frame, self.namespace), lambda: self.perception(frame))
+
+    def __getattr__(self, name):
+        return getattr(self.perception, name)
+
+
+class CachedSegmenter:
+    """planner.Segmenter with each frame's mask and path centroid cached together."""
+
+    def __init__(self, segmenter, cache, **params):
+        self.segmenter = segmenter
+        self.cache = cache
+        self.namespace = detector_identity(segmenter, **params)
+        self._mask = None
+
+    def _lookup(self, frame, compute):
+        result = self.cache.memoize(frame_digest(frame, self.namespace), compute)
+        self._mask = result['mask']
+        return result
+
+    def __call__(self, frame):
+        from mask_steering import path_centroid
+
+        def compute():
+            mask = self.segmenter(frame).copy()  # the engine reuses its output buffer
+            return {'mask': mask, 'path': path_centroid(mask)}
+        return self._lookup(frame, compute)['mask']
+
+    def steer(self, frame):
+        def compute():
+            path = self.segmenter.steer(frame)
+            return {'mask': self.segmenter.last_mask().copy(), 'path': path}
+        return self._lookup(frame, compute)['path']
+
+    def last_mask(self):
+        return self._mask
+
+    def __getattr__(self, name):
+        return getattr(self.segmenter, name)
+
+
+def static_image_mode(detector):
+    """``detector`` rebuilt with its static-image flag set, or as is if it has none (or it is already set).
+
+    The other constructor arguments are read back from the same-named
+    attributes, as cvzone and perception.PoseHandsPerception store them.
+    """
+    parameters = inspect.signature(type(detector)).parameters
+    flag = next((name for name in STATIC_FLAGS
+                 if name in parameters and isinstance(parameters[name].default, bool)), None)
+    if flag is None or getattr(detector, flag, False) is True:
+        return detector
+    settings = {name: getattr(detector, name) for name in parameters if hasattr(detector, name)}
+    settings[flag] = True
+    return type(detector)(**settings)
+
+
+_shared = {}
+
+
+def shared_cache():
+    """The process-wide DetectionCache named by FOLLOW_DETECTION_CACHE, or None."""
+    path = os.environ.get("FOLLOW_DETECTION_CACHE")
+    if not path:
+        return None
+    if path not in _shared:
+        max_bytes = int(os.environ.get("FOLLOW_DETECTION_CACHE_MB", DEFAULT_MAX_MB)) << 20
+        _shared[path] = DetectionCache(path, max_bytes)
+        print(f"[Cache] Detections cached in {path}")
+    return _shared[path]
+
+
+def cached(detector, cache=None, **params):
+    """`detector` behind the matching cache wrapper, or as is when there is no cache.
+
+    ``cache`` defaults to shared_cache(); ``params`` are extra identity
+    settings the detector does not keep as attributes. MediaPipe detectors
+    are switched to static-image mode (see static_image_mode()).
+    """
+    cache = cache if cache is not None else shared_cache()
+    if cache is None:
+        return detector
+    detector = static_image_mode(detector)
+    if hasattr(detector, 'findPose'):
+        return CachedPoseDetector(detector, cache, **params)
+    if hasattr(detector, 'findHands'):
+        return CachedHandDetector(detector, cache, **params)
+    if hasattr(detector, 'steer') and hasattr(detector, 'last_mask'):
+        return CachedSegmenter(detector, cache, **params)
+    if callable(detector):
+        return CachedPerception(detector, cache, **params)
+    raise TypeError(f"No cache wrapper for {type(detector).__name__}")
+
+
+class SlowPose:
+    """Stand-in PoseDetector costing about what MediaPipe does, for the benchmark.
+
+    Like MediaPipe's video mode it smooths the box with the previous call's
+    unless ``staticMode`` is set.
+    """
+
+    def __init__(self, work=12, detectionCon=0.5, staticMode=False):
+        self.work = work
+        self.detectionCon = detectionCon
+        self.staticMode = staticMode
+        self.results = None
+        self.last_bbox = None
+
+    def findPose(self, img, draw=True):
+        blurred = img
+        for _ in range(self.work):
+            blurred = cv2.GaussianBlur(blurred, (9, 9), 0)
+        self.results = np.argwhere(blurred[::8, ::8, 2] > 150)
+        return img
+
+    def findPosition(self, img, draw=True, bboxWithHands=False):
+        if not len(self.results):
+            return [], {}
+        (y0, x0), (y1, x1) = self.results.min(axis=0) * 8, self.results.max(axis=0) * 8
+        bbox = (int(x0), int(y0), int(x1 - x0), int(y1 - y0))
+        if not self.staticMode and self.last_bbox is not None:
+            bbox = tuple((a + b) // 2 for a, b in zip(bbox, self.last_bbox))
+            x0, y0, x1, y1 = bbox[0], bbox[1], bbox[0] + bbox[2], bbox[1] + bbox[3]
+        self.last_bbox = bbox
+        lmList = [[int(x0 + (x1 - x0) * (i % 3) / 2), int(y0 + (y1 - y0) * i / 33), 0] for i in range(33)]
+        return lmList, {'bbox': bbox, 'center': (bbox[0] + bbox[2] // 2, bbox[1] + bbox[3] // 2)}
+
+
+def bench(frames=300, work=12, size=(640, 360)):
+    """Cold vs warm run of a session through a cached stand-in detector, and LRU eviction."""
+    import tempfile
+
+    from frame_source import SyntheticSource
+
+    with SyntheticSource(*size, count=frames) as source:
+        recorded = [source.get().frame for _ in range(frames)]
+
+    def run(detector, frames_run=recorded):
+        started = time.perf_counter()
+        results = []
+        for frame in frames_run:
+            img = detector.findPose(frame.copy())
+            results.append(detector.findPosition(img, bboxWithHands=True))
+        return len(frames_run) / (time.perf_counter() - started), results
+
+    fps, expected = run(SlowPose(work, staticMode=True))  # what cached() turns the detector into
+    print(f"[Cache] {frames} frames {size[0]}x{size[1]}, stand-in detector {fps:.0f} fps uncached")
+    hash_started = time.perf_counter()
+    for frame in recorded:
+        frame_digest(frame)
+    hash_ms = (time.perf_counter() - hash_started) * 1000 / frames
+    with tempfile.TemporaryDirectory() as directory:
+        cache = DetectionCache(os.path.join(directory, "detections.db"))
+        cold, _ = run(cached(SlowPose(work), cache))
+        warm, results = run(cached(SlowPose(work), cache))
+        other, _ = run(cached(SlowPose(work, detectionCon=0.8), cache))  # different settings, separate entries
+        print(f"[Cache] cold {cold:.0f} fps, warm {warm:.0f} fps ({warm / fps:.0f}x), frame hash {hash_ms:.2f} ms, "
+              f"identical results: {results == expected}, detectionCon=0.8 cold {other:.0f} fps")
+        print(f"[Cache] {cache.report()}, {len(cache)} entries")
+        cache.close()
+
+        # Every other frame a hit: the skipped calls would change what a video-mode detector returns in between
+        mismatched = {}
+        for mode, wrap, reference in (("static-image", cached, expected),
+                                      ("video", CachedPoseDetector, run(SlowPose(work))[1])):
+            cache = DetectionCache(os.path.join(directory, f"{mode}.db"))
+            run(wrap(SlowPose(work), cache), recorded[::2])
+            _, partial = run(wrap(SlowPose(work), cache))
+            mismatched[mode] = sum(a != b for a, b in zip(partial, reference))
+            cache.close()
+        print(f"[Cache] half-warm cache, results differing from an uncached run: "
+              f"{mismatched['static-image']} in static-image mode, {mismatched['video']} if left in video mode")
+
+        cache = DetectionCache(os.path.join(directory, "small.db"), max_bytes=frames * 100)
+        run(cached(SlowPose(work), cache))
+        print(f"[Cache] bounded to {cache.max_bytes / 1e3:.0f} KB: {len(cache)} most recent entries kept, "
+              f"{cache.stats['evicted']} evicted, {cache.bytes / 1e3:.0f} KB stored")
+        cache.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the detection cache with a stand-in pose detector")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--work", type=int, default=12, help="blurs per frame in the stand-in detector")
+    args = parser.parse_args()
+    bench(args.frames, args.work)
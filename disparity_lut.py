@@ -0,0 +1,151 @@
+#Lookup-table disparity colouring and depth conversion for depth.py / depth2.py
+#Every possible disparity code (subpixel included) is mapped once to its metric
+#depth, so converting a frame is one table lookup into a preallocated buffer.
+#Colouring scales the codes to 8 bits in one saturating integer pass (the same
+#values as the original float multiply + uint8 cast, without the float64 frame)
+#and applies the colour map table into a reused buffer; a full code -> BGR table
+#measured slower than that, since every lookup moves three bytes per pixel.
+#The stereo views are composed into reused buffers as well
+#
+#Per-frame cost against the original float path, at 400p and 720p:
+#  python3 disparity_lut.py
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+
+class DisparityLUT:
+    """Disparity colouring into reused buffers and a precomputed disparity code -> depth (mm) table.
+
+    ``max_disparity`` is ``stereo.getMaxDisparity()`` (the largest code, 760 with
+    3 subpixel bits); ``focal_px`` and ``baseline_mm`` come from the calibration.
+    """
+
+    def __init__(self, max_disparity, focal_px=None, baseline_mm=None, subpixel_bits=3,
+                 colormap=cv2.COLORMAP_JET):
+        self.max_disparity = int(max_disparity)
+        self.scale = 255 / self.max_disparity
+        self.colormap = colormap
+        codes = np.arange(self.max_disparity + 1, dtype=np.float32)
+
+        self.depths = None
+        if focal_px is not None and baseline_mm is not None:
+            pixels = codes / (1 << subpixel_bits)  # subpixel codes carry fractional bits
+            with np.errstate(divide='ignore'):
+                depth = np.where(pixels > 0, focal_px * baseline_mm / pixels, 0)
+            self.depths = np.clip(depth, 0, 65535).astype(np.uint16)
+
+        self.gray_out = None
+        self.color_out = None
+        self.depth_out = None
+
+    def colorize(self, disparity: np.ndarray) -> np.ndarray:
+        """BGR view of a disparity frame, in a buffer reused across calls."""
+        if self.color_out is None or self.color_out.shape[:2] != disparity.shape:
+            self.gray_out = np.empty(disparity.shape, dtype=np.uint8)
+            self.color_out = np.empty(disparity.shape + (3,), dtype=np.uint8)
+        # Rounding x * scale - 0.499 is floor(x * scale) for every code, i.e. the original uint8 cast
+        cv2.convertScaleAbs(disparity, dst=self.gray_out, alpha=self.scale, beta=-0.499)
+        cv2.applyColorMap(self.gray_out, self.colormap, dst=self.color_out)
+        return self.color_out
+
+    def to_depth(self, disparity: np.ndarray) -> np.ndarray:
+        """Depth in mm (0 = invalid) of a disparity frame, in a buffer reused across calls."""
+        if self.depth_out is None or self.depth_out.shape != disparity.shape:
+            self.depth_out = np.empty(disparity.shape, dtype=np.uint16)
+        np.take(self.depths, disparity, out=self.depth_out, mode='clip')
+        return self.depth_out
+
+    def depth_at(self, disparity: np.ndarray, x, y) -> int:
+        """Depth in mm of one pixel, without converting the frame."""
+        return int(self.depths[min(int(disparity[y, x]), self.max_disparity)])
+
+
+def lut_from_device(device, stereo, width, height):
+    """Build the tables from the connected device's calibration for width x height rectified frames."""
+    import depthai as dai
+
+    calib = device.readCalibration()
+    intrinsics = calib.getCameraIntrinsics(dai.CameraBoardSocket.RIGHT, width, height)
+    baseline_mm = calib.getBaselineDistance() * 10  # reported in cm
+    return DisparityLUT(stereo.getMaxDisparity(), focal_px=intrinsics[0][0], baseline_mm=baseline_mm)
+
+
+class StereoView:
+    """Side-by-side or 50/50 overlay of the rectified pair, composed into reused buffers."""
+
+    def __init__(self):
+        self.side_by_side = None
+        self.overlay = None
+
+    def compose(self, left, right, side_by_side=True):
+        h, w = left.shape[:2]
+        if side_by_side:
+            if self.side_by_side is None or self.side_by_side.shape[:2] != (h, 2 * w):
+                self.side_by_side = np.empty((h, 2 * w) + left.shape[2:], dtype=left.dtype)
+            self.side_by_side[:, :w] = left
+            self.side_by_side[:, w:] = right
+            return self.side_by_side
+        if self.overlay is None or self.overlay.shape != left.shape:
+            self.overlay = np.empty_like(left)
+        cv2.addWeighted(left, 0.5, right, 0.5, 0, dst=self.overlay)
+        return self.overlay
+
+
+def legacy_view(disparity, left, right, multiplier):
+    """The original per-frame path from depth.py / depth2.py."""
+    disparity_visual = (disparity * multiplier).astype(np.uint8)
+    disparity_colored = cv2.applyColorMap(disparity_visual, cv2.COLORMAP_JET)
+    stereo_view = np.hstack((left, right))
+    return disparity_colored, stereo_view
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark LUT disparity colouring against the float path")
+    parser.add_argument("--frames", type=int, default=100)
+    args = parser.parse_args()
+
+    max_disparity = 95 * 8  # subpixel, 3 fractional bits
+    rng = np.random.default_rng(0)
+    for name, (w, h), focal in (("400p", (640, 400), 440.0), ("720p", (1280, 720), 800.0)):
+        # Smooth disparity with invalid holes, like a real subpixel stream
+        disparity = cv2.resize(rng.integers(0, max_disparity, size=(h // 16, w // 16)).astype(np.float32), (w, h))
+        disparity = disparity.astype(np.uint16)
+        disparity[rng.random((h, w)) < 0.05] = 0
+        left = rng.integers(0, 255, size=(h, w), dtype=np.uint8)
+        right = rng.integers(0, 255, size=(h, w), dtype=np.uint8)
+
+        lut = DisparityLUT(max_disparity, focal_px=focal, baseline_mm=75.0)
+        view = StereoView()
+        multiplier = 255 / max_disparity
+
+        started = time.perf_counter()
+        for _ in range(args.frames):
+            legacy_colored, legacy_stereo = legacy_view(disparity, left, right, multiplier)
+        legacy_ms = (time.perf_counter() - started) * 1000 / args.frames
+
+        started = time.perf_counter()
+        for _ in range(args.frames):
+            colored = lut.colorize(disparity)
+            stereo_view = view.compose(left, right)
+        lut_ms = (time.perf_counter() - started) * 1000 / args.frames
+
+        started = time.perf_counter()
+        for _ in range(args.frames):
+            pixels = disparity.astype(np.float32) / 8
+            with np.errstate(divide='ignore'):
+                float_depth = np.clip(np.where(pixels > 0, focal * 75.0 / pixels, 0), 0, 65535).astype(np.uint16)
+        float_depth_ms = (time.perf_counter() - started) * 1000 / args.frames
+
+        started = time.perf_counter()
+        for _ in range(args.frames):
+            depth = lut.to_depth(disparity)
+        lut_depth_ms = (time.perf_counter() - started) * 1000 / args.frames
+
+        assert np.array_equal(colored, legacy_colored) and np.array_equal(stereo_view, legacy_stereo)
+        print(f"[Disparity] {name}: view legacy {legacy_ms:.2f} ms, LUT {lut_ms:.2f} ms "
+              f"({legacy_ms / lut_ms:.1f}x) | depth float {float_depth_ms:.2f} ms, LUT {lut_depth_ms:.2f} ms "
+              f"({float_depth_ms / lut_depth_ms:.1f}x), max diff {int(np.abs(depth.astype(np.int32) - float_depth).max())} mm")
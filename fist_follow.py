@@ -2,115 +2,84 @@
 #When a fist is detected it will send a stop command
 #When it doesnt detect a fist it will continue following again
 
-import cv2
-import socket
-import depthai as dai
-import mediapipe as mp
-from cvzone.PoseModule import PoseDetector
+from command_sender import CommandSender
+from frame_source import DepthAISource
+from startup import warm_up
+from tracing import span
+from follower_runtime import COLOR_GREEN, person_box, run_follower
 
 # TCP Connection Setup
 ROBOT_IP = "100.87.161.11"
 PORT = 9999
-client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-client_socket.connect((ROBOT_IP, PORT))
-print("[Follower] Connected to robot.")
-
-# Initialize pose detector
-pose_detector = PoseDetector()
-
-# MediaPipe hands setup
-mp_hands = mp.solutions.hands
-hands = mp_hands.Hands(static_image_mode=False,
-                       max_num_hands=2,
-                       min_detection_confidence=0.5,
-                       min_tracking_confidence=0.5)
-
-# Helper: check if hand is a fist
-def is_fist(landmarks):
-    tips = [8, 12, 16, 20]
-    pips = [6, 10, 14, 18]
-    return all(landmarks[tip].y > landmarks[pip].y for tip, pip in zip(tips, pips))
-
-# Create pipeline and camera
-pipeline = dai.Pipeline()
-cam = pipeline.createColorCamera()
-cam.setPreviewSize(1280, 720)
-cam.setInterleaved(False)
-cam.setBoardSocket(dai.CameraBoardSocket.CAM_A)
-xout = pipeline.createXLinkOut()
-xout.setStreamName("video")
-cam.preview.link(xout.input)
 
 # Frame and movement setup
-frame_width = 1280
-frame_center = frame_width // 2
-center_tolerance = frame_width // 10
-
-with dai.Device(pipeline) as device:
-    video_queue = device.getOutputQueue(name="video", maxSize=4, blocking=False)
-
-    try:
-        while True:
-            in_frame = video_queue.get()
-            frame = in_frame.getCvFrame()
-
-            # Pose detection
-            img = pose_detector.findPose(frame)
-            lmList, bboxInfo = pose_detector.findPosition(img, bboxWithHands=True)
-
-            # Hand detection for fist
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = hands.process(rgb_frame)
-
-            fist_detected = False
-            if results.multi_hand_landmarks:
-                for hand_landmarks in results.multi_hand_landmarks:
-                    if is_fist(hand_landmarks.landmark):
-                        fist_detected = True
-                    # Draw hand bounding box for visualization
-                    h, w, _ = frame.shape
-                    x_vals = [int(lm.x * w) for lm in hand_landmarks.landmark]
-                    y_vals = [int(lm.y * h) for lm in hand_landmarks.landmark]
-                    x1, y1 = min(x_vals), min(y_vals)
-                    x2, y2 = max(x_vals), max(y_vals)
-                    cv2.rectangle(img, (x1, y1), (x2, y2), (255, 0, 255), 2)
-
-            if fist_detected:
-                command = 'x'  # STOP completely
-            elif bboxInfo is not None and 'bbox' in bboxInfo:
-                x, y, w, h = bboxInfo['bbox']
-                cx = x + w // 2
-                offset = cx - frame_center
-
-                # Draw bounding box and center dot
-                cv2.rectangle(img, (x, y), (x + w, y + h), (0, 255, 0), 3)
-                cv2.circle(img, (cx, y + h // 2), 5, (0, 0, 255), cv2.FILLED)
-
-                # Movement based on center offset
-                if abs(offset) < center_tolerance:
-                    command = 'w'  # forward
-                elif offset < 0:
-                    command = 'a'  # turn left
-                else:
-                    command = 'd'  # turn right
-            else:
-                command = 'x'  # no person detected, stop
-
-            try:
-                client_socket.sendall(command.encode())
-                print(f"[Follower] Sent command: {command}")
-            except Exception as e:
-                print(f"[Follower][TCP ERROR]: {e}")
-                break
-
-            # Show annotated frame
-            cv2.imshow("Follower View", img)
-
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                client_socket.sendall('x'.encode())
-                break
-
-    finally:
-        client_socket.close()
-        cv2.destroyAllWindows()
-        print("[Follower] Shutdown complete.")
\ No newline at end of file
+frame_width = 1280   # camera preview (field of view) the thresholds were tuned on
+frame_height = 720
+INFER_SIZE = (640, 360)   # detector input, scaled on the camera (see frame_source.py)
+DISPLAY_SIZE = None       # e.g. (1280, 720) for a separate, sharper display stream
+DISPLAY_EVERY = 2         # display stream carries every Nth camera frame
+LATENCY_BUDGET = 0.15
+SHED_ORDER = ("draw", "resolution")  # no "hands": holistic mode finds the fist in the pose pass
+PROTOCOL = "legacy"       # or "binary": velocity messages with proportional steering (velocity_protocol.py)
+TRANSPORT = "tcp"         # or "udp": one datagram per message, binary protocol only (command_sender.py)
+
+# Thresholds are fractions of the frame, so they hold at any resolution
+center_tolerance = 0.1
+
+# Perception (see perception.py): "holistic" finds the pose and both hands in one
+# MediaPipe pass; "shared" runs Pose and Hands separately on one shared RGB frame
+PERCEPTION_MODE = "holistic"
+
+
+def build_detect(state):
+    """Create the combined pose + hands perception and return detect(frame) -> (img, detection)."""
+    from detection_cache import cached
+    from perception import PoseHandsPerception
+
+    # One BGR->RGB conversion per frame, shared by pose and hand landmarks (up to 2 hands)
+    perception = PoseHandsPerception(mode=PERCEPTION_MODE, max_hands=2)
+    perception = cached(warm_up(perception, INFER_SIZE))
+
+    def detect(frame):
+        # Pose and hand landmarks; fist = every fingertip below its middle joint, on any hand
+        with span("perception"):
+            result = perception(frame)
+
+        # Draw the pose skeleton and hand bounding boxes for visualization
+        img = perception.draw(frame, result)
+
+        return img, {'lmList': result.lmList, 'bboxInfo': result.bboxInfo, 'fist': bool(result.fists.any()),
+                     'frame_size': (frame.shape[1], frame.shape[0])}
+    return detect
+
+
+def decide(detection, state):
+    """Return (command, box_color) for one detection."""
+    if detection['fist']:
+        return 'x', None  # STOP completely
+
+    box = person_box(detection, (frame_width, frame_height))
+    if box is None:
+        return 'x', None  # no person detected, stop
+
+    offset, w, h = box
+
+    # Movement based on center offset
+    if abs(offset) < center_tolerance:
+        command = 'w'  # forward
+    elif offset < 0:
+        command = 'a'  # turn left
+    else:
+        command = 'd'  # turn right
+    return command, COLOR_GREEN
+
+
+def main():
+    sender = CommandSender(ROBOT_IP, PORT, protocol=PROTOCOL, transport=TRANSPORT).start()
+    camera = DepthAISource(frame_width, frame_height, infer_size=INFER_SIZE, display_size=DISPLAY_SIZE,
+                           display_every=DISPLAY_EVERY)
+    run_follower(sender, camera, build_detect, decide, {}, LATENCY_BUDGET, SHED_ORDER)
+
+
+if __name__ == "__main__":
+    main()
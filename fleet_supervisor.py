@@ -0,0 +1,397 @@
+#Fleet supervisor: several (camera, robot, follower mode) pipelines from one entry point
+#Each pipeline runs a follower script's build_detect/decide in FollowerRuntime
+#inside its own worker process, pinned to its own cores with OpenCV / torch
+#thread pools sized to match, so the followers stop fighting over cores. The
+#workers are forked from a forkserver that has already imported the shared
+#modules (and the detectors' libraries), so each one starts without
+#re-importing them. Workers report metrics over a queue. The supervisor
+#restarts a worker that dies or stops reporting, and aggregates everything
+#into one report
+#
+#The fleet is a JSON file; "shared" holds defaults for every robot, and each
+#"config" overrides the follower module's constants (LATENCY_BUDGET, ...):
+#  {"shared": {"protocol": "binary", "config": {"LATENCY_BUDGET": 0.12}},
+#   "robots": [{"name": "amiga-1", "mode": "center_follow",
+#               "source": "depthai:18443010D1A1F50F00", "robot": "100.87.161.11:9999"}]}
+#  python3 fleet_supervisor.py fleet.json
+#
+#Throughput scaling with synthetic cameras against sim_controller.py:
+#  python3 fleet_supervisor.py --bench 4
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+
+import cv2
+import numpy as np
+
+SHARED_MODULES = ("cv2", "numpy", "command_sender", "follower_runtime", "frame_source", "frame_scheduler")
+MODEL_MODULES = {  # detector libraries worth importing once in the forkserver
+    'planner': ("torch", "onnxruntime"),
+    None: ("mediapipe", "cvzone.PoseModule", "cvzone.HandTrackingModule"),
+}
+ROBOT_DEFAULTS = {'source': "depthai", 'protocol': "legacy", 'transport': "tcp", 'detector': "model",
+                  'fps': None, 'cores': None, 'verbose': False, 'record': None, 'config': {}}
+PERSON_COLOR = (60, 120, 200)  # SyntheticSource draws the person in this BGR colour
+
+
+def load_fleet(path):
+    """Robot specs from a fleet JSON file, with the shared defaults and config merged in."""
+    with open(path) as f:
+        fleet = json.load(f)
+    return merge_specs(fleet.get('robots', []), fleet.get('shared', {}))
+
+
+def merge_specs(robots, shared):
+    specs = []
+    for i, robot in enumerate(robots):
+        spec = dict(ROBOT_DEFAULTS, **{key: value for key, value in shared.items() if key != 'config'})
+        spec.update({key: value for key, value in robot.items() if key != 'config'})
+        spec['config'] = dict(shared.get('config', {}), **robot.get('config', {}))
+        spec.setdefault('name', f"robot{i}")
+        for key in ('mode', 'robot'):
+            if key not in spec:
+                raise ValueError(f"{spec['name']}: missing '{key}'")
+        if spec['detector'] == "synthetic" and spec['mode'] == "planner":
+            raise ValueError(f"{spec['name']}: the synthetic detector only finds people; run planner with the model")
+        specs.append(spec)
+    return specs
+
+
+def allocate_cores(specs, available=None):
+    """Explicit 'cores' where given; the remaining cores split evenly (round-robin once there are more workers)."""
+    if available is None:
+        available = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else \
+            list(range(os.cpu_count() or 1))
+    taken = {core for spec in specs if spec.get('cores') for core in spec['cores']}
+    free = [core for core in available if core not in taken] or available
+    automatic = [spec for spec in specs if not spec.get('cores')]
+    per_worker = max(1, len(free) // max(1, len(automatic)))
+    allocation = {}
+    for i, spec in enumerate(automatic):
+        start = (i * per_worker) % len(free)
+        allocation[spec['name']] = [free[(start + j) % len(free)] for j in range(per_worker)]
+    for spec in specs:
+        if spec.get('cores'):
+            allocation[spec['name']] = list(spec['cores'])
+    return allocation
+
+
+def synthetic_detect(work=0):
+    """detect(frame[, depth]) finding SyntheticSource's person box by colour, for runs without the models.
+
+    ``work`` extra 5x5 blurs of the frame stand in for a heavier model's per-frame cost.
+    """
+    lower = np.array([c - 10 for c in PERSON_COLOR], dtype=np.uint8)
+    upper = np.array([c + 10 for c in PERSON_COLOR], dtype=np.uint8)
+
+    def detect(frame, depth=None):
+        image = frame
+        for _ in range(work):
+            image = cv2.GaussianBlur(image, (5, 5), 0)
+        points = cv2.findNonZero(cv2.inRange(frame, lower, upper))
+        bboxInfo = None
+        if points is not None:
+            x, y, w, h = cv2.boundingRect(points)
+            bboxInfo = {'bbox': (x, y, w, h), 'center': (x + w // 2, y + h // 2)}
+        return frame, {'lmList': [], 'bboxInfo': bboxInfo, 'hands': [], 'fist': False,
+                       'frame_size': (frame.shape[1], frame.shape[0])}
+    return detect
+
+
+def pin_worker(cores):
+    """Pin this process to `cores` and size the OpenCV / torch thread pools to them."""
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    cv2.setNumThreads(len(cores))
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(len(cores))
+
+
+def run_worker(spec, cores, metrics, stop, interval=1.0):
+    """Worker process body: one follower pipeline, reporting metrics every `interval` seconds."""
+    pin_worker(cores)
+    from command_sender import CommandSender
+    from frame_scheduler import DEGRADE_ORDER, DeadlineScheduler
+    from frame_source import open_source
+    from follower_runtime import FollowerRuntime, bbox_velocity
+    from session_recorder import SessionRecorder
+
+    module = importlib.import_module(spec['mode'])
+    for key, value in spec['config'].items():
+        setattr(module, key, value)
+    if getattr(module, 'INFERENCE_THREADS', 0) is None:
+        module.INFERENCE_THREADS = len(cores)
+
+    scheduler = DeadlineScheduler(getattr(module, 'LATENCY_BUDGET', 0.15),
+                                  order=getattr(module, 'SHED_ORDER', DEGRADE_ORDER))
+    state = {'stopped': False, 'scheduler': scheduler}
+    with_depth = getattr(module, 'USES_DEPTH', False) or getattr(module, 'USE_OCCUPANCY', False)
+    if spec['detector'] == "synthetic":
+        detect = synthetic_detect(spec['config'].get('SYNTHETIC_WORK', 0))
+    else:
+        detect = module.build_detect(state)
+
+    host, port = spec['robot'].rsplit(":", 1)
+    sender = CommandSender(host, int(port), name=spec['name'], protocol=spec['protocol'],
+                           transport=spec['transport'], verbose=spec['verbose']).start()
+    send = sender.send
+    if getattr(module, 'USE_OCCUPANCY', False):
+        from occupancy_grid import OccupancyGrid
+        grid = state['grid'] = OccupancyGrid()
+
+        def send(command, velocity=None):
+            grid.drive(command, velocity)
+            sender.send(command, velocity)
+
+    velocity = None
+    if spec['protocol'] == "binary":
+        velocity = (lambda detection, command, frame_size: module.path_velocity(detection, command)) \
+            if spec['mode'] == "planner" else bbox_velocity
+
+    size = (module.frame_width, module.frame_height)
+    infer_size = getattr(module, 'INFER_SIZE', None)
+    if spec['source'].startswith("depthai"):
+        options = {'infer_size': infer_size, 'depth': with_depth}
+    else:
+        size = infer_size or size  # what the camera would hand the detector
+        if spec['source'].startswith("synthetic"):
+            options = {'depth': with_depth, 'fps': spec['fps']}
+        else:
+            options = {'realtime': bool(spec['fps'])}  # play a recording at its own frame rate
+    print(f"[Fleet] {spec['name']}: {spec['mode']} on {spec['source']} -> {spec['robot']}, "
+          f"pid {os.getpid()}, cores {cores}")
+
+    os.environ.pop("FOLLOW_RECORD", None)  # one file per robot, from its own "record"
+    recorder = SessionRecorder(spec['record']).start() if spec['record'] else None
+
+    with open_source(spec['source'], *size, **options) as source:
+        if 'grid' in state and spec['source'].startswith("depthai"):
+            from occupancy_grid import intrinsics_from_device
+            state['grid'].intrinsics = intrinsics_from_device(source.device, infer_size)
+        runtime = FollowerRuntime(source, detect=detect, decide=lambda detection: module.decide(detection, state),
+                                  send=send, show=False, with_depth=with_depth, scheduler=state['scheduler'],
+                                  velocity=velocity, recorder=recorder)
+        runtime.start()
+        try:
+            while runtime.running.is_set() and not stop.is_set():
+                stop.wait(interval)
+                metrics.put(worker_metrics(spec['name'], cores, runtime, sender, state))
+        finally:
+            runtime.stop()
+            sender.close()
+            metrics.put(dict(worker_metrics(spec['name'], cores, runtime, sender, state), final=True))
+    if runtime.error is not None:
+        raise SystemExit(1)
+
+
+def worker_metrics(name, cores, runtime, sender, state):
+    deadline = state['scheduler'].report()
+    return {'name': name, 'pid': os.getpid(), 'cores': cores, 'time': time.monotonic(),
+            'frames': runtime.counters['decide'].count,
+            'fps': round(runtime.counters['decide'].rate(), 1),
+            'stale_frames': runtime.stale_frames,
+            'latency_ms': deadline.get('latency_ms'), 'shed': deadline['level'],
+            'connected': sender.connected, 'commands': dict(sender.stats),
+            'error': None if runtime.error is None else str(runtime.error)}
+
+
+class FleetSupervisor:
+    """Starts one worker process per robot spec, watches their health and aggregates their metrics.
+
+    A worker that exits with an error, or sends no metrics for ``health_timeout``
+    seconds, is restarted with exponential backoff, up to ``max_restarts`` times.
+    """
+
+    def __init__(self, specs, health_timeout=10.0, max_restarts=3, interval=1.0, start_method="forkserver"):
+        self.specs = {spec['name']: spec for spec in specs}
+        if len(self.specs) != len(specs):
+            raise ValueError("Robot names must be unique")
+        self.health_timeout = health_timeout
+        self.max_restarts = max_restarts
+        self.interval = interval
+        if start_method not in multiprocessing.get_all_start_methods():
+            start_method = "spawn"
+        self.ctx = multiprocessing.get_context(start_method)
+        if start_method == "forkserver":
+            modes = {spec['mode'] for spec in specs}
+            preload = list(SHARED_MODULES) + sorted(modes)
+            if any(spec['detector'] == "model" for spec in specs):
+                for mode in modes:
+                    preload += MODEL_MODULES.get(mode, MODEL_MODULES[None])
+            self.ctx.set_forkserver_preload(preload)  # modules that fail to import are skipped
+        self.cores = allocate_cores(specs)
+        self.metrics = self.ctx.Queue()
+        self.stop_event = self.ctx.Event()
+        self.workers = {}
+        self.latest = {}
+        self.restarts = dict.fromkeys(self.specs, 0)
+        self.retry_at = {}
+        self.finished = set()
+        self.failed = set()
+        self.started = None
+
+    def _spawn(self, name):
+        process = self.ctx.Process(target=run_worker, name=f"fleet-{name}",
+                                   args=(self.specs[name], self.cores[name], self.metrics, self.stop_event,
+                                         self.interval), daemon=True)
+        process.start()
+        self.workers[name] = (process, time.monotonic())
+
+    def start(self):
+        self.started = time.monotonic()
+        for name in self.specs:
+            self._spawn(name)
+        return self
+
+    def poll(self, timeout=0.5):
+        """Collect metrics for up to `timeout` seconds, then check every worker's health."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                message = self.metrics.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            message['received'] = time.monotonic()
+            self.latest[message['name']] = message
+        now = time.monotonic()
+        for name, (process, spawned) in list(self.workers.items()):
+            last = self.latest.get(name, {}).get('received', spawned)
+            if process.is_alive():
+                if now - last > self.health_timeout and now - spawned > self.health_timeout:
+                    print(f"[Fleet] {name}: no metrics for {now - last:.1f} s, restarting")
+                    process.terminate()
+                    process.join(2.0)
+                    self._retry(name, now)
+                continue
+            del self.workers[name]
+            if process.exitcode == 0:
+                self.finished.add(name)  # stopped, or its source ran out (e.g. a recording)
+                if not self.stop_event.is_set():
+                    print(f"[Fleet] {name}: finished")
+            else:
+                print(f"[Fleet] {name}: exited with code {process.exitcode}")
+                self._retry(name, now)
+        for name, at in list(self.retry_at.items()):
+            if now >= at and not self.stop_event.is_set():
+                del self.retry_at[name]
+                self._spawn(name)
+
+    def _retry(self, name, now):
+        if self.restarts[name] >= self.max_restarts:
+            self.failed.add(name)
+            print(f"[Fleet] {name}: giving up after {self.restarts[name]} restarts")
+            return
+        self.restarts[name] += 1
+        self.retry_at[name] = now + min(2.0 ** self.restarts[name], 30.0)
+
+    @property
+    def active(self):
+        return bool(self.workers or self.retry_at)
+
+    def run(self, duration=None, report_every=5.0):
+        """Supervise until every worker has finished or failed, `duration` passes, or Ctrl+C."""
+        next_report = time.monotonic() + report_every
+        try:
+            while self.active and (duration is None or time.monotonic() - self.started < duration):
+                self.poll()
+                if report_every and time.monotonic() >= next_report:
+                    next_report += report_every
+                    print(self.summary())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        deadline = time.monotonic() + timeout
+        while self.workers and time.monotonic() < deadline:
+            self.poll(0.2)  # drains the final metrics while workers shut down
+        for process, _ in self.workers.values():
+            process.terminate()
+        self.retry_at.clear()
+
+    def report(self):
+        workers = {name: {key: message[key] for key in ('pid', 'cores', 'frames', 'fps', 'latency_ms', 'shed',
+                                                         'connected', 'error')}
+                   for name, message in sorted(self.latest.items())}
+        return {'workers': len(self.specs), 'running': len(self.workers), 'finished': len(self.finished),
+                'failed': len(self.failed), 'restarts': sum(self.restarts.values()),
+                'frames': sum(message['frames'] for message in self.latest.values()),
+                'fps': round(sum(message['fps'] for message in self.latest.values() if not message.get('final')), 1),
+                'per_worker': workers}
+
+    def summary(self):
+        report = self.report()
+        lines = [f"[Fleet] {report['running']}/{report['workers']} running, {report['restarts']} restarts, "
+                 f"{report['frames']} frames, {report['fps']} fps total"]
+        for name, worker in report['per_worker'].items():
+            latency = worker['latency_ms'] or {}
+            lines.append(f"[Fleet]   {name:12s} pid {worker['pid']:6d} cores {worker['cores']} "
+                         f"{worker['fps']:6.1f} fps, p95 {latency.get('p95', '-')} ms, shed {worker['shed']}, "
+                         f"{'connected' if worker['connected'] else 'not connected'}"
+                         f"{', error ' + worker['error'] if worker['error'] else ''}")
+        return "\n".join(lines)
+
+
+def bench(max_workers, seconds, work):
+    """Total throughput of 1..max_workers synthetic pipelines against a local simulated controller."""
+    from sim_controller import SimController
+
+    with SimController(port=0) as controller:
+        base = None
+        for workers in range(1, max_workers + 1):
+            robots = [{'name': f"sim{i}", 'mode': "follow", 'source': "synthetic:1000000",
+                       'robot': f"127.0.0.1:{controller.port}", 'detector': "synthetic"} for i in range(workers)]
+            supervisor = FleetSupervisor(merge_specs(robots, {'config': {'SYNTHETIC_WORK': work}}))
+            supervisor.start()
+            time.sleep(1.0)  # startup; measured from here
+            frames = {}
+            supervisor.poll()
+            start_frames = {name: message['frames'] for name, message in supervisor.latest.items()}
+            started = time.monotonic()
+            while time.monotonic() - started < seconds:
+                supervisor.poll()
+            for name, message in supervisor.latest.items():
+                frames[name] = message['frames'] - start_frames.get(name, 0)
+            elapsed = time.monotonic() - started
+            supervisor.stop()
+            fps = sum(frames.values()) / elapsed
+            base = base or fps
+            print(f"[Fleet] {workers} workers: {fps:7.1f} fps total ({fps / base:.2f}x, "
+                  f"{fps / base / workers * 100:.0f}% of linear) on cores {sorted(set(sum(supervisor.cores.values(), [])))}")
+        print(f"[Fleet] Controller: {controller.report()['per_second']} commands/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run several follower pipelines, one pinned worker process each")
+    parser.add_argument("fleet", nargs="?", help="fleet JSON file")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    parser.add_argument("--health-timeout", type=float, default=10.0)
+    parser.add_argument("--max-restarts", type=int, default=3)
+    parser.add_argument("--report-every", type=float, default=5.0)
+    parser.add_argument("--json", help="write the final aggregated report to this file")
+    parser.add_argument("--bench", type=int, default=0, help="scaling benchmark with up to this many workers")
+    parser.add_argument("--seconds", type=float, default=5.0, help="--bench: measuring time per step")
+    parser.add_argument("--work", type=int, default=8, help="--bench: extra blurs per frame (detector cost)")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.bench, args.seconds, args.work)
+    elif args.fleet:
+        supervisor = FleetSupervisor(load_fleet(args.fleet), health_timeout=args.health_timeout,
+                                     max_restarts=args.max_restarts).start()
+        supervisor.run(args.duration, args.report_every)
+        print(supervisor.summary())
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(supervisor.report(), f, indent=2)
+            print(f"[Fleet] Wrote {args.json}")
+    else:
+        parser.error("give a fleet JSON file or --bench N")
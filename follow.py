@@ -4,85 +4,72 @@
 ##########################################
 
 
-import cv2
-import socket
-import depthai as dai
-from cvzone.PoseModule import PoseDetector
+from command_sender import CommandSender
+from frame_source import DepthAISource
+from pose_tracker import PoseTracker
+from startup import warm_up
+from tracing import span
+from follower_runtime import COLOR_GREEN, person_box, run_follower
 
 # TCP Settings
 CONTROLLER_IP = "100.87.161.11"
 CONTROLLER_PORT = 9999
 
-# Setup socket connection
-client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-client_socket.connect((CONTROLLER_IP, CONTROLLER_PORT))
-print(f"[Follower] Connected to controller at {CONTROLLER_IP}:{CONTROLLER_PORT}")
-
-# Setup DepthAI pipeline for color camera
-pipeline = dai.Pipeline()
-cam_rgb = pipeline.createColorCamera()
-cam_rgb.setPreviewSize(640, 480)
-cam_rgb.setInterleaved(False)
-cam_rgb.setBoardSocket(dai.CameraBoardSocket.RGB)
-
-xout = pipeline.createXLinkOut()
-xout.setStreamName("video")
-cam_rgb.preview.link(xout.input)
-
-# Create pose detector
-detector = PoseDetector()
-
-# Connect to DepthAI device and start streaming
-with dai.Device(pipeline) as device:
-    video_queue = device.getOutputQueue(name="video", maxSize=4, blocking=False)
-    
-    # Frame width for center calculations
-    frame_width = 640
-    frame_center = frame_width // 2
-    center_tolerance = frame_width // 10  # Tolerance around center
-
-    try:
-        while True:
-            in_frame = video_queue.get()
-            frame = in_frame.getCvFrame()
-
-            # Use pose detector on the frame
-            img = detector.findPose(frame)
-            lmList, bboxInfo = detector.findPosition(img, bboxWithHands=True)
-
-            if bboxInfo is not None and 'bbox' in bboxInfo:
-                x, y, w, h = bboxInfo['bbox']
-                cx = x + w // 2  # center x of bbox
-
-                # Draw bounding box and center point
-                cv2.rectangle(img, (x, y), (x + w, y + h), (0, 255, 0), 3)
-                cv2.circle(img, (cx, y + h // 2), 5, (0, 0, 255), cv2.FILLED)
-
-                # Decide command based on horizontal position of bbox center
-                offset = cx - frame_center
-                if abs(offset) < center_tolerance:
-                    command = 'w'  # Forward
-                elif offset < 0:
-                    command = 'a'  # Turn left
-                else:
-                    command = 'd'  # Turn right
-            else:
-                command = 'x'  # No person detected, stop
-
-            # Send the command as a single char over TCP
-            try:
-                client_socket.sendall(command.encode())
-                print(f"[Follower] Sent command: {command}")
-            except Exception as e:
-                print(f"[Follower][TCP ERROR]: {e}")
-
-            cv2.imshow("Follower View", img)
-
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                # Send stop command before exiting
-                client_socket.sendall('x'.encode())
-                break
-    finally:
-        client_socket.close()
-        cv2.destroyAllWindows()
-        print("[Follower] Shutdown complete.")
\ No newline at end of file
+# Camera preview and detector input size
+frame_width = 640
+frame_height = 480
+INFER_SIZE = (320, 240)   # detector input, scaled on the camera (see frame_source.py)
+DISPLAY_SIZE = None       # e.g. (640, 480) for a separate, sharper display stream
+DISPLAY_EVERY = 2         # display stream carries every Nth camera frame
+POSE_MAX_INTERVAL = 6     # findPose at least every Nth frame, bbox tracked in between (pose_tracker.py)
+LATENCY_BUDGET = 0.15
+SHED_ORDER = ("draw", "resolution")  # no hand detection to shed
+PROTOCOL = "legacy"       # or "binary": velocity messages with proportional steering (velocity_protocol.py)
+TRANSPORT = "tcp"         # or "udp": one datagram per message, binary protocol only (command_sender.py)
+
+center_tolerance = 0.1  # Tolerance around center, as a fraction of frame width
+
+
+def build_detect(state):
+    """Create the pose detector and return detect(frame) -> (img, detection)."""
+    from cvzone.PoseModule import PoseDetector
+    from detection_cache import cached
+    detector = cached(warm_up(PoseDetector(), INFER_SIZE))
+    find_pose = state['pose_tracker'] = PoseTracker(detector, max_interval=POSE_MAX_INTERVAL)
+
+    def detect(frame):
+        # Use pose detector on the frame
+        with span("findPose"):
+            img, lmList, bboxInfo = find_pose(frame)
+        return img, {'lmList': lmList, 'bboxInfo': bboxInfo, 'frame_size': (frame.shape[1], frame.shape[0])}
+    return detect
+
+
+def decide(detection, state):
+    """Return (command, box_color) for one detection."""
+    box = person_box(detection, (frame_width, frame_height))
+    if box is None:
+        return 'x', None  # No person detected, stop
+
+    # Decide command based on horizontal position of bbox center
+    offset, w, h = box
+    if abs(offset) < center_tolerance:
+        command = 'w'  # Forward
+    elif offset < 0:
+        command = 'a'  # Turn left
+    else:
+        command = 'd'  # Turn right
+    return command, COLOR_GREEN
+
+
+def main():
+    sender = CommandSender(CONTROLLER_IP, CONTROLLER_PORT, protocol=PROTOCOL, transport=TRANSPORT).start()
+    camera = DepthAISource(frame_width, frame_height, infer_size=INFER_SIZE, display_size=DISPLAY_SIZE,
+                           display_every=DISPLAY_EVERY)
+    state = {}
+    run_follower(sender, camera, build_detect, decide, state, LATENCY_BUDGET, SHED_ORDER,
+                 reports=lambda video_queue: {"Pose tracking": state['pose_tracker'].report()})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+#Shared threaded runtime for the follower scripts
+#Capture, detection, decision+send and display each run on their own thread
+#Stages hand work to each other through LatestSlot, so a slow stage only
+#drops stale frames instead of slowing every other stage down
+#Capture always takes the newest queued frame, and an optional DeadlineScheduler
+#sheds work when frames reach the command stage too late (frame_scheduler.py)
+#An optional velocity() turns each decision into a proportional (linear, angular)
+#for the binary command protocol (velocity_protocol.py)
+#With FOLLOW_RECORD=run.session (or a recorder) every frame, detection and sent
+#command is also recorded from a background thread (session_recorder.py)
+#run_follower() is the whole main() of a follower script: parallel startup,
+#the runtime, the final stop command and the shutdown report
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+import cv2
+
+from frame_scheduler import DEGRADE_ORDER, DeadlineScheduler, latest_frame
+from session_recorder import recorder_from_env
+from startup import Startup
+from tracing import tracer
+from velocity_protocol import proportional
+
+# Colors (BGR)
+COLOR_GREEN = (0, 255, 0)
+COLOR_PURPLE = (255, 0, 255)
+COLOR_RED = (0, 0, 255)
+
+
+class LatestSlot:
+    """Single-item handoff where a new put replaces an item nobody has taken yet."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._has_item = False
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._has_item:
+                self.dropped += 1
+            self._item = item
+            self._has_item = True
+            self._cond.notify()
+
+    def get(self, timeout: Optional[float] = None):
+        """Return the newest item, or None on timeout or once the slot is closed."""
+        with self._cond:
+            if not self._has_item and not self._closed:
+                self._cond.wait(timeout)
+            if not self._has_item:
+                return None
+            item = self._item
+            self._item = None
+            self._has_item = False
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+@dataclass
+class FramePacket:
+    """One camera frame and everything the later stages attach to it."""
+    seq: int
+    timestamp: float
+    frame: Any
+    img: Any = None
+    detection: Any = None
+    command: Optional[str] = None
+    box_color: Optional[tuple] = None
+    depth: Any = None
+
+
+class StageCounter:
+    """Counts items through a stage so the runtime can report its rate."""
+
+    def __init__(self):
+        self.count = 0
+        self.started = time.perf_counter()
+
+    def tick(self):
+        self.count += 1
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+
+def person_box(detection, frame_size):
+    """Person bbox in fractions of the frame: (center offset from mid-frame, width, height).
+
+    ``frame_size`` is the (width, height) the detection was made at, unless the
+    detection carries its own ``frame_size``. Returns None if nobody was detected.
+    """
+    bboxInfo = detection.get('bboxInfo')
+    if bboxInfo is None or 'bbox' not in bboxInfo:
+        return None
+    fw, fh = detection.get('frame_size') or frame_size
+    x, y, w, h = bboxInfo['bbox']
+    return (x + w // 2 - fw / 2) / fw, w / fw, h / fh
+
+
+def bbox_velocity(detection, command, frame_size):
+    """Proportional (linear, angular) for `command` from the person's offset; None without a person."""
+    box = person_box(detection, frame_size) if detection else None
+    if box is None:
+        return None
+    return proportional(command, box[0])
+
+
+def scale_detection(detection, sx, sy):
+    """Shallow copy of a detection with the person bbox mapped onto a frame sx, sy times the size."""
+    bboxInfo = detection.get('bboxInfo') if detection else None
+    if bboxInfo is None or 'bbox' not in bboxInfo:
+        return detection
+    x, y, w, h = bboxInfo['bbox']
+    scaled = dict(detection)
+    scaled['bboxInfo'] = dict(bboxInfo, bbox=(int(x * sx), int(y * sy), int(w * sx), int(h * sy)))
+    return scaled
+
+
+def draw_target(img, bbox, color, radius=6):
+    """Draw the person bounding box and its center dot."""
+    x, y, w, h = bbox
+    cx = x + w // 2
+    cv2.rectangle(img, (x, y), (x + w, y + h), color, thickness=3)
+    cv2.circle(img, (cx, y + h // 2), radius, (0, 0, 255), cv2.FILLED)
+
+
+def draw_decision(img, detection, box_color):
+    """Default display annotation: bbox and center dot in the decision color."""
+    if box_color is None or not detection:
+        return
+    bboxInfo = detection.get('bboxInfo')
+    if bboxInfo is not None and 'bbox' in bboxInfo:
+        draw_target(img, bboxInfo['bbox'], box_color)
+
+
+def read_packet(in_frame, seq: int) -> FramePacket:
+    """Wrap a DepthAI ImgFrame (or anything with getCvFrame) in a FramePacket."""
+    if hasattr(in_frame, 'getSequenceNum'):
+        seq = in_frame.getSequenceNum()
+    timestamp = time.monotonic()
+    if hasattr(in_frame, 'getTimestamp'):
+        timestamp = in_frame.getTimestamp().total_seconds()
+    return FramePacket(seq=seq, timestamp=timestamp, frame=in_frame.getCvFrame(),
+                       depth=getattr(in_frame, 'depth', None))
+
+
+class FollowerRuntime:
+    """Runs capture, detection, decision+send and display as separate stages.
+
+    ``detect(frame)`` returns ``(img, detection)``, ``decide(detection)`` returns
+    ``(command, box_color)`` and ``send(command)`` ships the command to the robot.
+    The display stage runs on the calling thread because cv2.imshow has to.
+    ``display_source()``, if given, returns the newest frame of a separate display
+    stream (or None); decisions are drawn on it instead of the detector's image.
+    With ``with_depth`` the detector is called as ``detect(frame, depth)`` with
+    the aligned depth frame (None when there is none).
+    With a ``scheduler`` (frame_scheduler.DeadlineScheduler) each frame's age is
+    checked against its latency budget; while over budget the display stops
+    drawing and the detector gets a half-size frame, in the scheduler's order.
+    With ``velocity(detection, command, frame_size)`` (e.g. bbox_velocity) the
+    command is sent as ``send(command, velocity)``.
+    A ``recorder`` (session_recorder.SessionRecorder, started; by default one
+    from FOLLOW_RECORD) gets every captured frame and every decision, and is
+    closed with the runtime.
+    """
+
+    def __init__(self, video_queue, detect: Callable, decide: Callable, send: Callable,
+                 annotate: Callable = draw_decision, window_name: str = "Follower View",
+                 show: bool = True, display_source: Optional[Callable] = None, with_depth: bool = False,
+                 scheduler=None, velocity: Optional[Callable] = None, recorder=None):
+        self.video_queue = video_queue
+        self.detect = detect
+        self.decide = decide
+        self.send = send
+        self.annotate = annotate
+        self.window_name = window_name
+        self.show = show
+        self.display_source = display_source
+        self.with_depth = with_depth
+        self.scheduler = scheduler
+        self.velocity = velocity
+        self.recorder = recorder if recorder is not None else recorder_from_env()
+        self.display_frame = None
+        self.stale_frames = 0  # queued behind a newer frame and never processed
+
+        self.frame_slot = LatestSlot()
+        self.detection_slot = LatestSlot()
+        self.display_slot = LatestSlot()
+        self.counters = {name: StageCounter() for name in ("capture", "detect", "decide", "display")}
+        self.running = threading.Event()
+        self.threads = []
+        self.error = None
+
+    def start(self):
+        self.running.set()
+        for name, target in (("capture", self._capture_loop),
+                             ("detect", self._detect_loop),
+                             ("decide", self._decide_loop)):
+            thread = threading.Thread(target=self._guard, args=(target,), name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _guard(self, target):
+        # A crash in any stage stops the whole runtime instead of leaving it half alive
+        try:
+            target()
+        except Exception as e:
+            self.error = e
+            print(f"[Follower][{threading.current_thread().name} ERROR]: {e}")
+            self.running.clear()
+
+    def _capture_loop(self):
+        seq = 0
+        while self.running.is_set():
+            in_frame, stale = latest_frame(self.video_queue)
+            if in_frame is None:
+                break
+            self.stale_frames += stale
+            packet = read_packet(in_frame, seq)
+            # Time the frame spent in the device output queue before reaching the host
+            tracer.begin_frame(packet.seq, packet.timestamp)
+            tracer.record_since_capture("queue")
+            if self.recorder is not None:
+                self.recorder.record_frame(packet.seq, packet.timestamp, packet.frame, packet.depth)
+            self.frame_slot.put(packet)
+            self.counters["capture"].tick()
+            seq += 1
+        self.running.clear()
+
+    def _detect_loop(self):
+        while self.running.is_set():
+            packet = self.frame_slot.get(timeout=0.1)
+            if packet is None:
+                continue
+            tracer.begin_frame(packet.seq, packet.timestamp)
+            if self.scheduler is not None:
+                self.scheduler.begin(packet.timestamp)
+                packet.frame = self.scheduler.shrink(packet.frame)  # half size once 'resolution' is shed
+            with tracer.span("detect"):
+                if self.with_depth:
+                    packet.img, packet.detection = self.detect(packet.frame, packet.depth)
+                else:
+                    packet.img, packet.detection = self.detect(packet.frame)
+            self.detection_slot.put(packet)
+            self.counters["detect"].tick()
+
+    def _decide_loop(self):
+        # Always works on the newest detection; older ones were replaced in the slot
+        while self.running.is_set():
+            packet = self.detection_slot.get(timeout=0.1)
+            if packet is None:
+                continue
+            tracer.begin_frame(packet.seq, packet.timestamp)
+            with tracer.span("decide"):
+                packet.command, packet.box_color = self.decide(packet.detection)
+            velocity = None
+            if self.velocity is not None:
+                frame_size = (packet.frame.shape[1], packet.frame.shape[0])
+                velocity = self.velocity(packet.detection, packet.command, frame_size)
+                self.send(packet.command, velocity)
+            else:
+                self.send(packet.command)
+            tracer.record_since_capture("capture_to_command")
+            if self.recorder is not None:
+                self.recorder.record_decision(packet.seq, packet.timestamp, packet.detection, packet.command, velocity)
+            if self.scheduler is not None:
+                self.scheduler.finish(packet.timestamp)
+            self.display_slot.put(packet)
+            self.counters["decide"].tick()
+
+    def run(self):
+        """Start the worker stages and run the display loop until 'q' or a stage stops."""
+        self.start()
+        try:
+            while self.running.is_set():
+                packet = self.display_slot.get(timeout=0.1)
+                if packet is None or not self.show:
+                    continue
+                if self.scheduler is not None and self.scheduler.skip("draw"):
+                    if cv2.waitKey(1) & 0xFF == ord('q'):  # keep the window responsive
+                        break
+                    continue
+                tracer.begin_frame(packet.seq, packet.timestamp)
+                with tracer.span("display"):
+                    cv2.imshow(self.window_name, self._display_image(packet))
+                tracer.record_since_capture("capture_to_display")
+                self.counters["display"].tick()
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+        finally:
+            self.stop()
+
+    def _display_image(self, packet):
+        """Annotated image to show: the display stream's newest frame, else the detector's image."""
+        if self.display_source is not None:
+            latest = self.display_source()
+            if latest is not None:
+                self.display_frame = latest.getCvFrame()
+        if self.display_frame is None:
+            img, detection = packet.img, packet.detection
+        else:
+            img = self.display_frame.copy()
+            sx = img.shape[1] / packet.frame.shape[1]
+            sy = img.shape[0] / packet.frame.shape[0]
+            detection = scale_detection(packet.detection, sx, sy)
+        if self.annotate is not None:
+            self.annotate(img, detection, packet.box_color)
+        return img
+
+    def stop(self):
+        self.running.clear()
+        for slot in (self.frame_slot, self.detection_slot, self.display_slot):
+            slot.close()
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.show:
+            cv2.destroyAllWindows()
+
+    def report(self) -> str:
+        rates = ", ".join(f"{name} {counter.rate():.1f}/s" for name, counter in self.counters.items())
+        report = (f"{rates} | stale queued frames {self.stale_frames}, dropped frames {self.frame_slot.dropped}, "
+                  f"dropped detections {self.detection_slot.dropped}")
+        if self.scheduler is not None:
+            report += f" | deadline {self.scheduler.report()}"
+        return report
+
+
+def run_follower(sender, camera, build_detect, decide, state, budget=0.15, order=DEGRADE_ORDER, send=None,
+                 on_open=None, reports=None, name="Follower"):
+    """Start, run and shut down one follower script.
+
+    ``state['scheduler']`` is set to a DeadlineScheduler(budget, order) before
+    ``build_detect(state)`` loads the detectors, in parallel with ``camera.open``.
+    ``sender`` (a started CommandSender) is closed, sending the final stop
+    command, whether startup fails, the runtime stops or it raises.
+    ``send`` replaces ``sender.send``, ``on_open(video_queue)`` runs once the
+    camera is open, and ``reports(video_queue)`` returns extra {label: report}
+    lines for the shutdown report. The camera's depth stream, if it has one,
+    goes to the detector, and a binary-protocol sender gets bbox_velocity().
+    """
+    startup = Startup(name)
+    state['scheduler'] = DeadlineScheduler(budget, order=order)
+    try:
+        detect = startup.run(camera=camera.open, detector=lambda: build_detect(state))['detector']
+    except BaseException:
+        sender.close()  # The camera or a detector failed to start: still send the final stop command
+        raise
+
+    with camera as video_queue:
+        if on_open is not None:
+            on_open(video_queue)
+        runtime = FollowerRuntime(video_queue,
+                                  detect=detect,
+                                  decide=lambda detection: decide(detection, state),
+                                  send=startup.watch(sender, send),
+                                  display_source=video_queue.get_display,
+                                  with_depth=getattr(camera, 'depth', False),
+                                  scheduler=state['scheduler'],
+                                  velocity=bbox_velocity if sender.protocol == "binary" else None)
+        try:
+            runtime.run()
+        finally:
+            sender.close()  # Sends a final stop command
+            print(f"[{name}] {runtime.report()}")
+            print(f"[{name}] Commands: {sender.report()}")
+            print(f"[{name}] Startup: {startup.report()}")
+            for label, report in (reports(video_queue) if reports is not None else {}).items():
+                print(f"[{name}] {label}: {report}")
+            print(tracer.summary())
+            print(f"[{name}] Shutdown complete.")
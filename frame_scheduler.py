@@ -0,0 +1,183 @@
+#Deadline-aware frame scheduling for FollowerRuntime
+#A non-blocking DepthAI queue hands out its oldest frame, so when detection is
+#slower than the camera the robot steers on images several frames old.
+#latest_frame() drains the queue and keeps only the newest frame, and
+#DeadlineScheduler measures how old each frame is (from the device timestamp)
+#when detection starts and when its command goes out. When capture-to-command
+#latency exceeds the budget it sheds work in a fixed order:
+#  1. hands       - reuse the last hand/fist result instead of detecting hands
+#  2. draw        - stop annotating and showing frames
+#  3. resolution  - run the detector on a half-size frame
+#and restores them one at a time once latency has stayed well under budget.
+#Each script passes the steps it can actually shed (its SHED_ORDER), e.g.
+#order=("draw",) for the planner; steps left out are never skipped.
+#Ages and latencies go into fixed-size log-bucket histograms (tracing.py), so
+#report() stays cheap and memory flat however long the follower runs
+#
+#Simulated camera + overloaded detector, oldest-frame vs freshest + shedding:
+#  python3 frame_scheduler.py
+
+import argparse
+import random
+import time
+
+import cv2
+import numpy as np
+
+from tracing import Histogram
+
+DEGRADE_ORDER = ("hands", "draw", "resolution")
+
+
+def latest_frame(queue):
+    """(newest message, number of older ones dropped); blocks only when nothing is queued."""
+    try_get_all = getattr(queue, 'tryGetAll', None)
+    if try_get_all is not None:
+        messages = try_get_all()
+        if messages:
+            return messages[-1], len(messages) - 1
+    return queue.get(), 0
+
+
+class DeadlineScheduler:
+    """Per-frame latency budget with ordered work shedding.
+
+    begin(timestamp) is called when detection starts on a frame and finish(timestamp)
+    when its command has been sent; timestamps are capture times on the
+    time.monotonic() clock (DepthAI device timestamps are synced to it).
+    skip(step) says whether a step in ``order`` (a subsequence of DEGRADE_ORDER)
+    is currently being shed.
+    """
+
+    def __init__(self, budget=0.15, order=DEGRADE_ORDER, recover_ratio=0.6, recover_after=30, cooldown=10,
+                 scale=0.5):
+        unknown = [step for step in order if step not in DEGRADE_ORDER]
+        if unknown:
+            raise ValueError(f"Unknown shedding steps {unknown}, expected some of {DEGRADE_ORDER}")
+        self.budget = budget
+        self.order = tuple(order)
+        self.recover_ratio = recover_ratio  # latency under budget * this counts toward recovery
+        self.recover_after = recover_after  # consecutive fast frames before restoring one step
+        self.cooldown = cooldown  # frames to let a change take effect before shedding more
+        self.scale = scale  # detector frame scale once 'resolution' is shed
+        self.level = 0  # number of steps of `order` being shed
+        self.fast = 0
+        self.since_change = cooldown
+        self.ages = Histogram()  # frame age when detection started
+        self.latencies = Histogram()  # capture -> command
+        self.stats = {'frames': 0, 'over_budget': 0, 'shed': dict.fromkeys(self.order, 0),
+                      'escalations': 0, 'recoveries': 0}
+
+    @staticmethod
+    def _age(timestamp, now):
+        age = (time.monotonic() if now is None else now) - timestamp
+        return age if 0.0 <= age < 60.0 else None  # ignore sources not on the host monotonic clock
+
+    def begin(self, timestamp, now=None):
+        """Frame age as detection starts on it (None if the timestamp is on another clock)."""
+        age = self._age(timestamp, now)
+        if age is not None:
+            self.ages.add(age)
+        return age
+
+    def finish(self, timestamp, now=None):
+        """Record capture -> command latency for a frame and adjust the shedding level."""
+        latency = self._age(timestamp, now)
+        self.stats['frames'] += 1
+        if latency is None:
+            return None
+        self.latencies.add(latency)
+        self.since_change += 1
+        if latency > self.budget:
+            self.stats['over_budget'] += 1
+            self.fast = 0
+            if self.level < len(self.order) and self.since_change >= self.cooldown:
+                self.level += 1
+                self.since_change = 0
+                self.stats['escalations'] += 1
+        elif latency < self.budget * self.recover_ratio:
+            self.fast += 1
+            if self.level > 0 and self.fast >= self.recover_after:
+                self.level -= 1
+                self.fast = 0
+                self.since_change = 0
+                self.stats['recoveries'] += 1
+        else:
+            self.fast = 0
+        return latency
+
+    def skip(self, step):
+        """Whether `step` is being shed right now; counts it as shed if so. Steps not in the order never are."""
+        if step in self.order and self.order.index(step) < self.level:
+            self.stats['shed'][step] += 1
+            return True
+        return False
+
+    def shrink(self, frame):
+        """The frame to detect on: half size once 'resolution' is shed."""
+        if not self.skip("resolution"):
+            return frame
+        h, w = frame.shape[:2]
+        return cv2.resize(frame, (int(w * self.scale), int(h * self.scale)), interpolation=cv2.INTER_AREA)
+
+    def report(self):
+        report = dict(self.stats, shed=dict(self.stats['shed']), level=self.level)
+        for name, histogram in (('age_ms', self.ages), ('latency_ms', self.latencies)):
+            if histogram.count:
+                report[name] = {'p50': round(histogram.percentile(50) * 1000, 1),
+                                'p95': round(histogram.percentile(95) * 1000, 1),
+                                'max': round(histogram.max * 1000, 1)}
+        return report
+
+
+def simulate(freshest, scheduler, frames, fps=30.0, seed=0, hands=True):
+    """Camera into a maxSize=4 queue, one worker whose detector is overloaded for the middle third."""
+    from frame_source import SourceFrame
+    from stream_sync import EndOfStream, SimQueue
+
+    rng = random.Random(seed)
+    clock = [0.0]
+    queue = SimQueue(clock, [(i / fps + 0.005, SourceFrame(None, i, i / fps)) for i in range(frames)])
+    costs = {'detect': 0.030, 'hands': 0.020, 'draw': 0.006}  # seconds at full resolution
+    ages, latencies = [], []
+    try:
+        while True:
+            frame = latest_frame(queue)[0] if freshest else queue.get()
+            age = clock[0] - frame.timestamp
+            if scheduler is not None:
+                scheduler.begin(frame.timestamp, now=clock[0])
+            load = 2.5 if frames / 3 <= frame.seq < 2 * frames / 3 else 1.0  # e.g. CPU contention
+            resolution = scheduler is not None and scheduler.skip("resolution")
+            work = costs['detect'] * (0.3 if resolution else 1.0)
+            if hands and (scheduler is None or not scheduler.skip("hands")):
+                work += costs['hands']
+            clock[0] += work * load * rng.uniform(0.9, 1.1)
+            latency = clock[0] - frame.timestamp  # command sent
+            if scheduler is not None:
+                scheduler.finish(frame.timestamp, now=clock[0])
+            if scheduler is None or not scheduler.skip("draw"):
+                clock[0] += costs['draw'] * load
+            ages.append(age)
+            latencies.append(latency)
+    except EndOfStream:
+        pass
+    return np.array(ages) * 1000, np.array(latencies) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate frame scheduling under an overloaded detector")
+    parser.add_argument("--frames", type=int, default=900)
+    parser.add_argument("--budget", type=float, default=0.15)
+    args = parser.parse_args()
+
+    runs = (("oldest frame, no shedding", False, None, True),
+            ("freshest frame, no shedding", True, None, True),
+            ("freshest frame + deadline", True, DeadlineScheduler(args.budget), True),
+            ("no hands, draw+resolution", True, DeadlineScheduler(args.budget, order=("draw", "resolution")), False))
+    for name, freshest, scheduler, hands in runs:
+        ages, latencies = simulate(freshest, scheduler, args.frames, hands=hands)
+        print(f"[Scheduler] {name:28s} {len(latencies):4d} commands | frame age p50 {np.percentile(ages, 50):5.0f} ms "
+              f"max {ages.max():5.0f} ms | capture->command p50 {np.percentile(latencies, 50):5.0f} ms "
+              f"p95 {np.percentile(latencies, 95):5.0f} ms max {latencies.max():5.0f} ms")
+        if scheduler is not None:
+            print(f"[Scheduler] {scheduler.report()}")
@@ -0,0 +1,409 @@
+#Pluggable frame sources for the follower scripts and planner.py
+#Every source has the same get()/close() interface as a DepthAI output queue,
+#and get() returns objects with getCvFrame/getSequenceNum/getTimestamp like
+#dai.ImgFrame, so the scripts can run on a live camera, a recorded file or
+#synthetic frames without any other changes
+
+import json
+import os
+import time
+from datetime import timedelta
+
+import cv2
+import numpy as np
+
+from stream_sync import StreamSynchronizer
+
+
+class SourceFrame:
+    """Host-side stand-in for dai.ImgFrame, plus optional ground-truth metadata.
+
+    ``depth`` is a uint16 depth frame in mm aligned to ``frame``, for sources
+    that have one.
+    """
+    __slots__ = ('frame', 'seq', 'timestamp', 'meta', 'depth')
+
+    def __init__(self, frame, seq, timestamp, meta=None, depth=None):
+        self.frame = frame
+        self.seq = seq
+        self.timestamp = timestamp
+        self.meta = meta or {}
+        self.depth = depth
+
+    def getCvFrame(self):
+        return self.frame
+
+    def getSequenceNum(self):
+        return self.seq
+
+    def getTimestamp(self):
+        return timedelta(seconds=self.timestamp)
+
+
+def create_color_pipeline(width, height, stream_name="video", infer_size=None,
+                          display_size=None, display_every=1, display_stream="display"):
+    """Build the RGB camera pipeline every follower script uses.
+
+    Without ``infer_size`` this is a planar preview at width x height. With it,
+    the preview keeps the width x height field of view but is scaled on the
+    camera to the detector's input size, so only that crosses USB.
+    ``display_size`` adds a second BGR stream for the on-screen view, carrying
+    every ``display_every``-th camera frame.
+    """
+    import depthai as dai
+
+    pipeline = dai.Pipeline()
+    cam = pipeline.createColorCamera()
+    cam.setInterleaved(False)
+    cam.setBoardSocket(dai.CameraBoardSocket.CAM_A)
+    xout = pipeline.createXLinkOut()
+    xout.setStreamName(stream_name)
+
+    if infer_size is None:
+        cam.setPreviewSize(width, height)
+        cam.preview.link(xout.input)
+    elif infer_size[0] * height == infer_size[1] * width:
+        # Same aspect ratio: the camera's preview scaler produces the inference frame directly
+        cam.setPreviewSize(*infer_size)
+        cam.preview.link(xout.input)
+    else:
+        # Different aspect ratio (e.g. the planner's 256x256): squash the preview on the device,
+        # the same resize the host used to do
+        cam.setPreviewSize(width, height)
+        manip = pipeline.createImageManip()
+        manip.initialConfig.setResize(*infer_size)
+        manip.initialConfig.setKeepAspectRatio(False)
+        manip.initialConfig.setFrameType(dai.ImgFrame.Type.BGR888p)
+        manip.setMaxOutputFrameSize(infer_size[0] * infer_size[1] * 3)
+        cam.preview.link(manip.inputImage)
+        manip.out.link(xout.input)
+
+    if display_size is not None:
+        # Forward every Nth video frame, then crop to the preview's aspect ratio and scale
+        decimate = pipeline.create(dai.node.Script)
+        decimate.setScript(f"""
+n = 0
+while True:
+    frame = node.io['in'].get()
+    n += 1
+    if n % {max(1, display_every)} == 0:
+        node.io['out'].send(frame)
+""")
+        decimate.inputs['in'].setBlocking(False)
+        decimate.inputs['in'].setQueueSize(1)
+        cam.video.link(decimate.inputs['in'])
+
+        display_manip = pipeline.createImageManip()
+        display_manip.initialConfig.setResize(*display_size)
+        display_manip.initialConfig.setKeepAspectRatio(True)
+        display_manip.initialConfig.setFrameType(dai.ImgFrame.Type.BGR888p)
+        display_manip.setMaxOutputFrameSize(display_size[0] * display_size[1] * 3)
+        decimate.outputs['out'].link(display_manip.inputImage)
+
+        xout_display = pipeline.createXLinkOut()
+        xout_display.setStreamName(display_stream)
+        display_manip.out.link(xout_display.input)
+    return pipeline
+
+
+def add_aligned_depth(pipeline, size, stream_name="depth"):
+    """Add the depth2.py stereo pair (720p monos, subpixel, LR check) with depth aligned to CAM_A.
+
+    ``size`` is the (width, height) of the RGB frames the depth has to line up with.
+    """
+    import depthai as dai
+    from depth2 import getMonoCamera, getStereoPair
+
+    stereo = getStereoPair(pipeline, getMonoCamera(pipeline, isLeft=True), getMonoCamera(pipeline, isLeft=False))
+    stereo.setDepthAlign(dai.CameraBoardSocket.CAM_A)
+    stereo.setOutputSize(*size)
+    xout = pipeline.createXLinkOut()
+    xout.setStreamName(stream_name)
+    stereo.depth.link(xout.input)
+    return pipeline
+
+
+class DepthAISource:
+    """Live DepthAI color camera; get() returns the device's dai.ImgFrame.
+
+    With ``infer_size`` the frames arrive already scaled to the detector's input;
+    with ``display_size`` get_display() returns the newest display-stream frame.
+    With ``depth=True`` the stereo pair runs too, and get() returns SourceFrames
+    whose ``depth`` is the aligned depth frame captured with the RGB frame
+    (matched by timestamp, see stream_sync.py; ``sync.report()`` has the misses).
+    ``device_id`` (MxId or USB path) picks one camera when several are connected.
+    """
+
+    def __init__(self, width, height, max_size=4, pipeline=None, stream_name="video",
+                 infer_size=None, display_size=None, display_every=1, display_stream="display",
+                 depth=False, depth_stream="depth", device_id=None):
+        self.width = width
+        self.height = height
+        self.max_size = max_size
+        self.pipeline = pipeline
+        self.stream_name = stream_name
+        self.infer_size = infer_size
+        self.display_size = display_size
+        self.display_every = display_every
+        self.display_stream = display_stream
+        self.depth = depth
+        self.depth_stream = depth_stream
+        self.device_id = device_id
+        self.device = None
+        self.queue = None
+        self.display_queue = None
+        self.depth_queue = None
+        self.sync = None
+
+    def open(self):
+        if self.device is not None:
+            return self  # already opened, e.g. by startup.Startup.run() before the with block
+        import depthai as dai
+
+        if self.pipeline is None:
+            self.pipeline = create_color_pipeline(self.width, self.height, self.stream_name,
+                                                  self.infer_size, self.display_size,
+                                                  self.display_every, self.display_stream)
+            if self.depth:
+                add_aligned_depth(self.pipeline, self.infer_size or (self.width, self.height), self.depth_stream)
+        if self.device_id is not None:
+            self.device = dai.Device(self.pipeline, dai.DeviceInfo(self.device_id))
+        else:
+            self.device = dai.Device(self.pipeline)
+        self.queue = self.device.getOutputQueue(name=self.stream_name, maxSize=self.max_size, blocking=False)
+        if self.display_size is not None:
+            self.display_queue = self.device.getOutputQueue(name=self.display_stream, maxSize=1, blocking=False)
+        if self.depth:
+            self.depth_queue = self.device.getOutputQueue(name=self.depth_stream, maxSize=4, blocking=False)
+            # The color and mono cameras count sequence numbers separately, so pair by capture time
+            self.sync = StreamSynchronizer({'rgb': self.queue, 'depth': self.depth_queue},
+                                           match="timestamp", max_skew=0.02)
+        return self
+
+    def get(self):
+        if self.sync is None:
+            return self.queue.get()
+        return self._paired(self.sync.get())
+
+    def tryGetAll(self):
+        """Everything queued right now, oldest first, without blocking (for frame_scheduler.latest_frame)."""
+        if self.sync is None:
+            return self.queue.tryGetAll()
+        frames = self.sync.tryGet()  # the synchroniser already keeps only the newest matched set
+        return [] if frames is None else [self._paired(frames)]
+
+    @staticmethod
+    def _paired(frames):
+        in_frame = frames['rgb']
+        return SourceFrame(in_frame.getCvFrame(), in_frame.getSequenceNum(),
+                           in_frame.getTimestamp().total_seconds(), depth=frames['depth'].getFrame())
+
+    def get_display(self):
+        """Newest display-stream frame, or None if there is no new one (or no display stream)."""
+        if self.display_queue is None:
+            return None
+        return self.display_queue.tryGet()
+
+    def close(self):
+        if self.device is not None:
+            self.device.close()
+            self.device = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class VideoFileSource:
+    """Recorded video file or image directory.
+
+    If ``<path>.detections.jsonl`` exists, each line is attached to its frame as
+    metadata (for example ``{"bbox": [x, y, w, h], "fist": false}``) so the
+    decision logic can be replayed without running the detectors.
+    """
+
+    def __init__(self, path, width=None, height=None, loop=False, realtime=False):
+        self.path = path
+        self.size = (width, height) if width and height else None
+        self.loop = loop
+        self.realtime = realtime
+        self.capture = None
+        self.images = None
+        self.meta = []
+        self.seq = 0
+        self.position = 0  # frame index within the recording, resets on loop
+        self.fps = 30.0
+        self.started = None
+
+    def open(self):
+        if os.path.isdir(self.path):
+            self.images = sorted(os.path.join(self.path, name) for name in os.listdir(self.path)
+                                 if name.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')))
+        else:
+            self.capture = cv2.VideoCapture(self.path)
+            if not self.capture.isOpened():
+                raise IOError(f"Cannot open video {self.path}")
+            self.fps = self.capture.get(cv2.CAP_PROP_FPS) or self.fps
+        sidecar = self.path.rstrip(os.sep) + ".detections.jsonl"
+        if os.path.exists(sidecar):
+            with open(sidecar) as f:
+                self.meta = [json.loads(line) for line in f if line.strip()]
+        self.started = time.monotonic()
+        return self
+
+    def _read(self):
+        if self.images is not None:
+            if self.position >= len(self.images):
+                return None
+            return cv2.imread(self.images[self.position])
+        ok, frame = self.capture.read()
+        return frame if ok else None
+
+    def get(self):
+        """Return the next SourceFrame, or None at the end of the recording."""
+        frame = self._read()
+        if frame is None and self.loop and self.seq > 0:
+            self.rewind()
+            frame = self._read()
+        if frame is None:
+            return None
+        if self.size is not None and (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if self.realtime:
+            delay = self.started + self.seq / self.fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        timestamp = time.monotonic()  # capture time on the host clock, like DepthAI timestamps
+        meta = self.meta[self.position] if self.position < len(self.meta) else None
+        packet = SourceFrame(frame, self.seq, timestamp, meta)
+        self.seq += 1
+        self.position += 1
+        return packet
+
+    def rewind(self):
+        if self.capture is not None:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.position = 0
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SyntheticSource:
+    """Generated frames with a moving 'person' box and a drifting path mask.
+
+    The ground truth goes into ``meta`` (``bbox``, ``fist`` and a 256x256 path
+    ``mask``), so every variant's decision logic has something to react to.
+    With ``fps=None`` frames are produced as fast as they are requested.
+    """
+
+    def __init__(self, width=1280, height=720, count=600, fps=None, seed=0, depth=False):
+        self.width = width
+        self.height = height
+        self.count = count
+        self.fps = fps
+        self.rng = np.random.default_rng(seed)
+        self.seq = 0
+        self.started = None
+        self.background = None
+        self.mask_cols = np.arange(256, dtype=np.float32)
+        self.depth = depth
+        self.background_depth = None
+
+    def open(self):
+        self.background = self.rng.integers(40, 90, size=(self.height, self.width, 3), dtype=np.uint8)
+        if self.depth:
+            # Floor getting farther toward the horizon, walls at 8 m
+            rows = np.linspace(8000, 1500, self.height, dtype=np.float32)[:, None]
+            self.background_depth = np.repeat(rows, self.width, axis=1).astype(np.uint16)
+            # A few precomputed noise fields and hole masks, cycled, keep the stand-in cheap
+            shape = (self.height, self.width)
+            self.depth_noise = [self.rng.normal(1.0, 0.02, size=shape).astype(np.float32) for _ in range(3)]
+            self.depth_holes = [self.rng.random(shape) < 0.05 for _ in range(3)]  # invalidated by the LR check
+        self.started = time.monotonic()
+        return self
+
+    def ground_truth(self, seq):
+        """Scripted target: walks away and back while weaving left and right."""
+        phase = seq / 90.0
+        h = int(self.height * (0.55 + 0.45 * np.sin(phase * 0.7) ** 2))
+        h = max(int(self.height * 0.2), min(h, self.height))
+        w = max(1, int(h * 0.4))
+        cx = int(self.width / 2 + self.width * 0.3 * np.sin(phase * 1.3))
+        x = max(0, min(self.width - w, cx - w // 2))
+        y = max(0, (self.height - h) // 2)
+        visible = (seq // 150) % 4 != 3  # person leaves the frame every fourth segment
+        fist = (seq // 50) % 12 == 11
+        path_center = 128 + 80 * np.sin(phase * 0.9)
+        return (x, y, w, h) if visible else None, fist, path_center
+
+    def get(self):
+        """Return the next SourceFrame, or None after ``count`` frames."""
+        if self.seq >= self.count:
+            return None
+        bbox, fist, path_center = self.ground_truth(self.seq)
+        frame = self.background.copy()
+        if bbox is not None:
+            x, y, w, h = bbox
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (60, 120, 200), cv2.FILLED)
+
+        # Path band whose center drifts, widening toward the bottom of the image
+        rows = np.linspace(0.3, 1.0, 256, dtype=np.float32)[:, None]
+        mask = (np.abs(self.mask_cols[None, :] - path_center) < 20 + 50 * rows).astype(np.float32)
+
+        if self.fps:
+            delay = self.started + self.seq / self.fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        timestamp = time.monotonic()  # capture time on the host clock, like DepthAI timestamps
+        meta = {'bbox': bbox, 'fist': fist, 'mask': mask}
+        depth = self._depth(bbox, meta) if self.depth else None
+        packet = SourceFrame(frame, self.seq, timestamp, meta, depth)
+        self.seq += 1
+        return packet
+
+    def _depth(self, bbox, meta):
+        """Stand-in stereo depth (mm): the person at the distance their bbox height implies, plus noise and holes."""
+        depth = self.background_depth.copy()
+        meta['distance'] = None
+        if bbox is not None:
+            x, y, w, h = bbox
+            focal = 931.0 * self.height / 720  # OAK-D color camera at 1280x720, in pixels
+            meta['distance'] = focal * 1.7 / h  # a 1.7 m tall person
+            depth[y:y + h, x:x + w] = int(meta['distance'] * 1000)
+        depth = (depth * self.depth_noise[self.seq % 3]).astype(np.uint16)
+        depth[self.depth_holes[self.seq % 3]] = 0
+        return depth
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_source(spec, width, height, **kwargs):
+    """Build a source from 'depthai[:device id]', 'synthetic[:count]', a .session recording or a file/directory path."""
+    if spec == "depthai" or spec.startswith("depthai:"):
+        device_id = spec.split(":", 1)[1] if ":" in spec else None
+        return DepthAISource(width, height, device_id=device_id, **kwargs)
+    if spec.startswith("synthetic"):
+        count = int(spec.split(":", 1)[1]) if ":" in spec else 600
+        return SyntheticSource(width, height, count=count, **kwargs)
+    if spec.endswith(".session"):
+        from session_recorder import SessionSource
+        return SessionSource(spec, width, height, **kwargs)
+    return VideoFileSource(spec, width, height, **kwargs)
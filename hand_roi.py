@@ -0,0 +1,121 @@
+#Landmark-guided hand detection for the fist-stop followers
+#PoseDetector.findPosition already locates both wrists, so the hand detector
+#only needs to look at a small square around each pose hand instead of the
+#whole 1280x720 frame. It runs every `cadence` frames and reuses the last
+#result in between. The full frame is only searched as a fallback: when the
+#pose has no hand in view, or every few frames when the crops keep coming up
+#empty
+
+import cv2
+import numpy as np
+
+# MediaPipe pose landmark indices: wrist, pinky, index, thumb, and the elbow
+POSE_HANDS = {
+    'Left': ((15, 17, 19, 21), 13),
+    'Right': ((16, 18, 20, 22), 14),
+}
+
+
+def hand_rois(lmList, frame_shape, scale=2.5, min_size=96, max_size=400):
+    """Square (x0, y0, x1, y1) crops around each pose hand that is inside the frame.
+
+    The crop is centred on the pose's hand points and sized from the forearm
+    length, so it follows the person's distance to the camera.
+    """
+    h, w = frame_shape[:2]
+    rois = []
+    if not lmList or len(lmList) <= 22:
+        return rois
+    points = np.array([lm[-3:-1] for lm in lmList], dtype=np.float32)  # [x, y, z] or [id, x, y, z]
+    for hand_points, elbow in POSE_HANDS.values():
+        cx, cy = points[list(hand_points)].mean(axis=0)
+        if not (0 <= cx < w and 0 <= cy < h):
+            continue
+        forearm = float(np.linalg.norm(points[hand_points[0]] - points[elbow]))
+        half = int(min(max(forearm * scale, min_size), max_size)) // 2
+        x0, y0 = max(0, int(cx) - half), max(0, int(cy) - half)
+        x1, y1 = min(w, int(cx) + half), min(h, int(cy) + half)
+        if x1 - x0 >= min_size // 2 and y1 - y0 >= min_size // 2:
+            rois.append((x0, y0, x1, y1))
+    return rois
+
+
+def offset_hand(hand, x0, y0):
+    """Copy of a cvzone hand dict with its crop coordinates moved into the full frame."""
+    moved = dict(hand)
+    moved['lmList'] = [[x + x0, y + y0, *rest] for x, y, *rest in hand['lmList']]
+    x, y, bw, bh = hand['bbox']
+    moved['bbox'] = (x + x0, y + y0, bw, bh)
+    moved['center'] = (hand['center'][0] + x0, hand['center'][1] + y0)
+    return moved
+
+
+def draw_hands(img, hands):
+    """Landmarks, box and label for each hand, in the style of cvzone's findHands(draw=True)."""
+    for hand in hands:
+        for x, y, *_ in hand['lmList']:
+            cv2.circle(img, (int(x), int(y)), 4, (0, 0, 255), cv2.FILLED)
+        x, y, bw, bh = hand['bbox']
+        cv2.rectangle(img, (x - 20, y - 20), (x + bw + 20, y + bh + 20), (255, 0, 255), 2)
+        cv2.putText(img, hand.get('type', ''), (x - 30, y - 30), cv2.FONT_HERSHEY_PLAIN, 2, (255, 0, 255), 2)
+    return img
+
+
+class RoiHandDetector:
+    """Runs a cvzone HandDetector on pose-guided crops at a reduced cadence.
+
+    Calling it with the pose-annotated image and lmList returns (hands, fist)
+    in full-frame coordinates, like findHands + fingersUp on the whole frame.
+    """
+
+    def __init__(self, hand_detector, cadence=2, full_frame_every=5, draw=True):
+        self.detector = hand_detector
+        self.cadence = max(1, cadence)
+        self.full_frame_every = full_frame_every  # empty crop searches before one full-frame search
+        self.draw = draw
+        self.since_run = self.cadence  # run on the first frame
+        self.misses = 0
+        self.last = ([], False)
+        self.stats = {'roi': 0, 'full': 0, 'skipped': 0}
+
+    def _find(self, img, x0=0, y0=0, x1=None, y1=None):
+        crop = img[y0:y1, x0:x1]
+        hands = self.detector.findHands(crop, draw=False)
+        hands = hands[0] if isinstance(hands, tuple) else hands  # findHands returns (hands, img) when drawing
+        return [offset_hand(hand, x0, y0) for hand in hands] if x0 or y0 else hands
+
+    def __call__(self, img, lmList):
+        self.since_run += 1
+        if self.since_run < self.cadence:
+            self.stats['skipped'] += 1
+            hands, fist = self.last
+            if self.draw:
+                draw_hands(img, hands)
+            return hands, fist
+        self.since_run = 0
+
+        hands = []
+        rois = hand_rois(lmList, img.shape)
+        for roi in rois:
+            self.stats['roi'] += 1
+            hands = self._find(img, *roi)
+            if hands:
+                break  # maxHands=1 semantics: the first hand found decides
+
+        if hands:
+            self.misses = 0
+        else:
+            self.misses += 1
+            if not rois or self.misses >= self.full_frame_every:
+                self.stats['full'] += 1
+                self.misses = 0
+                hands = self._find(img)
+
+        fist = bool(hands) and sum(self.detector.fingersUp(hands[0])) == 0  # all fingers down = fist
+        self.last = (hands, fist)
+        if self.draw:
+            draw_hands(img, hands)
+        return hands, fist
+
+    def report(self):
+        return dict(self.stats)
@@ -1,87 +1,77 @@
-import cv2
-import socket
-import depthai as dai
-from cvzone.PoseModule import PoseDetector
+from command_sender import CommandSender
+from frame_source import DepthAISource
+from pose_tracker import PoseTracker
+from startup import warm_up
+from tracing import span
+from follower_runtime import COLOR_GREEN, person_box, run_follower
 
 # TCP Connection Setup
 ROBOT_IP = "100.87.161.11"
 PORT = 9999
-client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-client_socket.connect((ROBOT_IP, PORT))
-print("[Follower] Connected to robot.")
-
-# Initialize pose detector
-pose_detector = PoseDetector()
-
-# Create pipeline and camera
-pipeline = dai.Pipeline()
-cam = pipeline.createColorCamera()
-cam.setPreviewSize(1280, 720)  # Higher resolution for better range
-cam.setInterleaved(False)
-cam.setBoardSocket(dai.CameraBoardSocket.CAM_A)
-xout = pipeline.createXLinkOut()
-xout.setStreamName("video")
-cam.preview.link(xout.input)
 
 # Frame and movement setup
-frame_width = 1280
-frame_center = frame_width // 2
-center_tolerance = frame_width // 10  # acceptable range to go straight
-
-# Track permanent stop state
-stopped = False
-
-# Run on device
-with dai.Device(pipeline) as device:
-    video_queue = device.getOutputQueue(name="video", maxSize=4, blocking=False)
-
-    try:
-        while True:
-            in_frame = video_queue.get()
-            frame = in_frame.getCvFrame()
-
-            # Pose detection
-            img = pose_detector.findPose(frame)
-            lmList, bboxInfo = pose_detector.findPosition(img, bboxWithHands=True)
-
-            # Only use bounding box height to decide stop
-            if bboxInfo is not None and 'bbox' in bboxInfo:
-                x, y, w, h = bboxInfo['bbox']
-
-                # Stop if person is too close
-                if h > 900:  # Adjust threshold based on your testing
-                    command = 'x'
-                else:
-                    cx = x + w // 2
-                    offset = cx - frame_center
-
-                    # Draw bounding box and center dot
-                    cv2.rectangle(img, (x, y), (x + w, y + h), (0, 255, 0), 3)
-                    cv2.circle(img, (cx, y + h // 2), 5, (0, 0, 255), cv2.FILLED)
-
-                    if abs(offset) < center_tolerance:
-                        command = 'w'
-                    elif offset < 0:
-                        command = 'a'
-                    else:
-                        command = 'd'
-            else:
-                command = 'x'
-
-            try:
-                client_socket.sendall(command.encode())
-                print(f"[Follower] Sent command: {command}")
-            except Exception as e:
-                print(f"[Follower][TCP ERROR]: {e}")
-
-            # Show the full annotated frame
-            cv2.imshow("Follower View", img)
-
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                client_socket.sendall('x'.encode())
-                break
-
-    finally:
-        client_socket.close()
-        cv2.destroyAllWindows()
-        print("[Follower] Shutdown complete.")
\ No newline at end of file
+frame_width = 1280   # camera preview (field of view) the thresholds were tuned on
+frame_height = 720
+INFER_SIZE = (640, 360)   # detector input, scaled on the camera (see frame_source.py)
+DISPLAY_SIZE = None       # e.g. (1280, 720) for a separate, sharper display stream
+DISPLAY_EVERY = 2         # display stream carries every Nth camera frame
+POSE_MAX_INTERVAL = 6     # findPose at least every Nth frame, bbox tracked in between (pose_tracker.py)
+LATENCY_BUDGET = 0.15
+SHED_ORDER = ("draw", "resolution")  # no hand detection to shed
+PROTOCOL = "legacy"       # or "binary": velocity messages with proportional steering (velocity_protocol.py)
+TRANSPORT = "tcp"         # or "udp": one datagram per message, binary protocol only (command_sender.py)
+
+# Thresholds are fractions of the frame, so they hold at any resolution
+center_tolerance = 0.1  # acceptable range to go straight
+
+STOP_HEIGHT = 900 / 720  # Adjust threshold based on your testing (900 px at 720p)
+
+
+def build_detect(state):
+    """Create the pose detector and return detect(frame) -> (img, detection)."""
+    from cvzone.PoseModule import PoseDetector
+    from detection_cache import cached
+    pose_detector = cached(warm_up(PoseDetector(), INFER_SIZE))
+    find_pose = state['pose_tracker'] = PoseTracker(pose_detector, max_interval=POSE_MAX_INTERVAL)
+
+    def detect(frame):
+        # Pose detection
+        with span("findPose"):
+            img, lmList, bboxInfo = find_pose(frame)
+        return img, {'lmList': lmList, 'bboxInfo': bboxInfo, 'frame_size': (frame.shape[1], frame.shape[0])}
+    return detect
+
+
+def decide(detection, state):
+    """Return (command, box_color) for one detection."""
+    # Only use bounding box height to decide stop
+    box = person_box(detection, (frame_width, frame_height))
+    if box is None:
+        return 'x', None
+
+    offset, w, h = box
+
+    # Stop if person is too close
+    if h > STOP_HEIGHT:
+        return 'x', None
+
+    if abs(offset) < center_tolerance:
+        command = 'w'
+    elif offset < 0:
+        command = 'a'
+    else:
+        command = 'd'
+    return command, COLOR_GREEN
+
+
+def main():
+    sender = CommandSender(ROBOT_IP, PORT, protocol=PROTOCOL, transport=TRANSPORT).start()
+    camera = DepthAISource(frame_width, frame_height, infer_size=INFER_SIZE, display_size=DISPLAY_SIZE,
+                           display_every=DISPLAY_EVERY)
+    state = {}
+    run_follower(sender, camera, build_detect, decide, state, LATENCY_BUDGET, SHED_ORDER,
+                 reports=lambda video_queue: {"Pose tracking": state['pose_tracker'].report()})
+
+
+if __name__ == "__main__":
+    main()
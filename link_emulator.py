@@ -0,0 +1,197 @@
+#Loss/latency injection for the command link, and a TCP vs UDP benchmark
+#LinkEmulator is a local relay between CommandSender and the stand-in
+#controller. For UDP a lost datagram is simply gone; for TCP a lost segment is
+#retransmitted after `rto`, and everything sent behind it waits too (head-of-
+#line blocking), which is what makes TCP jittery on a lossy Wi-Fi link.
+#Every delivered chunk is delayed by `delay` plus up to `jitter` seconds
+#
+#Binary protocol over TCP and UDP through the same lossy link on loopback,
+#then the vision loop hangs and the robot's dead-man timeout has to stop it:
+#  python3 link_emulator.py [--loss 0.05 --delay 0.005 --jitter 0.01]
+
+import argparse
+import contextlib
+import heapq
+import io
+import itertools
+import math
+import random
+import socket
+import threading
+import time
+
+import numpy as np
+
+
+class LinkEmulator:
+    """Relay on ``port`` to ``target_port`` that drops and delays traffic."""
+
+    def __init__(self, target_port, transport="tcp", loss=0.0, delay=0.0, jitter=0.0, rto=0.2,
+                 host="127.0.0.1", seed=0):
+        self.target = (host, target_port)
+        self.host = host
+        self.transport = transport
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.rto = rto  # TCP retransmission timeout (Linux never goes below 200 ms)
+        self.port = None
+        self.stats = {'chunks': 0, 'lost': 0, 'retransmitted': 0}
+        self._rng = random.Random(seed)
+        self._cond = threading.Condition()
+        self._pending = []  # heap of (deliver at, order, deliver callable)
+        self._order = itertools.count()
+        self._running = threading.Event()
+        self._server = None
+
+    def start(self):
+        if self.transport == "udp":
+            self._server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._server.bind((self.host, 0))
+            self._out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            target = self._datagram_loop
+        else:
+            self._server = socket.create_server((self.host, 0))
+            target = self._accept_loop
+        self._server.settimeout(0.2)
+        self.port = self._server.getsockname()[1]
+        self._running.set()
+        for name, loop in (("link-in", target), ("link-out", self._deliver_loop)):
+            threading.Thread(target=loop, name=name, daemon=True).start()
+        return self
+
+    def _schedule(self, at, deliver):
+        with self._cond:
+            heapq.heappush(self._pending, (at, next(self._order), deliver))
+            self._cond.notify()
+
+    def _latency(self):
+        return self.delay + self._rng.uniform(0, self.jitter)
+
+    def _datagram_loop(self):
+        while self._running.is_set():
+            try:
+                data, _ = self._server.recvfrom(2048)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.stats['chunks'] += 1
+            if self._rng.random() < self.loss:
+                self.stats['lost'] += 1
+                continue
+            self._schedule(time.monotonic() + self._latency(), lambda data=data: self._out.sendto(data, self.target))
+
+    def _accept_loop(self):
+        while self._running.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self._stream_loop, args=(conn,), daemon=True).start()
+
+    def _stream_loop(self, conn):
+        out = socket.create_connection(self.target)
+        out.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.settimeout(0.2)
+        last = 0.0  # bytes are delivered in order, so nothing overtakes a retransmission
+        with conn:
+            while self._running.is_set():
+                try:
+                    data = conn.recv(4096)
+                except socket.timeout:
+                    continue
+                except OSError:
+                    break
+                if not data:
+                    break
+                self.stats['chunks'] += 1
+                at = time.monotonic() + self._latency()
+                if self._rng.random() < self.loss:
+                    self.stats['retransmitted'] += 1
+                    at += self.rto
+                last = max(last, at)
+                self._schedule(last, lambda data=data: out.sendall(data))
+        self._schedule(last, out.close)
+
+    def _deliver_loop(self):
+        while self._running.is_set():
+            with self._cond:
+                if not self._pending:
+                    self._cond.wait(0.1)
+                    continue
+                wait = self._pending[0][0] - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                _, _, deliver = heapq.heappop(self._pending)
+            try:
+                deliver()
+            except OSError:
+                pass
+
+    def stop(self):
+        self._running.clear()
+        self._server.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def run_link(transport, args):
+    """Drive the stand-in controller through a lossy link; returns the latency / dead-man summary."""
+    from command_sender import CommandSender
+    from stand_in_controller import StandInController
+    from tracing import tracer
+
+    with StandInController(protocol="binary", transport=transport, max_age=args.max_age,
+                           deadman=args.deadman) as controller, \
+            LinkEmulator(controller.port, transport, args.loss, args.delay, args.jitter, seed=args.seed) as link:
+        sender = CommandSender(link.host, link.port, name="Link", protocol="binary", transport=transport)
+        with contextlib.redirect_stdout(io.StringIO()):  # one "Sent command" line per frame otherwise
+            sender.start()
+            started = time.monotonic()
+            for i in range(args.frames):
+                tracer.begin_frame(i, time.monotonic())
+                sender.send('w', (0.5, round(0.3 * math.sin(i / 10), 2)))  # a new velocity every frame
+                time.sleep(max(0.0, started + (i + 1) / args.fps - time.monotonic()))
+            hung = time.perf_counter()  # the vision loop stops; heartbeats carry on
+            time.sleep(args.max_age + args.deadman + 0.5)
+            sender.close()
+            time.sleep(0.2)
+
+        executed = [(received, packet) for received, packet in controller.velocities
+                    if not packet.heartbeat and not math.isnan(packet.capture_ts)]  # not the shutdown stop
+        latency = np.array([received - packet.capture_ts for received, packet in executed]) * 1000
+        stops = [t for t, command in controller.commands if command == 'x' and t > hung]
+        return {'sent': sender.stats['sent'] - 1,  # changed commands, without the shutdown stop
+                'executed': len({packet.capture_ts for _, packet in executed}),
+                'latency_ms': {'p50': round(float(np.percentile(latency, 50)), 1),
+                               'p95': round(float(np.percentile(latency, 95)), 1),
+                               'max': round(float(latency.max()), 1)},
+                'hang_to_stop_ms': round((stops[0] - hung) * 1000) if stops else None,
+                'link': dict(link.stats), 'controller': dict(controller.stats)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the TCP and UDP command transports through a lossy link")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--loss", type=float, default=0.05, help="probability a datagram / segment is lost")
+    parser.add_argument("--delay", type=float, default=0.005, help="one-way delay (s)")
+    parser.add_argument("--jitter", type=float, default=0.01, help="extra random delay, up to (s)")
+    parser.add_argument("--max-age", type=float, default=0.25)
+    parser.add_argument("--deadman", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for transport in ("tcp", "udp"):
+        result = run_link(transport, args)
+        print(f"[Link] {transport}: {result['executed']}/{result['sent']} changed commands executed, "
+              f"capture->execute {result['latency_ms']}, vision hang -> stop {result['hang_to_stop_ms']} ms")
+        print(f"[Link] {transport}: link {result['link']} | controller {result['controller']}")
@@ -0,0 +1,244 @@
+#Keyframe segmentation for planner.py
+#The UNet runs only on keyframes. In between, the last mask is carried forward
+#with dense optical flow (DIS, ultrafast preset) computed on a small grayscale
+#copy of the frame, which costs about a millisecond instead of a full UNet pass.
+#A new keyframe is forced when:
+#  - the flow residual (how badly the warped previous frame explains the new
+#    one) is too large, e.g. fast turns, occlusions, exposure changes
+#  - the propagated mask changed too much in one step or since the keyframe
+#  - the propagated mask would change the steering command (optional), so every
+#    command change is confirmed by the model on that same frame
+#  - the adaptive interval runs out. It grows while propagated masks keep
+#    matching the fresh ones at keyframes and shrinks when they drift
+#
+#Compare against running the UNet on every frame:
+#  python3 mask_propagation.py --random-weights --frames 120
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from mask_steering import command_from_centroid, path_centroid
+from tracing import span
+
+FLOW_SIZE = 128  # flow resolution (square, like the model input); 4x fewer pixels than the mask
+
+
+class KeyframeSegmenter:
+    """Wraps a segmenter (BGR frame -> 0/1 float32 mask) and only calls it on keyframes.
+
+    Calling it returns a mask of the segmenter's shape, owned by this object and
+    overwritten by the next call.
+    """
+
+    def __init__(self, segmenter, min_interval=1, max_interval=12, start_interval=4,
+                 max_residual=12.0, max_step_change=0.04, max_total_change=0.15,
+                 min_keyframe_iou=0.85, confirm_command_changes=True, flow_size=FLOW_SIZE):
+        self.segmenter = segmenter
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = start_interval
+        self.max_residual = max_residual  # mean absolute gray-level error after warping
+        self.max_step_change = max_step_change  # fraction of mask pixels flipped in one step
+        self.max_total_change = max_total_change  # ... or since the keyframe
+        self.min_keyframe_iou = min_keyframe_iou
+        self.confirm_command_changes = confirm_command_changes
+        self.flow_size = flow_size
+
+        self.flow = cv2.DISOpticalFlow_create(cv2.DISOPTICAL_FLOW_PRESET_ULTRAFAST)
+        self.gray = np.empty((flow_size, flow_size), dtype=np.uint8)
+        self.prev_gray = np.empty_like(self.gray)
+        self.warped_gray = np.empty_like(self.gray)
+        grid_x, grid_y = np.meshgrid(np.arange(flow_size, dtype=np.float32),
+                                     np.arange(flow_size, dtype=np.float32))
+        self.grid = np.dstack((grid_x, grid_y))
+        self.map = np.empty_like(self.grid)
+        self.flow_buffer = np.empty_like(self.grid)
+        self.mask_grid = None  # identity map at mask resolution, allocated on the first keyframe
+        self.mask_flow = None  # flow upscaled to mask resolution
+        self.mask_map = None
+
+        self.mask = None
+        self.keyframe_mask = None
+        self.warped = None
+        self.small_mask = np.empty((flow_size, flow_size), dtype=np.float32)
+        self.warped_small = np.empty_like(self.small_mask)
+        self.since_keyframe = 0
+        self.keyframe_command = None
+
+        self.frames = 0
+        self.keyframes = 0
+        self.reasons = {}
+
+    def _gray(self, frame):
+        small = cv2.resize(frame, (self.flow_size, self.flow_size), interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self.gray)
+
+    def _keyframe(self, frame, reason):
+        with span("keyframe"):
+            fresh = self.segmenter(frame)
+        if self.mask is None:
+            self.mask = np.empty_like(fresh)
+            self.keyframe_mask = np.empty_like(fresh)
+            self.warped = np.empty_like(fresh)
+            size = fresh.shape[1], fresh.shape[0]
+            grid_x, grid_y = np.meshgrid(np.arange(size[0], dtype=np.float32),
+                                         np.arange(size[1], dtype=np.float32))
+            self.mask_grid = np.dstack((grid_x, grid_y))
+            self.mask_flow = np.empty_like(self.mask_grid)
+            self.mask_map = np.empty_like(self.mask_grid)
+            self.mask_scale = np.array([size[0] / self.flow_size, size[1] / self.flow_size], dtype=np.float32)
+        elif reason != "start":
+            # Adapt the interval to how well propagation held up against the model
+            both = np.count_nonzero((fresh > 0.5) & (self.mask > 0.5))
+            either = np.count_nonzero((fresh > 0.5) | (self.mask > 0.5))
+            iou = both / either if either else 1.0
+            if iou >= self.min_keyframe_iou:
+                self.interval = min(self.max_interval, self.interval + 1)
+            else:
+                self.interval = max(self.min_interval, self.interval // 2)
+
+        np.copyto(self.mask, fresh)
+        np.copyto(self.keyframe_mask, fresh)
+        cv2.resize(fresh, (self.flow_size, self.flow_size), dst=self.small_mask, interpolation=cv2.INTER_AREA)
+        self.prev_gray, self.gray = self.gray, self.prev_gray
+        self.since_keyframe = 0
+        self.keyframe_command = command_from_centroid(*path_centroid(self.mask), self.mask.shape[1])
+        self.keyframes += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        return self.mask
+
+    def __call__(self, frame: np.ndarray) -> np.ndarray:
+        self.frames += 1
+        with span("flow"):
+            self._gray(frame)
+            if self.mask is None:
+                return self._keyframe(frame, "start")
+            if self.since_keyframe + 1 >= self.interval:
+                return self._keyframe(frame, "interval")
+
+            # Backward flow (current -> previous) so both the frame and the mask warp with one remap
+            flow = self.flow.calc(self.gray, self.prev_gray, self.flow_buffer)
+            np.add(self.grid, flow, out=self.map)
+            cv2.remap(self.prev_gray, self.map, None, cv2.INTER_LINEAR, dst=self.warped_gray)
+            residual = cv2.norm(self.gray, self.warped_gray, cv2.NORM_L1) / self.gray.size
+        if residual > self.max_residual:
+            return self._keyframe(frame, "residual")
+
+        with span("warp"):
+            cv2.remap(self.small_mask, self.map, None, cv2.INTER_LINEAR, dst=self.warped_small,
+                      borderMode=cv2.BORDER_REPLICATE)
+            step_change = cv2.norm(self.small_mask, self.warped_small, cv2.NORM_L1) / self.small_mask.size
+            if step_change > self.max_step_change:
+                return self._keyframe(frame, "step_change")
+
+            # Upscale only the displacement (an absolute map would be off by the pixel-center shift
+            # on every step, and the offsets accumulate), then add the full-resolution identity grid
+            cv2.resize(flow, (self.mask.shape[1], self.mask.shape[0]), dst=self.mask_flow,
+                       interpolation=cv2.INTER_LINEAR)
+            self.mask_flow *= self.mask_scale
+            np.add(self.mask_grid, self.mask_flow, out=self.mask_map)
+            warped = cv2.remap(self.mask, self.mask_map, None, cv2.INTER_LINEAR, dst=self.warped,
+                               borderMode=cv2.BORDER_REPLICATE)
+            cv2.threshold(warped, 0.5, 1.0, cv2.THRESH_BINARY, dst=warped)
+            total_change = cv2.norm(self.keyframe_mask, warped, cv2.NORM_L1) / warped.size
+            if total_change > self.max_total_change:
+                return self._keyframe(frame, "total_change")
+            if self.confirm_command_changes:
+                command = command_from_centroid(*path_centroid(warped), warped.shape[1])
+                if command != self.keyframe_command:
+                    return self._keyframe(frame, "command")
+
+        self.mask, self.warped = self.warped, self.mask
+        self.small_mask, self.warped_small = self.warped_small, self.small_mask
+        self.prev_gray, self.gray = self.gray, self.prev_gray
+        self.since_keyframe += 1
+        return self.mask
+
+    def report(self):
+        """Keyframe counts and the reasons they were forced."""
+        share = self.keyframes / self.frames if self.frames else 0.0
+        return {'frames': self.frames, 'keyframes': self.keyframes, 'keyframe_share': round(share, 3),
+                'interval': self.interval, 'reasons': dict(self.reasons)}
+
+
+def static_drift(steps=30, size=256):
+    """Propagate a mask over ``steps`` identical frames; returns (area before, area after, flipped pixels).
+
+    Nothing moves, so a correct warp leaves the mask exactly as the keyframe had it.
+    """
+    mask = np.zeros((size, size), dtype=np.float32)
+    cv2.rectangle(mask, (size // 4, size // 3), (size // 4 + 99, size // 3 + 79), 1.0, cv2.FILLED)
+    frame = draw_path(np.full((480, 640, 3), 40, dtype=np.uint8), mask)
+    keyframer = KeyframeSegmenter(lambda _: mask, start_interval=steps + 2, max_interval=steps + 2)
+    for _ in range(steps + 1):
+        result = keyframer(frame)
+    if keyframer.keyframes != 1:
+        raise RuntimeError(f"static scene forced keyframes: {keyframer.report()}")
+    return int(np.count_nonzero(mask)), int(np.count_nonzero(result > 0.5)), \
+        int(np.count_nonzero((mask > 0.5) != (result > 0.5)))
+
+
+def draw_path(frame, mask):
+    """Paint a textured path band from a 256x256 mask into a synthetic frame, so flow has something to track."""
+    h, w = frame.shape[:2]
+    big = cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST) > 0.5
+    texture = (np.indices((h, w)).sum(axis=0) // 8) % 2 * 60 + 120
+    frame[big] = texture[big, None].astype(np.uint8)
+    return frame
+
+
+if __name__ == "__main__":
+    from frame_source import SyntheticSource
+
+    parser = argparse.ArgumentParser(description="Compare keyframe propagation against per-frame segmentation")
+    parser.add_argument("--segmenter", choices=["truth", "model"], default="truth",
+                        help="truth replays the synthetic ground-truth masks; model runs the UNet")
+    parser.add_argument("--weights", default="unet_resnet34Final.pth")
+    parser.add_argument("--random-weights", action="store_true", help="run the model without a weights file")
+    parser.add_argument("--backend", default="onnx")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--max-interval", type=int, default=12)
+    args = parser.parse_args()
+
+    # Regression check: propagation over a static scene must not move or erode the mask
+    before, after, flipped = static_drift()
+    print(f"[Keyframe] static scene: mask area {before} -> {after} px after 30 propagated frames, "
+          f"{flipped} px flipped")
+    if flipped:
+        raise SystemExit("[Keyframe] propagated mask drifted on a static scene")
+
+    source = SyntheticSource(640, 480, count=args.frames).open()
+    frames, truth = [], {}
+    for _ in range(args.frames):
+        packet = source.get()
+        frames.append(draw_path(packet.getCvFrame(), packet.meta['mask']))
+        truth[id(frames[-1])] = packet.meta['mask']
+
+    if args.segmenter == "model":
+        from planner import Segmenter
+        segmenter = Segmenter(None if args.random_weights else args.weights, backend=args.backend)
+        segmenter(frames[0])  # warm up
+    else:
+        segmenter = lambda frame: truth[id(frame)]
+
+    started = time.perf_counter()
+    full = [segmenter(frame).copy() for frame in frames]
+    full_ms = (time.perf_counter() - started) * 1000 / len(frames)
+
+    keyframer = KeyframeSegmenter(segmenter, max_interval=args.max_interval)
+    started = time.perf_counter()
+    incremental = [keyframer(frame).copy() for frame in frames]
+    incremental_ms = (time.perf_counter() - started) * 1000 / len(frames)
+
+    commands = [(command_from_centroid(*path_centroid(a), 256), command_from_centroid(*path_centroid(b), 256))
+                for a, b in zip(full, incremental)]
+    agree = sum(a == b for a, b in commands) / len(commands)
+    ious = [np.count_nonzero((a > 0.5) & (b > 0.5)) / max(1, np.count_nonzero((a > 0.5) | (b > 0.5)))
+            for a, b in zip(full, incremental)]
+
+    print(f"[Keyframe] every frame {full_ms:7.2f} ms/frame, keyframed {incremental_ms:7.2f} ms/frame "
+          f"({args.segmenter} segmenter)")
+    print(f"[Keyframe] {agree * 100:.1f}% same commands, mean IoU {np.mean(ious):.3f}, {keyframer.report()}")
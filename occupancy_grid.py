@@ -0,0 +1,339 @@
+#Rolling 2D occupancy grid around the Amiga, built from the stereo depth stream
+#Every depth pixel's ray is cached once (forward / left / up metres per metre of
+#depth, for the camera's intrinsics, mounting height and pitch), so projecting
+#a frame is three multiplies on a strided view plus one np.bincount into the
+#grid. Points between MIN_HEIGHT and MAX_HEIGHT above the floor are obstacles;
+#the floor and the space in front of the nearest obstacle in each image column
+#clear cells again. Old evidence decays with a half-life, and the grid is
+#dead-reckoned from the commands actually sent, so obstacles that have left the
+#camera's view (beside or behind the robot) are still there when reversing or
+#turning. Free-space checks for a command are summed-area table lookups
+#update() runs on the follower's detect thread and is_free() on its decide thread:
+#each update builds a new summed-area table and publishes it with one reference
+#swap, so a check never sees a half-written table
+#
+#The grid is robot-centred, forward up, left to the left (like a top-down view)
+#
+#Build cost at 720p and a turn-around scenario:
+#  python3 occupancy_grid.py
+
+import argparse
+import math
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from velocity_protocol import ANGULAR_SPEED, COMMAND_TWIST
+
+# Amiga footprint and camera mounting, in metres
+ROBOT_LENGTH = 1.2
+ROBOT_WIDTH = 1.0
+CAMERA_FORWARD = 0.6   # camera ahead of the robot centre (front bumper)
+CAMERA_HEIGHT = 1.0
+CAMERA_PITCH = 0.0     # radians, positive tilts the camera down
+
+# What counts as an obstacle
+MIN_HEIGHT = 0.15   # above the floor: curbs, rows, feet
+MAX_HEIGHT = 1.8    # below this: anything the robot would hit
+
+GUARDED = ('a', 'd', 's')  # commands guard() checks against the grid
+
+COLOR_HFOV = 69.0   # degrees, CAM_A preview; used when no calibration is given
+
+
+def intrinsics_from_device(device, size, socket=None):
+    """(fx, fy, cx, cy) of the camera the depth is aligned to, at size (width, height)."""
+    import depthai as dai
+
+    socket = dai.CameraBoardSocket.CAM_A if socket is None else socket
+    matrix = device.readCalibration().getCameraIntrinsics(socket, *size)
+    return matrix[0][0], matrix[1][1], matrix[0][2], matrix[1][2]
+
+
+def intrinsics_from_hfov(size, hfov_deg=COLOR_HFOV):
+    """Pinhole intrinsics from a horizontal field of view, for when there is no calibration."""
+    w, h = size
+    f = w / 2 / math.tan(math.radians(hfov_deg) / 2)
+    return f, f, (w - 1) / 2, (h - 1) / 2
+
+
+class OccupancyGrid:
+    """Robot-centred occupancy evidence from depth frames, dead-reckoned from commands.
+
+    update(depth_mm) projects a uint16 depth frame (mm) into the grid;
+    drive(command) sets the motion assumed until the next update;
+    is_free(command) says whether the cells that command would sweep are clear.
+    Unobserved cells count as free: the grid only blocks on obstacles it has seen.
+    update() and draw() hold a lock (pose and occupancy change in place);
+    is_free() reads the published summed-area table without one.
+    """
+
+    def __init__(self, size_m=10.0, cell_m=0.1, intrinsics=None, stride=4, max_range=8.0,
+                 half_life=10.0, hit_gain=0.6, free_factor=0.5, threshold=0.5, min_points=3,
+                 clearance=0.8, margin=0.15):
+        self.cell = cell_m
+        self.n = int(round(size_m / cell_m))
+        self.center = (self.n - 1) / 2  # pixel coordinate of the robot centre
+        self.intrinsics = intrinsics
+        self.stride = stride
+        self.max_range = max_range
+        self.half_life = half_life
+        self.hit_gain = hit_gain
+        self.free_factor = free_factor
+        self.threshold = threshold
+        self.min_points = min_points
+
+        self.occupancy = np.zeros((self.n, self.n), dtype=np.float32)
+        self.integral = np.zeros((self.n + 1, self.n + 1), dtype=np.int32)  # replaced, never written in place
+        self._lock = threading.Lock()
+        self.rays = None  # per-pixel (forward, left, up) coefficients for one depth frame shape
+        self.columns = None  # per-cell image column and forward distance, for clearing
+
+        # Motion since the grid was last re-sampled: the robot's pose in the grid frame
+        self.pose = [0.0, 0.0, 0.0]  # x, y, heading
+        self.twist = COMMAND_TWIST['x']
+        self.last_time = None
+
+        # Cells each command sweeps, as (row0, col0, row1, col1) boxes; in-place turns sweep a ring
+        half_l, half_w = ROBOT_LENGTH / 2, ROBOT_WIDTH / 2
+        radius = math.hypot(half_l, half_w) + margin
+        self.regions = {
+            'w': [self._box(half_l, half_l + clearance, -half_w - margin, half_w + margin)],
+            's': [self._box(-half_l - clearance, -half_l, -half_w - margin, half_w + margin)],
+        }
+        self.regions['a'] = self.regions['d'] = [
+            self._box(half_l, radius, -radius, radius),
+            self._box(-radius, -half_l, -radius, radius),
+            self._box(-half_l, half_l, half_w, radius),
+            self._box(-half_l, half_l, -radius, -half_w),
+        ]
+        self.stats = {'updates': 0, 'blocked': dict.fromkeys('wsad', 0)}
+
+    def _cell(self, x, y):
+        """(row, col) of a robot-frame point; forward is up, left is left."""
+        return math.floor(self.center + 0.5 - x / self.cell), math.floor(self.center + 0.5 - y / self.cell)
+
+    def _box(self, x0, x1, y0, y1):
+        r0, c0 = self._cell(x1, y1)
+        r1, c1 = self._cell(x0, y0)
+        clip = lambda v: min(max(v, 0), self.n)
+        return clip(r0), clip(c0), clip(r1 + 1), clip(c1 + 1)
+
+    def _cache_rays(self, shape):
+        """Forward/left/up metres per metre of depth for every strided pixel, and the clearing tables."""
+        h, w = shape
+        fx, fy, cx, cy = self.intrinsics or intrinsics_from_hfov((w, h))
+        u = np.arange(self.stride // 2, w, self.stride, dtype=np.float32)
+        v = np.arange(self.stride // 2, h, self.stride, dtype=np.float32)
+        right = np.broadcast_to((u - cx) / fx, (len(v), len(u)))
+        down = np.broadcast_to(((v - cy) / fy)[:, None], (len(v), len(u)))
+        cos_p, sin_p = math.cos(CAMERA_PITCH), math.sin(CAMERA_PITCH)
+        self.rays = (np.ascontiguousarray(cos_p - down * sin_p),   # forward
+                     np.ascontiguousarray(-right),                 # left
+                     np.ascontiguousarray(-down * cos_p - sin_p))  # up
+        self.depth_m = np.empty((len(v), len(u)), dtype=np.float32)
+
+        # For clearing: which strided image column each cell centre falls in, and its distance ahead
+        rows, cols = np.mgrid[0:self.n, 0:self.n].astype(np.float32)
+        ahead = (self.center - rows) * self.cell - CAMERA_FORWARD
+        left = (self.center - cols) * self.cell
+        with np.errstate(divide='ignore', invalid='ignore'):
+            column = np.round((cx - fx * left / ahead - self.stride // 2) / self.stride)
+        inside = (ahead > 0) & (column >= 0) & (column < len(u))
+        self.columns = (np.where(inside, column, 0).astype(np.intp), np.where(inside, ahead, np.inf))
+        self.frustum = inside
+
+    def drive(self, command, velocity=None):
+        """Motion to dead-reckon until the next update: the command (and velocity) just sent to the robot."""
+        # One tuple assignment, read once per update by _move(); no lock, so sending never waits on an update
+        self.twist = velocity if velocity is not None else COMMAND_TWIST.get(command, COMMAND_TWIST['x'])
+
+    def _move(self, now):
+        """Integrate the current twist; re-sample the grid once the robot has moved a cell or turned 2 degrees."""
+        dt = 0.0 if self.last_time is None else now - self.last_time
+        self.last_time = now
+        if dt <= 0:
+            return 0.0
+        v, omega = self.twist
+        x, y, heading = self.pose
+        heading += omega * dt / 2
+        x += v * dt * math.cos(heading)
+        y += v * dt * math.sin(heading)
+        heading += omega * dt / 2
+        self.pose = [x, y, heading]
+        if math.hypot(x, y) >= self.cell or abs(heading) >= math.radians(2):
+            # Grid point p (new frame) sits at R(heading) p + (x, y) in the old frame; in pixels:
+            s, c0 = self.cell, self.center
+            to_metric = np.array([[0, -s, c0 * s], [-s, 0, c0 * s], [0, 0, 1]], dtype=np.float64)
+            cos_h, sin_h = math.cos(heading), math.sin(heading)
+            motion = np.array([[cos_h, -sin_h, x], [sin_h, cos_h, y], [0, 0, 1]], dtype=np.float64)
+            warp = np.linalg.inv(to_metric) @ motion @ to_metric
+            # Nearest keeps obstacle edges sharp; the residual motion stays in self.pose
+            self.occupancy = cv2.warpAffine(self.occupancy, warp[:2], (self.n, self.n),
+                                            flags=cv2.INTER_NEAREST | cv2.WARP_INVERSE_MAP, borderValue=0)
+            self.pose = [0.0, 0.0, 0.0]
+        return dt
+
+    def update(self, depth_mm: np.ndarray, timestamp=None):
+        """Dead-reckon to `timestamp` (seconds, default now) and add one depth frame's evidence."""
+        with self._lock:
+            return self._update(depth_mm, timestamp)
+
+    def _update(self, depth_mm, timestamp):
+        dt = self._move(time.monotonic() if timestamp is None else timestamp)
+        if self.rays is None or self.depth_m.shape != depth_mm[::self.stride, ::self.stride].shape:
+            self._cache_rays(depth_mm.shape)
+        if dt > 0:
+            self.occupancy *= 0.5 ** (dt / self.half_life)
+
+        # Project the strided depth through the cached rays (robot frame, metres)
+        forward_ray, left_ray, up_ray = self.rays
+        z = self.depth_m
+        np.multiply(depth_mm[self.stride // 2::self.stride, self.stride // 2::self.stride], 0.001, out=z,
+                    casting='unsafe')
+        forward = z * forward_ray
+        height = z * up_ray
+        height += CAMERA_HEIGHT
+        valid = (z > 0.2) & (z < self.max_range)
+        obstacle = valid & (height > MIN_HEIGHT) & (height < MAX_HEIGHT)
+
+        # Into the grid frame (the robot may have moved a little since the last re-sample)
+        x0, y0, heading = self.pose
+        fx = forward[obstacle] + CAMERA_FORWARD
+        fy = z[obstacle] * left_ray[obstacle]
+        if heading:
+            cos_h, sin_h = math.cos(heading), math.sin(heading)
+            fx, fy = cos_h * fx - sin_h * fy, sin_h * fx + cos_h * fy
+        rows = np.floor(self.center + 0.5 - (fx + x0) / self.cell).astype(np.intp)
+        cols = np.floor(self.center + 0.5 - (fy + y0) / self.cell).astype(np.intp)
+        keep = (rows >= 0) & (rows < self.n) & (cols >= 0) & (cols < self.n)
+        counts = np.bincount(rows[keep] * self.n + cols[keep], minlength=self.n * self.n)
+        hits = (counts >= self.min_points).reshape(self.n, self.n)
+
+        # Clear cells in front of the nearest obstacle (or the farthest valid depth) in each image column
+        nearest = np.where(obstacle, forward, np.inf).min(axis=0)
+        farthest = np.where(valid, forward, 0).max(axis=0)
+        reach = np.minimum(nearest, farthest) - 2 * self.cell
+        column, ahead = self.columns
+        free = self.frustum & (ahead < reach[column]) & ~hits
+
+        self.occupancy[free] *= self.free_factor
+        self.occupancy[hits] = np.minimum(self.occupancy[hits] + self.hit_gain, 1.0)
+        # A fresh table, published by one reference swap while is_free() may be reading the old one
+        self.integral = cv2.integral((self.occupancy >= self.threshold).view(np.uint8), sdepth=cv2.CV_32S)
+        self.stats['updates'] += 1
+        return self
+
+    def occupied(self, box, table=None):
+        """Occupied cells in a (row0, col0, row1, col1) box: four lookups in `table` (the current one by default)."""
+        r0, c0, r1, c1 = box
+        t = self.integral if table is None else table
+        return int(t[r1, c1] - t[r0, c1] - t[r1, c0] + t[r0, c0])
+
+    def is_free(self, command):
+        """Whether the cells `command` sweeps are clear ('x' and unknown commands always are)."""
+        regions = self.regions.get(command)
+        if regions is None:
+            return True
+        table = self.integral  # every box checked against the same published table
+        if any(self.occupied(box, table) for box in regions):
+            self.stats['blocked'][command] += 1
+            return False
+        return True
+
+    def draw(self, scale=4):
+        """Top-down BGR view: obstacles white, robot footprint green."""
+        with self._lock:
+            view = cv2.cvtColor((np.minimum(self.occupancy, 1) * 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+        view = cv2.resize(view, (self.n * scale, self.n * scale), interpolation=cv2.INTER_NEAREST)
+        r0, c0 = self._cell(ROBOT_LENGTH / 2, ROBOT_WIDTH / 2)
+        r1, c1 = self._cell(-ROBOT_LENGTH / 2, -ROBOT_WIDTH / 2)
+        cv2.rectangle(view, (c0 * scale, r0 * scale), ((c1 + 1) * scale, (r1 + 1) * scale), (0, 255, 0), 1)
+        return view
+
+    def report(self):
+        return {'updates': self.stats['updates'], 'blocked': dict(self.stats['blocked'])}
+
+
+def guard(grid, command):
+    """`command`, or 'x' if it would turn or reverse the robot into an obstacle on the grid.
+
+    'w' is not checked: the followers drive forward toward the person, who is
+    the obstacle ahead.
+    """
+    if grid is None or command not in GUARDED or grid.is_free(command):
+        return command
+    return 'x'
+
+
+def render_depth(size, boxes, pose=(0.0, 0.0, 0.0), intrinsics=None):
+    """Depth frame (mm) of a flat floor plus upright boxes (x0, x1, y0, y1, height) seen from the robot pose (x, y, heading)."""
+    w, h = size
+    grid = OccupancyGrid(intrinsics=intrinsics, stride=1)
+    grid._cache_rays((h, w))
+    forward, left, up = grid.rays
+    x, y, heading = pose
+    cos_h, sin_h = math.cos(heading), math.sin(heading)
+    # Camera position and per-pixel ray directions in the world frame
+    ox, oy = x + CAMERA_FORWARD * cos_h, y + CAMERA_FORWARD * sin_h
+    dx, dy = cos_h * forward - sin_h * left, sin_h * forward + cos_h * left
+    with np.errstate(divide='ignore', invalid='ignore'):
+        depth = np.where(up < 0, CAMERA_HEIGHT / -up, np.inf)  # floor
+        for x0, x1, y0, y1, top in boxes:
+            faces = [(dx, ox, x0, dy, oy, y0, y1), (dx, ox, x1, dy, oy, y0, y1),
+                     (dy, oy, y0, dx, ox, x0, x1), (dy, oy, y1, dx, ox, x0, x1)]
+            for d_plane, o_plane, plane, d_side, o_side, lo, hi in faces:
+                z = (plane - o_plane) / d_plane
+                side, height = o_side + z * d_side, CAMERA_HEIGHT + z * up
+                face = (z > 0) & (side >= lo) & (side <= hi) & (height >= 0) & (height <= top)
+                depth = np.where(face & (z < depth), z, depth)
+    depth = np.where(depth < 20, depth * 1000, 0)
+    return depth.astype(np.uint16)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the occupancy grid and replay a turn-around")
+    parser.add_argument("--frames", type=int, default=100)
+    args = parser.parse_args()
+
+    # A crate ahead and to the left, far enough out for the camera to see it
+    crate = (3.0, 3.4, -0.2, 0.8, 1.0)
+    for name, size in (("400p", (640, 400)), ("720p", (1280, 720))):
+        depth = render_depth(size, [crate])
+        grid = OccupancyGrid()
+        started = time.perf_counter()
+        for i in range(args.frames):
+            grid.update(depth, timestamp=i / 30)
+        build_ms = (time.perf_counter() - started) * 1000 / args.frames
+        started = time.perf_counter()
+        for _ in range(1000):
+            grid.is_free('s')
+        query_us = (time.perf_counter() - started) * 1000
+        print(f"[Grid] {name}: update {build_ms:.2f} ms/frame (budget {1000 / 30:.1f} ms at 30 fps), "
+              f"free-space query {query_us:.1f} us")
+
+    # See the crate, turn around (it leaves the camera's view), then reverse toward it
+    grid = OccupancyGrid()
+    x = y = heading = t = 0.0
+
+    def step(command, frames=1):
+        global x, y, heading, t
+        for _ in range(frames):
+            grid.update(render_depth((1280, 720), [crate], (x, y, heading)), timestamp=t)
+            grid.drive(command)
+            v, omega = COMMAND_TWIST[command]
+            x, y, heading, t = x + v * math.cos(heading) / 30, y + v * math.sin(heading) / 30, \
+                heading + omega / 30, t + 1 / 30
+
+    step('x', 15)
+    step('a', round(math.pi / ANGULAR_SPEED * 30))
+    start_x = x
+    while grid.is_free('s') and abs(x - start_x) < 5:
+        step('s')
+    step('x')
+    gap = crate[0] - x - ROBOT_LENGTH / 2
+    print(f"[Grid] crate seen ahead at {crate[0]:.1f} m, turned around, reversed {abs(x - start_x):.2f} m "
+          f"before 's' was blocked ({gap:.2f} m from the rear bumper to the crate)")
+    print(f"[Grid] {grid.report()}")
@@ -0,0 +1,140 @@
+#Combined pose + hands perception for fist_follow.py
+#The frame is converted BGR->RGB once into a reused buffer and that one RGB
+#image feeds every MediaPipe graph:
+#  holistic - mp.solutions.holistic: pose and both hands in a single pass. The
+#             hand landmarks come from crops the pose already located, so no
+#             separate palm detector runs
+#  shared   - mp.solutions.pose and mp.solutions.hands on the same RGB buffer
+#             (what cvzone's findPose + a second cvtColor + Hands.process did,
+#             minus the extra conversion)
+#Landmarks are copied into NumPy arrays once; fist state and hand boxes for all
+#hands are computed with array operations instead of per-landmark Python lists
+
+from dataclasses import dataclass, field
+
+import cv2
+import numpy as np
+
+from tracing import span
+
+MODES = ("holistic", "shared")
+
+FINGER_TIPS = [8, 12, 16, 20]
+FINGER_PIPS = [6, 10, 14, 18]
+
+
+@dataclass
+class PoseHands:
+    """One frame of perception, in pixel coordinates."""
+    lmList: list = field(default_factory=list)  # cvzone-style [[x, y, z], ...] for the 33 pose landmarks
+    bboxInfo: dict = None  # cvzone-style {'bbox': (x, y, w, h), 'center': (cx, cy)}
+    hands: np.ndarray = None  # (n, 21, 2) hand landmarks
+    hand_boxes: np.ndarray = None  # (n, 4) x1, y1, x2, y2
+    fists: np.ndarray = None  # (n,) bool
+    pose_landmarks: object = None  # MediaPipe landmark list, kept for drawing
+
+
+def landmark_array(landmarks, columns=2):
+    """(n, columns) float32 array of normalized x, y(, z) from a MediaPipe landmark list."""
+    points = landmarks.landmark
+    flat = np.fromiter((v for lm in points for v in (lm.x, lm.y, lm.z)[:columns]),
+                       dtype=np.float32, count=len(points) * columns)
+    return flat.reshape(len(points), columns)
+
+
+def fist_mask(hands):
+    """(n,) bool: every fingertip below its PIP joint (image y grows downward)."""
+    return (hands[:, FINGER_TIPS, 1] > hands[:, FINGER_PIPS, 1]).all(axis=1)
+
+
+def hand_boxes(hands):
+    """(n, 4) int boxes x1, y1, x2, y2 around each hand's landmarks."""
+    return np.concatenate((hands.min(axis=1), hands.max(axis=1)), axis=1).astype(np.int32)
+
+
+def pose_bbox(lm):
+    """Body box built the way cvzone's findPosition(bboxWithHands=True) does, from an (33, 2+) pixel array."""
+    ad = abs(int(lm[12, 0]) - int(lm[11, 0])) // 2
+    x1, x2 = int(lm[16, 0]) - ad, int(lm[15, 0]) + ad
+    y1, y2 = int(lm[1, 1]) - ad, int(lm[29, 1]) + ad
+    bbox = (x1, y1, x2 - x1, y2 - y1)
+    return {'bbox': bbox, 'center': (bbox[0] + bbox[2] // 2, bbox[1] + bbox[3] // 2)}
+
+
+class PoseHandsPerception:
+    """Pose and hand landmarks from one BGR frame with a single colour conversion."""
+
+    def __init__(self, mode="holistic", max_hands=2, detection_confidence=0.5, tracking_confidence=0.5,
+                 static_image_mode=False):
+        import mediapipe as mp
+
+        if mode not in MODES:
+            raise ValueError(f"Unknown perception mode {mode!r}, expected one of {MODES}")
+        self.mode = mode
+        self.max_hands = max_hands
+        self.detection_confidence = detection_confidence
+        self.tracking_confidence = tracking_confidence
+        self.static_image_mode = static_image_mode  # detect on every frame instead of tracking from the last
+        self.mp = mp
+        self.rgb = None
+        if mode == "holistic":
+            self.holistic = mp.solutions.holistic.Holistic(static_image_mode=static_image_mode,
+                                                           min_detection_confidence=detection_confidence,
+                                                           min_tracking_confidence=tracking_confidence)
+        else:
+            self.pose = mp.solutions.pose.Pose(static_image_mode=static_image_mode,
+                                               min_detection_confidence=detection_confidence,
+                                               min_tracking_confidence=tracking_confidence)
+            self.hands = mp.solutions.hands.Hands(static_image_mode=static_image_mode,
+                                                  max_num_hands=max_hands,
+                                                  min_detection_confidence=detection_confidence,
+                                                  min_tracking_confidence=tracking_confidence)
+
+    def _to_rgb(self, frame):
+        if self.rgb is None or self.rgb.shape != frame.shape:
+            self.rgb = np.empty_like(frame)
+        self.rgb.flags.writeable = True
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.rgb)
+        self.rgb.flags.writeable = False  # lets MediaPipe take the buffer by reference
+        return self.rgb
+
+    def __call__(self, frame: np.ndarray) -> PoseHands:
+        h, w = frame.shape[:2]
+        with span("cvtColor"):
+            rgb = self._to_rgb(frame)
+
+        if self.mode == "holistic":
+            with span("holistic.process"):
+                results = self.holistic.process(rgb)
+            pose_landmarks = results.pose_landmarks
+            hand_landmarks = [hand for hand in (results.left_hand_landmarks, results.right_hand_landmarks)
+                              if hand is not None]
+        else:
+            with span("pose.process"):
+                pose_landmarks = self.pose.process(rgb).pose_landmarks
+            with span("hands.process"):
+                hand_landmarks = self.hands.process(rgb).multi_hand_landmarks or []
+
+        scale = np.array([w, h], dtype=np.float32)
+        result = PoseHands(pose_landmarks=pose_landmarks)
+        if pose_landmarks is not None:
+            pose = landmark_array(pose_landmarks, 3) * np.array([w, h, w], dtype=np.float32)
+            result.lmList = pose.astype(np.int32).tolist()
+            result.bboxInfo = pose_bbox(pose)
+
+        if hand_landmarks:
+            result.hands = np.stack([landmark_array(hand) for hand in hand_landmarks]) * scale
+        else:
+            result.hands = np.empty((0, 21, 2), dtype=np.float32)
+        result.hand_boxes = hand_boxes(result.hands)
+        result.fists = fist_mask(result.hands)
+        return result
+
+    def draw(self, img, result: PoseHands, hand_color=(255, 0, 255)):
+        """Pose skeleton (like cvzone's findPose) and a box around each hand."""
+        if result.pose_landmarks is not None:
+            self.mp.solutions.drawing_utils.draw_landmarks(img, result.pose_landmarks,
+                                                           self.mp.solutions.pose.POSE_CONNECTIONS)
+        for x1, y1, x2, y2 in result.hand_boxes:
+            cv2.rectangle(img, (int(x1), int(y1)), (int(x2), int(y2)), hand_color, 2)
+        return img
@@ -1,48 +1,88 @@
 import cv2
-import torch
 import numpy as np
-import socket
-from torchvision import transforms
-import depthai as dai
-import segmentation_models_pytorch as smp
-from PIL import Image
+from command_sender import CommandSender
+from detection_cache import cached
+from frame_scheduler import DeadlineScheduler, latest_frame
+from frame_source import DepthAISource
+from mask_steering import command_from_centroid, path_centroid
+from planner_preprocess import Preprocessor
+from session_recorder import recorder_from_env
+from startup import Startup, warm_up
+from tracing import span, tracer
+from velocity_protocol import proportional
 
 # TCP Settings
 ROBOT_IP = "100.87.161.11"
 PORT = 9999
+PROTOCOL = "legacy"  # or "binary": velocity messages steering in proportion to the path offset (velocity_protocol.py)
+TRANSPORT = "tcp"    # or "udp": one datagram per message, binary protocol only (command_sender.py)
+
+# Camera preview size (field of view); the camera squashes it to the model's 256x256 input
+frame_width = 640
+frame_height = 480
+INFER_SIZE = (256, 256)
+DISPLAY_SIZE = None  # e.g. (640, 480) to overlay the mask on a separate, sharper display stream
+DISPLAY_EVERY = 2    # display stream carries every Nth camera frame
+LATENCY_BUDGET = 0.15  # seconds capture -> command before drawing is shed (frame_scheduler.py)
+SHED_ORDER = ("draw",)  # no hand pass, and the UNet input is 256x256 whatever the frame size
+
+MODEL_PATH = "unet_resnet34Final.pth"
+
+# Inference backend: "eager", "torchscript" or "onnx" (see planner_engine.py)
+INFERENCE_BACKEND = "torchscript"
+INFERENCE_THREADS = None  # None keeps the torch / ONNX Runtime default
+
+# Run the UNet only on keyframes and carry the mask forward with optical flow in between
+# (see mask_propagation.py); False segments every frame
+KEYFRAME_MODE = True
+KEYFRAME_MAX_INTERVAL = 12  # frames between forced keyframes, at most
+
+
+class Segmenter:
+    """UNet ResNet34 path segmentation; calling it on a BGR frame returns a 256x256 0/1 mask.
+
+    The returned mask is the engine's output buffer and is overwritten by the next call.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, backend=INFERENCE_BACKEND, threads=INFERENCE_THREADS):
+        from planner_engine import create_engine
+
+        self.model_path = model_path  # with the backend, what the detection cache keys on
+        self.backend = backend
+
+        # Sigmoid + threshold are folded into the engine's graph
+        self.engine = create_engine(backend, model_path, threads)
+
+        # Resize, CLAHE, sharpening and ResNet34 normalization in one pass at 256x256
+        self.preprocess = Preprocessor()
+
+    def __call__(self, frame: np.ndarray) -> np.ndarray:
+        with span("preprocess"):
+            # --- Preprocess input to improve segmentation, straight into the engine's input buffer ---
+            self.preprocess(frame, self.engine.input[0])
+
+        with span("unet"):
+            return self.engine.run()
+
+    def steer(self, frame: np.ndarray):
+        """Return the path centroid (count, mean x) without copying the mask to the host."""
+        with span("preprocess"):
+            self.preprocess(frame, self.engine.input[0])
+
+        with span("unet"):
+            return self.engine.steer()
+
+    def last_mask(self) -> np.ndarray:
+        """Mask behind the last steer() call, fetched only when something needs to draw it."""
+        with span("mask_to_host"):
+            return self.engine.fetch_mask()
 
-# Load UNet ResNet34 model
-model = smp.Unet(
-    encoder_name="resnet34",
-    encoder_weights=None,
-    in_channels=3,
-    classes=1,
-)
-model.load_state_dict(torch.load("unet_resnet34Final.pth", map_location=torch.device("cpu")))
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model.to(device)
-model.eval()
-
-# Image transform (standard normalization for ResNet34)
-transform = transforms.Compose([
-    transforms.Resize((256, 256)),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                         std=[0.229, 0.224, 0.225]),
-])
-
-# DepthAI pipeline setup
-pipeline = dai.Pipeline()
-cam_rgb = pipeline.createColorCamera()
-cam_rgb.setPreviewSize(640, 480)
-cam_rgb.setInterleaved(False)
-cam_rgb.setBoardSocket(dai.CameraBoardSocket.RGB)
-xout = pipeline.createXLinkOut()
-xout.setStreamName("video")
-cam_rgb.preview.link(xout.input)
 
 def enhance_input_image(frame: np.ndarray) -> np.ndarray:
-    """Apply CLAHE and sharpening to enhance contrast and edges."""
+    """Apply CLAHE and sharpening to enhance contrast and edges.
+
+    Full-resolution reference version; the live path uses planner_preprocess.Preprocessor.
+    """
     lab = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
     l, a, b = cv2.split(lab)
 
@@ -62,76 +102,125 @@ def enhance_input_image(frame: np.ndarray) -> np.ndarray:
 
 def determine_command_from_mask(mask: np.ndarray) -> str:
     """Returns 'w', 'a', 'd', or 'x' based on path position in the mask."""
-    h, w = mask.shape
-    roi = mask[h//2:, :]
-    coords = np.column_stack(np.where(roi > 0.5))
-    
-    if coords.size == 0:
-        return "x"  # No path visible → stop
-
-    avg_x = np.mean(coords[:, 1])
-    center_x = w / 2
-    offset = avg_x - center_x
-
-    # Define pixel thresholds to avoid noise
-    tolerance = 30  # pixels left/right of center is still "straight"
-    if abs(offset) < tolerance:
-        return "w"
-    elif offset < 0:
-        return "a"
-    else:
-        return "d"
-
-def send_command(sock: socket.socket, cmd: str):
-    """Send w/a/s/d/x command as a single character."""
-    try:
-        sock.sendall(cmd.encode())
-        print(f"[COMMAND] Sent: {cmd}")
-    except Exception as e:
-        print(f"[TCP ERROR] {e}")
+    # Column sums of the bottom half give the path centroid without coordinate arrays
+    count, avg_x = path_centroid(mask)
+    return command_from_centroid(count, avg_x, mask.shape[1])
+
+def build_detect(state, show=True):
+    """Load the segmentation model and return detect(frame) -> (frame, detection).
+
+    detection['path'] is the (count, mean x) centroid; detection['mask'] is only
+    fetched from the model when show is True (always, in keyframe mode).
+    """
+    segmenter = cached(warm_up(Segmenter(), INFER_SIZE))
+
+    if KEYFRAME_MODE:
+        from mask_propagation import KeyframeSegmenter
+
+        keyframer = state['keyframer'] = KeyframeSegmenter(segmenter, max_interval=KEYFRAME_MAX_INTERVAL)
+
+        def detect(frame):
+            mask = keyframer(frame)
+            return frame, {'path': path_centroid(mask), 'width': 256, 'mask': mask}
+        return detect
+
+    def detect(frame):
+        detection = {'path': segmenter.steer(frame), 'width': 256}
+        if show:
+            detection['mask'] = segmenter.last_mask()
+        return frame, detection
+    return detect
+
+def decide(detection, state):
+    """Return (command, None) from the path centroid or mask, matching the follower decide() interface."""
+    if 'path' in detection:
+        return command_from_centroid(*detection['path'], detection['width']), None
+    return determine_command_from_mask(detection['mask']), None
+
+def path_velocity(detection, command):
+    """Proportional (linear, angular) for `command` from the path centroid's offset; None without one."""
+    path = detection.get('path')
+    if path is None or path[1] is None:
+        return None
+    return proportional(command, path[1] / detection['width'] - 0.5)
+
+def draw_overlay(frame: np.ndarray, mask_np: np.ndarray) -> np.ndarray:
+    """Blend the path mask over the camera frame."""
+    color_mask = (mask_np * 255).astype(np.uint8)
+    color_mask = cv2.cvtColor(color_mask, cv2.COLOR_GRAY2BGR)
+    color_mask = cv2.resize(color_mask, (frame.shape[1], frame.shape[0]))
+    return cv2.addWeighted(frame, 0.7, color_mask, 0.3, 0)
 
 def main():
-    with dai.Device(pipeline) as dai_device, \
-         socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-
-        print(f"[Planner] Connecting to controller at {ROBOT_IP}:{PORT} ...")
-        s.connect((ROBOT_IP, PORT))
-        print("[Planner] Connected!")
-
-        video_queue = dai_device.getOutputQueue(name="video", maxSize=4, blocking=False)
+    startup = Startup("Planner")
 
-        while True:
-            in_frame = video_queue.get()
-            frame = in_frame.getCvFrame()
+    # Connects (and reconnects) in the background, while the camera and model start up;
+    # commands only go out when they change
+    print(f"[Planner] Connecting to controller at {ROBOT_IP}:{PORT} ...")
+    sender = CommandSender(ROBOT_IP, PORT, name="Planner", protocol=PROTOCOL, transport=TRANSPORT).start()
+    send = startup.watch(sender)
 
-            # --- Preprocess input to improve segmentation ---
-            enhanced_frame = enhance_input_image(frame)
+    state = {}
+    scheduler = DeadlineScheduler(LATENCY_BUDGET, order=SHED_ORDER)
+    stale_frames = 0  # queued behind a newer frame and never processed
+    recorder = recorder_from_env()  # FOLLOW_RECORD=run.session records frames, masks and commands
 
-            # Convert to PIL Image and prepare input tensor
-            input_pil = Image.fromarray(cv2.cvtColor(enhanced_frame, cv2.COLOR_BGR2RGB))
-            input_tensor = transform(input_pil).unsqueeze(0).to(device)
-
-            with torch.no_grad():
-                output = model(input_tensor)
-                output = torch.sigmoid(output)
-                mask = (output > 0.5).float()
-                mask_np = mask.squeeze().cpu().numpy()
-
-            # Decide on command
-            command = determine_command_from_mask(mask_np)
-            send_command(s, command)
-
-            # Show overlay
-            color_mask = (mask_np * 255).astype(np.uint8)
-            color_mask = cv2.cvtColor(color_mask, cv2.COLOR_GRAY2BGR)
-            color_mask = cv2.resize(color_mask, (frame.shape[1], frame.shape[0]))
-            overlay = cv2.addWeighted(frame, 0.7, color_mask, 0.3, 0)
-            cv2.imshow("Segmented View", overlay)
-
-            if cv2.waitKey(1) == ord('q'):
-                break
-
-        cv2.destroyAllWindows()
+    try:
+        # Open the camera and load the UNet (torch import, weights, tracing) at the same time
+        camera = DepthAISource(frame_width, frame_height, infer_size=INFER_SIZE, display_size=DISPLAY_SIZE,
+                              display_every=DISPLAY_EVERY)
+        detect = startup.run(camera=camera.open, detector=lambda: build_detect(state))['detector']
+
+        with camera as video_queue:
+            display_frame = None
+            while True:
+                # Newest queued frame; older ones are dropped instead of steering on stale images
+                in_frame, stale = latest_frame(video_queue)
+                stale_frames += stale
+                frame = in_frame.getCvFrame()
+                seq, timestamp = in_frame.getSequenceNum(), in_frame.getTimestamp().total_seconds()
+                tracer.begin_frame(seq, timestamp)
+                tracer.record_since_capture("queue")
+                if recorder is not None:
+                    recorder.record_frame(seq, timestamp, frame)
+
+                scheduler.begin(timestamp)
+                with span("detect"):
+                    _, detection = detect(frame)
+
+                # Decide on command
+                with span("decide"):
+                    command, _ = decide(detection, state)
+                velocity = path_velocity(detection, command) if PROTOCOL == "binary" else None
+                send(command, velocity)
+                tracer.record_since_capture("capture_to_command")
+                scheduler.finish(timestamp)
+                if recorder is not None:
+                    recorder.record_decision(seq, timestamp, detection, command, velocity)
+
+                # Show overlay, on the display stream's newest frame if there is one, unless drawing is shed
+                if not scheduler.skip("draw"):
+                    with span("display"):
+                        latest = video_queue.get_display()
+                        if latest is not None:
+                            display_frame = latest.getCvFrame()
+                        shown = display_frame if display_frame is not None else frame
+                        cv2.imshow("Segmented View", draw_overlay(shown, detection['mask']))
+
+                if cv2.waitKey(1) == ord('q'):
+                    break
+
+            cv2.destroyAllWindows()
+    finally:
+        sender.close()  # Sends a final stop command
+        if recorder is not None:
+            recorder.close()
+        print(f"[Planner] Commands: {sender.report()}")
+        print(f"[Planner] Deadline: {scheduler.report()}, stale queued frames {stale_frames}")
+        print(f"[Planner] Startup: {startup.report()}")
+        if 'keyframer' in state:
+            print(f"[Planner] Keyframes: {state['keyframer'].report()}")
+        print(tracer.summary())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,243 @@
+#Inference backends for the planner UNet
+#  eager        - the smp.Unet module as trained, under torch.inference_mode
+#  torchscript  - traced, frozen and optimized TorchScript module
+#  onnx         - exported ONNX graph run through ONNX Runtime with IO binding
+#
+#Every backend folds sigmoid + threshold into the graph (sigmoid(x) > 0.5 is
+#just x > 0), writes its input from one preallocated (1, 3, 256, 256) buffer
+#and returns the mask in a preallocated (256, 256) float32 buffer. steer()
+#returns just the path centroid; the torch backends reduce on the device so
+#the mask only crosses to the host when fetch_mask() asks for it
+#
+#Parity check and benchmark:
+#  python3 planner_engine.py --weights unet_resnet34Final.pth
+#  python3 planner_engine.py --random-weights --backends eager onnx --threads 4
+
+import abc
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from mask_steering import TorchPathReducer, path_centroid
+
+INPUT_SIZE = 256
+INPUT_SHAPE = (1, 3, INPUT_SIZE, INPUT_SIZE)
+BACKENDS = ("eager", "torchscript", "onnx")
+
+
+def configure_threads(threads=None):
+    """Pin torch to `threads` intra-op threads and one inter-op thread (single-frame inference)."""
+    if threads:
+        torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # can only be set before the first parallel op; keep whatever is there
+
+
+def load_unet(model_path=None):
+    """The planner's UNet ResNet34; random weights when model_path is None."""
+    import segmentation_models_pytorch as smp
+
+    model = smp.Unet(
+        encoder_name="resnet34",
+        encoder_weights=None,
+        in_channels=3,
+        classes=1,
+    )
+    if model_path is not None:
+        model.load_state_dict(torch.load(model_path, map_location=torch.device("cpu")))
+    model.eval()
+    return model
+
+
+class MaskHead(torch.nn.Module):
+    """UNet followed by the folded sigmoid+threshold: returns a 0/1 float mask."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return (self.model(x) > 0).float()
+
+
+class Engine(abc.ABC):
+    """Common buffers: fill ``input`` (NCHW float32, normalized), call ``run()``."""
+    name = "base"
+
+    def __init__(self):
+        self.input = np.zeros(INPUT_SHAPE, dtype=np.float32)
+        self.output = np.zeros((INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+
+    @abc.abstractmethod
+    def run(self) -> np.ndarray:
+        """Run the model on ``input`` and return the 0/1 mask."""
+
+    def steer(self):
+        """Run the model and return (path pixel count, mean x) of the bottom half."""
+        return path_centroid(self.run())
+
+    def fetch_mask(self) -> np.ndarray:
+        """Mask from the last run()/steer() call."""
+        return self.output
+
+
+class TorchEngine(Engine):
+    """Eager or TorchScript module over preallocated torch views of the numpy buffers."""
+
+    def __init__(self, module, device, name):
+        super().__init__()
+        self.name = name
+        self.module = module
+        self.device = device
+        self.input_tensor = torch.from_numpy(self.input)  # shares memory with self.input
+        self.output_tensor = torch.from_numpy(self.output)
+        self.reducer = TorchPathReducer(INPUT_SIZE, device)
+        self.mask = None
+        if device.type != "cpu":
+            self.device_input = torch.empty(INPUT_SHAPE, dtype=torch.float32, device=device)
+
+    def _forward(self):
+        if self.device.type == "cpu":
+            return self.module(self.input_tensor)
+        self.device_input.copy_(self.input_tensor, non_blocking=True)
+        return self.module(self.device_input)
+
+    def run(self):
+        with torch.inference_mode():
+            self.mask = self._forward()
+            self.output_tensor.copy_(self.mask[0, 0])
+        return self.output
+
+    def steer(self):
+        with torch.inference_mode():
+            self.mask = self._forward()
+            count, sum_x = self.reducer(self.mask).tolist()  # the only device -> host transfer
+        return (count, sum_x / count) if count else (0.0, None)
+
+    def fetch_mask(self):
+        with torch.inference_mode():
+            self.output_tensor.copy_(self.mask[0, 0])
+        return self.output
+
+
+class OnnxEngine(Engine):
+    """ONNX Runtime session with the input and output bound to the numpy buffers."""
+    name = "onnx"
+
+    def __init__(self, onnx_path, threads=None):
+        import onnxruntime as ort
+
+        super().__init__()
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+        self.mask = np.zeros((1, 1, INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+        self.output = self.mask[0, 0]
+        self.binding = self.session.io_binding()
+        self.binding.bind_cpu_input(self.session.get_inputs()[0].name, self.input)
+        self.binding.bind_output(self.session.get_outputs()[0].name, "cpu", 0, np.float32,
+                                 self.mask.shape, self.mask.ctypes.data)
+
+    def run(self):
+        self.session.run_with_iobinding(self.binding)
+        return self.output
+
+
+def export_onnx(model, onnx_path):
+    """Export the thresholded UNet to ONNX with a fixed 1x3x256x256 input."""
+    example = torch.zeros(INPUT_SHAPE, dtype=torch.float32)
+    with torch.no_grad():
+        torch.onnx.export(MaskHead(model).eval(), example, onnx_path,
+                          input_names=["input"], output_names=["mask"],
+                          opset_version=17, dynamo=False)
+    return onnx_path
+
+
+def create_engine(backend="torchscript", model_path=None, threads=None, model=None):
+    """Build an inference engine for the planner UNet.
+
+    The ONNX export is cached next to the weights (``<weights>.onnx``) and only
+    rebuilt when the weights file is newer. Random-weight exports go to the
+    temp directory, never the working directory.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    configure_threads(threads)
+
+    if backend == "onnx":
+        if model_path is not None:
+            onnx_path = model_path + ".onnx"
+        else:
+            onnx_path = os.path.join(tempfile.gettempdir(), "planner_unet_random.onnx")
+        stale = (not os.path.exists(onnx_path) or
+                 (model_path is not None and os.path.getmtime(onnx_path) < os.path.getmtime(model_path)))
+        if stale or model is not None:
+            export_onnx(model if model is not None else load_unet(model_path), onnx_path)
+        return OnnxEngine(onnx_path, threads)
+
+    model = model if model is not None else load_unet(model_path)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    module = MaskHead(model).to(device).eval()
+    if backend == "torchscript":
+        example = torch.zeros(INPUT_SHAPE, dtype=torch.float32, device=device)
+        with torch.no_grad():
+            module = torch.jit.freeze(torch.jit.trace(module, example))
+            module = torch.jit.optimize_for_inference(module)
+            for _ in range(2):  # let the profiling executor settle before timing starts
+                module(example)
+    return TorchEngine(module, device, backend)
+
+
+def parity_check(engine, reference, frames=8, seed=0):
+    """Fraction of mask pixels where ``engine`` disagrees with ``reference`` on random inputs."""
+    rng = np.random.default_rng(seed)
+    mismatched = 0
+    for _ in range(frames):
+        sample = rng.standard_normal(INPUT_SHAPE).astype(np.float32)
+        engine.input[...] = sample
+        reference.input[...] = sample
+        mismatched += int(np.count_nonzero(engine.run() != reference.run()))
+    return mismatched / (frames * INPUT_SIZE * INPUT_SIZE)
+
+
+def benchmark(engine, frames=100, warmup=5):
+    """Frames per second of engine.run() on a fixed input."""
+    engine.input[...] = np.random.default_rng(1).standard_normal(INPUT_SHAPE).astype(np.float32)
+    for _ in range(warmup):
+        engine.run()
+    started = time.perf_counter()
+    for _ in range(frames):
+        engine.run()
+    return frames / (time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parity check and benchmark for the planner UNet backends")
+    parser.add_argument("--weights", default="unet_resnet34Final.pth")
+    parser.add_argument("--random-weights", action="store_true", help="benchmark without a weights file")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--frames", type=int, default=50)
+    args = parser.parse_args()
+
+    weights = None if args.random_weights else args.weights
+    model = load_unet(weights)
+    reference = create_engine("eager", threads=args.threads, model=model)
+    eager_fps = benchmark(reference, args.frames)
+    for backend in args.backends:
+        engine = reference if backend == "eager" else create_engine(backend, weights, args.threads, model=model)
+        mismatch = parity_check(engine, reference)
+        fps = eager_fps if backend == "eager" else benchmark(engine, args.frames)
+        print(f"[Engine] {backend:12s} {fps:7.1f} fps  ({fps / eager_fps:.2f}x eager)  "
+              f"mask mismatch vs eager {mismatch * 100:.4f}%")
@@ -0,0 +1,322 @@
+#Track-between-detections for the cvzone followers
+#findPose + findPosition is the expensive part of every frame, yet the person
+#moves only a little from one frame to the next. PoseTracker runs the pose
+#detector every few frames and carries the bbox in between with a
+#constant-velocity Kalman filter, corrected by Lucas-Kanade optical flow on
+#corner features inside the box. The detection cadence adapts: it stretches
+#while flow tracks well and the person moves slowly, and snaps back to every
+#frame when flow loses the box, the person moves fast, or a detection disagrees
+#with the prediction. Landmarks from the last detection are moved with the box,
+#so the hand crops and torso depth still land on the person
+#
+#Tracking accuracy, detector calls saved and per-frame cost on synthetic frames:
+#  python3 pose_tracker.py
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from tracing import span
+
+
+def box_iou(a, b):
+    """IoU of two (x, y, w, h) boxes."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = min(ax + aw, bx + bw) - max(ax, bx)
+    ih = min(ay + ah, by + bh) - max(ay, by)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    return inter / (aw * ah + bw * bh - inter)
+
+
+class BoxKalman:
+    """Constant-velocity Kalman filter on a box's centre and size, in fractions of the frame, per frame step."""
+
+    def __init__(self, process_noise=1e-4, measurement_noise=1e-4):
+        self.kf = cv2.KalmanFilter(8, 4)  # state cx, cy, w, h and their velocities
+        self.kf.transitionMatrix = np.eye(8, dtype=np.float32)
+        self.kf.transitionMatrix[:4, 4:] = np.eye(4, dtype=np.float32)
+        self.kf.measurementMatrix = np.eye(4, 8, dtype=np.float32)
+        self.kf.processNoiseCov = np.diag([1, 1, 1, 1, 4, 4, 4, 4]).astype(np.float32) * process_noise
+        self.measurement_noise = measurement_noise
+
+    def reset(self, box):
+        self.kf.statePost = np.array([*box, 0, 0, 0, 0], dtype=np.float32).reshape(8, 1)
+        self.kf.errorCovPost = np.diag([1, 1, 1, 1, 10, 10, 10, 10]).astype(np.float32) * self.measurement_noise
+
+    def predict(self):
+        return self.kf.predict()[:4, 0]
+
+    def correct(self, box, noise_scale=1.0):
+        """Fold in a measurement; noise_scale > 1 trusts it less (e.g. optical flow rather than the detector)."""
+        self.kf.measurementNoiseCov = np.eye(4, dtype=np.float32) * (self.measurement_noise * noise_scale)
+        return self.kf.correct(np.asarray(box, dtype=np.float32).reshape(4, 1))[:4, 0]
+
+    @property
+    def box(self):
+        return self.kf.statePost[:4, 0]
+
+    @property
+    def speed(self):
+        """Centre speed in frame fractions per frame."""
+        vx, vy = self.kf.statePost[4:6, 0]
+        return float(np.hypot(vx, vy))
+
+
+class BoxFlow:
+    """Moves a box from one grayscale frame to the next with forward-backward checked LK flow.
+
+    Flow runs on a crop around the box only, and the points that survive are
+    carried to the next frame; corners are picked again only when too few are left.
+    """
+
+    def __init__(self, max_corners=40, min_points=8, max_error=1.0, margin=24):
+        self.max_corners = max_corners
+        self.min_points = min_points
+        self.max_error = max_error  # forward-backward error in pixels
+        self.margin = margin  # pixels around the box the person may move between frames
+        self.lk = dict(winSize=(15, 15), maxLevel=2,
+                       criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+        self.gray = None
+        self.points = None
+
+    def reset(self, gray, bbox):
+        """Pick corner features inside the (x, y, w, h) pixel box to follow."""
+        self.gray = gray
+        x, y, w, h = (int(v) for v in bbox)
+        x0, y0 = max(x, 0), max(y, 0)
+        roi = gray[y0:y + h, x0:x + w]
+        self.points = None
+        if roi.size == 0:
+            return
+        points = cv2.goodFeaturesToTrack(roi, self.max_corners, 0.01, 5)
+        if points is not None:
+            self.points = points.reshape(-1, 2) + np.array([x0, y0], dtype=np.float32)
+
+    def track(self, gray, bbox):
+        """(moved bbox, confidence 0..1) for the new frame, or (None, confidence) if the features were lost."""
+        if self.points is None or len(self.points) < self.min_points or self.gray.shape != gray.shape:
+            return None, 0.0  # nothing to follow, or the frame size changed
+        fh, fw = gray.shape[:2]
+        x, y, w, h = bbox
+        x0, y0 = max(int(x) - self.margin, 0), max(int(y) - self.margin, 0)
+        x1, y1 = min(int(x + w) + self.margin, fw), min(int(y + h) + self.margin, fh)
+        offset = np.array([x0, y0], dtype=np.float32)
+        before, after = self.gray[y0:y1, x0:x1], gray[y0:y1, x0:x1]
+        points = (self.points - offset).reshape(-1, 1, 2)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(before, after, points, None, **self.lk)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(after, before, moved, None, **self.lk)
+        error = np.linalg.norm((back - points).reshape(-1, 2), axis=1)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (error < self.max_error)
+        confidence = float(good.mean())
+        if good.sum() < self.min_points:
+            self.points = None
+            return None, confidence
+        old, new = points.reshape(-1, 2)[good], moved.reshape(-1, 2)[good]
+        shift = np.median(new - old, axis=0)
+        # Scale from the spread of the points around their median
+        old_spread = np.linalg.norm(old - np.median(old, axis=0), axis=1)
+        new_spread = np.linalg.norm(new - np.median(new, axis=0), axis=1)
+        usable = old_spread > 1
+        scale = float(np.median(new_spread[usable] / old_spread[usable])) if usable.sum() >= 3 else 1.0
+        cx, cy = x + w / 2 + shift[0], y + h / 2 + shift[1]
+        w, h = w * scale, h * scale
+        moved_box = (cx - w / 2, cy - h / 2, w, h)
+        # Keep the surviving points for the next frame; pick new corners once too many are gone
+        if good.sum() >= self.max_corners // 2:
+            self.gray, self.points = gray, new + offset
+        else:
+            self.reset(gray, moved_box)
+        return moved_box, confidence
+
+
+class PoseTracker:
+    """cvzone PoseDetector at an adaptive cadence, with the bbox tracked in between.
+
+    Calling it with a BGR frame returns (img, lmList, bboxInfo) like findPose +
+    findPosition(bboxWithHands=True). On tracked frames img is the frame as
+    is, and lmList is the last detection's landmarks moved with the box.
+    ``max_interval=1`` runs the detector on every frame.
+    """
+
+    def __init__(self, pose_detector, max_interval=6, flow=True, min_confidence=0.5,
+                 max_speed=0.02, min_iou=0.5):
+        self.detector = pose_detector
+        self.max_interval = max(1, max_interval)
+        self.flow = BoxFlow() if flow else None
+        self.min_confidence = min_confidence  # flow below this forces a detection
+        self.max_speed = max_speed  # frame fractions per frame; faster keeps the detector on every frame
+        self.min_iou = min_iou  # detection vs prediction; less means the track had drifted
+        self.kalman = BoxKalman()
+        self.active = False
+        self.interval = 1
+        self.since_detect = 0
+        self.anchor = None  # (box, lmList) of the last detection
+        self.stats = {'frames': 0, 'detections': 0, 'tracked': 0, 'flow_lost': 0, 'drifted': 0}
+
+    def _detect(self, frame):
+        img = self.detector.findPose(frame)
+        lmList, bboxInfo = self.detector.findPosition(img, bboxWithHands=True)
+        self.stats['detections'] += 1
+        return img, lmList, bboxInfo
+
+    def __call__(self, frame):
+        self.stats['frames'] += 1
+        fh, fw = frame.shape[:2]
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if self.flow is not None else None
+
+        confidence = 1.0
+        if self.active:
+            previous = self._pixels(self.kalman.box, fw, fh)  # where the features were picked
+            predicted = self.kalman.predict()
+            if self.flow is not None:
+                with span("track.flow"):
+                    moved, confidence = self.flow.track(gray, previous)
+                if moved is None:
+                    self.stats['flow_lost'] += 1
+                else:
+                    self.kalman.correct(self._fractions(moved, fw, fh), noise_scale=1 + 4 * (1 - confidence))
+
+            self.since_detect += 1
+            if self.since_detect < self.interval and confidence >= self.min_confidence:
+                self.stats['tracked'] += 1
+                bbox = self._pixels(self.kalman.box, fw, fh)
+                return frame, self._moved_landmarks(bbox), self._bbox_info(bbox)
+
+        img, lmList, bboxInfo = self._detect(frame)
+        self.since_detect = 0
+        if not bboxInfo:
+            self.active = False
+            self.interval = 1
+            return img, lmList, bboxInfo
+
+        box = self._fractions(bboxInfo['bbox'], fw, fh)
+        if self.active:
+            agrees = box_iou(self._pixels(predicted, fw, fh), bboxInfo['bbox']) >= self.min_iou
+            self.kalman.correct(box)
+            if not agrees:
+                self.stats['drifted'] += 1
+            # Stretch the cadence while tracking holds and the person is slow, back off otherwise
+            if agrees and confidence >= self.min_confidence and self.kalman.speed < self.max_speed:
+                self.interval = min(self.interval + 1, self.max_interval)
+            else:
+                self.interval = max(1, self.interval // 2)
+        else:
+            self.kalman.reset(box)
+            self.active = True
+            self.interval = 1
+        self.anchor = (bboxInfo['bbox'], lmList)
+        if self.flow is not None:
+            self.flow.reset(gray, bboxInfo['bbox'])
+        return img, lmList, bboxInfo
+
+    @staticmethod
+    def _fractions(bbox, fw, fh):
+        x, y, w, h = bbox
+        return ((x + w / 2) / fw, (y + h / 2) / fh, w / fw, h / fh)
+
+    @staticmethod
+    def _pixels(box, fw, fh):
+        cx, cy, w, h = (float(v) for v in box)
+        return (cx - w / 2) * fw, (cy - h / 2) * fh, w * fw, h * fh
+
+    @staticmethod
+    def _bbox_info(bbox):
+        x, y, w, h = (int(round(v)) for v in bbox)
+        return {'bbox': (x, y, w, h), 'center': (x + w // 2, y + h // 2)}
+
+    def _moved_landmarks(self, bbox):
+        """The last detection's landmarks, shifted and scaled from its box onto `bbox`."""
+        anchor_box, lmList = self.anchor
+        if not lmList:
+            return lmList
+        ax, ay, aw, ah = anchor_box
+        x, y, w, h = bbox
+        points = np.array(lmList, dtype=np.float32)
+        scale = h / ah if ah else 1.0
+        points[:, -3] = x + w / 2 + (points[:, -3] - (ax + aw / 2)) * scale  # [x, y, z] or [id, x, y, z]
+        points[:, -2] = y + h / 2 + (points[:, -2] - (ay + ah / 2)) * scale
+        return points.astype(np.int32).tolist()
+
+    def report(self):
+        stats = dict(self.stats)
+        stats['detect_ratio'] = round(stats['detections'] / max(stats['frames'], 1), 3)
+        stats['interval'] = self.interval
+        return stats
+
+
+class ScriptedPose:
+    """Stand-in PoseDetector that returns a given bbox, for benchmarking the tracker without cvzone."""
+
+    def __init__(self):
+        self.bbox = None
+        self.calls = 0
+
+    def findPose(self, frame):
+        self.calls += 1
+        return frame
+
+    def findPosition(self, img, bboxWithHands=True):
+        if self.bbox is None:
+            return [], {}
+        x, y, w, h = self.bbox
+        lmList = [[x + w // 2, y + h * i // 33, 0] for i in range(33)]
+        return lmList, {'bbox': self.bbox, 'center': (x + w // 2, y + h // 2)}
+
+
+if __name__ == "__main__":
+    from follower_runtime import person_box
+    from frame_source import SyntheticSource
+
+    parser = argparse.ArgumentParser(description="Replay synthetic frames through the pose tracker")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--max-interval", type=int, default=6)
+    args = parser.parse_args()
+
+    # Textured person over a textured background, so optical flow has something to follow
+    width, height = 640, 360
+    rng = np.random.default_rng(0)
+    background = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (5, 5), 0)
+    texture = cv2.GaussianBlur(rng.integers(0, 255, (400, 160, 3), dtype=np.uint8), (5, 5), 0)
+    script = SyntheticSource(width, height)
+    frames = []
+    for seq in range(args.frames):
+        bbox = script.ground_truth(seq)[0]
+        frame = background.copy()
+        if bbox is not None:
+            x, y, w, h = bbox
+            frame[y:y + h, x:x + w] = cv2.resize(texture, (w, h))
+        frames.append((frame, bbox))
+
+    def command(bbox):
+        """follow.py's steering on a bbox: forward when centred, else turn toward the person."""
+        box = person_box({'bboxInfo': {'bbox': bbox} if bbox else None}, (width, height))
+        if box is None:
+            return 'x'
+        return 'w' if abs(box[0]) < 0.1 else ('a' if box[0] < 0 else 'd')
+
+    detector = ScriptedPose()
+    tracker = PoseTracker(detector, max_interval=args.max_interval)
+    ious, agree, overhead = [], 0, 0.0
+    for frame, bbox in frames:
+        detector.bbox = bbox
+        calls = detector.calls
+        started = time.perf_counter()
+        _, _, bboxInfo = tracker(frame)
+        if detector.calls == calls:
+            overhead += time.perf_counter() - started
+        tracked = bboxInfo.get('bbox') if bboxInfo else None
+        if bbox is not None and tracked is not None:
+            ious.append(box_iou(tracked, bbox))
+        agree += command(tracked) == command(bbox)
+
+    report = tracker.report()
+    print(f"[Tracker] {report}")
+    print(f"[Tracker] detector on {report['detect_ratio'] * 100:.0f}% of frames, "
+          f"tracked frames cost {overhead * 1000 / max(report['tracked'], 1):.2f} ms each")
+    print(f"[Tracker] IoU with the true box: mean {np.mean(ious):.3f}, min {np.min(ious):.3f}; "
+          f"steering command matches the true box on {agree / len(frames) * 100:.1f}% of frames")
@@ -0,0 +1,203 @@
+#Headless replay and benchmark runner for every follower variant and planner.py
+#Feeds frames from a synthetic or recorded source through each script's
+#build_detect/decide as fast as possible and reports frames/sec, per-frame
+#latency percentiles and the resulting command stream
+#
+#Examples:
+#  python3 replay_bench.py                                   # all variants, scripted detections
+#  python3 replay_bench.py --detector model --source session.mp4
+#  python3 replay_bench.py --json bench.json                 # save a baseline
+#  python3 replay_bench.py --compare bench.json              # fail on regressions
+#  python3 replay_bench.py --trace trace.json                # Chrome trace of every stage
+
+import argparse
+import hashlib
+import importlib
+import json
+import sys
+import time
+
+import numpy as np
+
+from command_sender import CommandSender
+from depth_distance import DepthHistogram, target_distance
+from frame_source import open_source
+from stand_in_controller import StandInController
+from tracing import span, tracer
+
+VARIANTS = [
+    "follow",
+    "height_follow",
+    "full_follow",
+    "backtrack_follow",
+    "center_follow",
+    "tight_spaces",
+    "fist_follow",
+    "depth_follow",
+    "planner",
+]
+
+
+def scripted_detection(meta):
+    """Turn a frame's ground-truth metadata into the detection dict decide() expects."""
+    bbox = meta.get('bbox')
+    bboxInfo = None
+    if bbox is not None:
+        x, y, w, h = (int(v) for v in bbox)
+        bboxInfo = {'bbox': (x, y, w, h), 'center': (x + w // 2, y + h // 2)}
+    return {'lmList': [], 'bboxInfo': bboxInfo, 'hands': [],
+            'fist': bool(meta.get('fist', False)), 'mask': meta.get('mask')}
+
+
+def run_length(commands, limit=40):
+    """Compact 'w12 a3 x5 ...' view of a command stream."""
+    runs = []
+    for command in commands:
+        if runs and runs[-1][0] == command:
+            runs[-1][1] += 1
+        else:
+            runs.append([command, 1])
+    text = " ".join(f"{command}{count}" for command, count in runs[:limit])
+    return text + (" ..." if len(runs) > limit else "")
+
+
+def run_variant(name, source_spec, detector="scripted", controller=None, warmup=5):
+    """Replay one variant over a fresh source and return its metrics."""
+    module = importlib.import_module(name)
+    state = {'stopped': False}
+    size = (module.frame_width, module.frame_height)
+    uses_depth = getattr(module, 'USES_DEPTH', False)
+    source_options = {'depth': True} if uses_depth and source_spec.startswith("synthetic") else {}
+    histogram = DepthHistogram() if uses_depth else None
+    if detector == "model":
+        detect = module.build_detect(state)
+        size = getattr(module, 'INFER_SIZE', None) or size  # what the camera hands the detector live
+    else:
+        detect = None
+
+    sender = None
+    if controller is not None:
+        sender = CommandSender(controller.host, controller.port, heartbeat=0, name=name).start()
+
+    latencies = []
+    commands = []
+    with open_source(source_spec, *size, **source_options) as source:
+        started = time.perf_counter()
+        while True:
+            packet = source.get()
+            if packet is None:
+                break
+            t0 = time.perf_counter()
+            tracer.begin_frame(packet.getSequenceNum(), packet.getTimestamp().total_seconds())
+            with span(f"{name}.detect"):
+                depth = getattr(packet, 'depth', None)
+                if detect is None:
+                    detection = scripted_detection(packet.meta)
+                    if histogram is not None and depth is not None:
+                        # Scripted person, but the distance is measured on the stand-in depth
+                        detection['distance'] = target_distance(histogram.update(depth), detection, size)
+                elif uses_depth:
+                    _, detection = detect(packet.getCvFrame(), depth)
+                else:
+                    _, detection = detect(packet.getCvFrame())
+            with span(f"{name}.decide"):
+                command, _ = module.decide(detection, state)
+            if sender is not None:
+                sender.send(command)
+            latencies.append(time.perf_counter() - t0)
+            commands.append(command)
+        elapsed = time.perf_counter() - started
+
+    if sender is not None:
+        sender.close(final_command=None)
+
+    measured = np.array(latencies[warmup:] or latencies) * 1000.0
+    stream = "".join(commands)
+    return {
+        'variant': name,
+        'frames': len(commands),
+        'fps': len(commands) / elapsed if elapsed > 0 else 0.0,
+        'decide_fps': len(measured) / (measured.sum() / 1000.0) if measured.sum() > 0 else 0.0,
+        'p50_ms': float(np.percentile(measured, 50)) if len(measured) else 0.0,
+        'p90_ms': float(np.percentile(measured, 90)) if len(measured) else 0.0,
+        'p99_ms': float(np.percentile(measured, 99)) if len(measured) else 0.0,
+        'max_ms': float(measured.max()) if len(measured) else 0.0,
+        'changes': sum(1 for a, b in zip(stream, stream[1:]) if a != b),
+        'counts': {command: stream.count(command) for command in sorted(set(stream))},
+        'commands': run_length(stream),
+        'digest': hashlib.sha1(stream.encode()).hexdigest()[:12],
+    }
+
+
+def compare(results, baseline, max_regression):
+    """Return a list of regressions against a saved baseline."""
+    problems = []
+    for result in results:
+        old = baseline.get(result['variant'])
+        if old is None:
+            continue
+        if result['fps'] < old['fps'] * (1.0 - max_regression):
+            problems.append(f"{result['variant']}: fps {result['fps']:.1f} < baseline {old['fps']:.1f}")
+        if result['p99_ms'] > old['p99_ms'] * (1.0 + max_regression) and result['p99_ms'] - old['p99_ms'] > 0.05:
+            problems.append(f"{result['variant']}: p99 {result['p99_ms']:.3f}ms > baseline {old['p99_ms']:.3f}ms")
+        if result['digest'] != old['digest']:
+            problems.append(f"{result['variant']}: command stream changed ({old['digest']} -> {result['digest']})")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay follower/planner variants headless and benchmark them")
+    parser.add_argument("--variants", nargs="+", default=VARIANTS, choices=VARIANTS)
+    parser.add_argument("--source", default="synthetic:600",
+                        help="'synthetic[:frames]' or a recorded video file / image directory")
+    parser.add_argument("--detector", choices=["scripted", "model"], default="scripted",
+                        help="scripted replays ground-truth detections; model runs the real detectors")
+    parser.add_argument("--controller", action="store_true",
+                        help="send commands over loopback TCP to a stand-in controller")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--trace", help="write a Chrome trace of every stage span to this file")
+    parser.add_argument("--compare", help="baseline JSON from a previous --json run")
+    parser.add_argument("--max-regression", type=float, default=0.15,
+                        help="allowed fractional fps/latency regression against --compare")
+    args = parser.parse_args()
+
+    controller = StandInController().start() if args.controller else None
+    results = []
+    try:
+        for name in args.variants:
+            result = run_variant(name, args.source, args.detector, controller)
+            results.append(result)
+            print(f"[Bench] {name:17s} {result['frames']:6d} frames  {result['fps']:9.1f} fps  "
+                  f"p50 {result['p50_ms']:.3f}ms  p90 {result['p90_ms']:.3f}ms  p99 {result['p99_ms']:.3f}ms  "
+                  f"changes {result['changes']}")
+            print(f"        {result['commands']}")
+    finally:
+        if controller is not None:
+            time.sleep(0.2)
+            print(f"[Bench] Stand-in controller received {len(controller.commands)} commands "
+                  f"over {controller.connections} connections.")
+            controller.stop()
+
+    print(tracer.summary())
+    if args.trace:
+        count = tracer.export_chrome(args.trace)
+        print(f"[Bench] Wrote {count} spans to {args.trace}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({result['variant']: result for result in results}, f, indent=2)
+        print(f"[Bench] Wrote {args.json}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        problems = compare(results, baseline, args.max_regression)
+        for problem in problems:
+            print(f"[Bench][REGRESSION] {problem}")
+        if problems:
+            sys.exit(1)
+        print("[Bench] No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
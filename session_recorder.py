@@ -0,0 +1,480 @@
+#Session recorder: what a follower saw and did, in one chunked file
+#The capture and decide stages hand frames, depth, detections and the sent
+#command to a background writer thread through a bounded queue (a full queue
+#drops the record instead of stalling the loop). Each record is one chunk:
+#a fixed header, then the payload, 64-byte aligned and either raw or
+#compressed on its own. By default only planner masks are compressed: zlib
+#shrinks a 0/1 mask ~80x in under a millisecond, but takes tens of
+#milliseconds per colour or depth frame, so those stay raw (and zero-copy)
+#unless lz4 is installed and asked for. A sequence/timestamp
+#index goes at the end of the file on close, and a reader that finds no
+#index (the recorder was killed) rebuilds it by walking the chunk headers.
+#Readers mmap the file: a raw frame is a zero-copy view, and seeking to any
+#frame decompresses only that frame's chunk
+#
+#Set FOLLOW_RECORD=run.session (FOLLOW_RECORD_COMPRESS=lz4 to compress everything) to record
+#any follower running on FollowerRuntime, or planner.py. Then:
+#  python3 session_recorder.py info run.session
+#  python3 session_recorder.py export run.session    # run.session.detections.jsonl for threshold_tuner.py
+#  python3 replay_bench.py --source run.session      # replay the recorded detections
+#  python3 session_recorder.py --bench               # loop overhead and seek time on synthetic frames
+
+import argparse
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+MAGIC = b"FSESSION"
+VERSION = 1
+HEADER_SIZE = 64
+MARK = b"RECD"
+RECORD = np.dtype([('stream', 'u1'), ('codec', 'u1'), ('dtype', 'u1'), ('ndim', 'u1'), ('shape', '<u4', (3,)),
+                   ('seq', '<i8'), ('timestamp', '<f8'), ('offset', '<u8'), ('length', '<u8'), ('raw_length', '<u8')])
+TRAILER = struct.Struct('<QQ8s')  # index offset, index entries, magic
+TRAILER_MAGIC = b"SIDXEND1"
+ALIGN = 64
+STREAMS = ("frame", "depth", "mask", "meta")
+DTYPES = ("bytes", "uint8", "uint16", "float32", "int32", "float64", "bool")
+CODECS = ("none", "zlib", "lz4")
+COMPRESS_STREAMS = {'none': (), 'zlib': ("mask",), 'lz4': ("frame", "depth", "mask")}  # what each codec is fast enough for
+SPLIT_SIZE = 256  # detection arrays bigger than this (masks) get their own chunk instead of going into the JSON
+
+
+def _json_default(value):
+    """numpy scalars and small arrays in detections (cvzone mixes them in) as plain JSON."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class SessionRecorder:
+    """Writes frames, depth, detections and commands from the follower loop on a background thread."""
+
+    def __init__(self, path, compress="zlib", compress_streams=None, max_queue=64):
+        if compress not in (None,) + CODECS:
+            raise ValueError(f"Unknown compression '{compress}', expected one of {CODECS}")
+        if compress == "lz4" and lz4_frame is None:
+            raise ValueError("lz4 compression needs the lz4 package (pip install lz4)")
+        self.path = path
+        self.codec = CODECS.index(compress or "none")
+        self.compress_streams = COMPRESS_STREAMS[CODECS[self.codec]] if compress_streams is None else compress_streams
+        self.stats = {'records': 0, 'frames': 0, 'dropped': 0, 'errors': 0, 'bytes': 0, 'raw_bytes': 0,
+                      'write_cpu_s': 0.0}
+        self._queue = queue.Queue(max_queue)
+        self._index = []
+        self._file = None
+        self._thread = None
+
+    def start(self):
+        self._file = open(self.path, "wb", buffering=1 << 20)
+        self._file.write(MAGIC + struct.pack('<I', VERSION).ljust(HEADER_SIZE - len(MAGIC), b"\0"))
+        self._thread = threading.Thread(target=self._write_loop, name="recorder", daemon=True)
+        self._thread.start()
+        print(f"[Recorder] Recording to {self.path}")
+        return self
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.stats['dropped'] += 1  # never stall the loop; the index shows the gap
+
+    def record_frame(self, seq, timestamp, frame, depth=None):
+        """Capture stage: the frame (copied, since the detectors draw on it) and any aligned depth."""
+        self._put(("frame", seq, timestamp, frame.copy()))
+        if depth is not None:
+            self._put(("depth", seq, timestamp, depth))
+
+    def record_decision(self, seq, timestamp, detection, command, velocity=None):
+        """Decide stage: the detection (lmList, bboxInfo, hands, ...), its masks and the command sent."""
+        detection = dict(detection or {})
+        for key, value in list(detection.items()):
+            if isinstance(value, np.ndarray) and value.size > SPLIT_SIZE:
+                # Copied like frames: the planner's masks are buffers the next frame overwrites
+                self._put(("mask", seq, timestamp, detection.pop(key).copy()))
+        meta = {'detection': detection, 'command': command, 'velocity': velocity}
+        self._put(("meta", seq, timestamp, meta))
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            started = time.thread_time()
+            try:
+                self._write(*item)
+            except Exception as e:
+                # One bad record (e.g. an unsupported dtype) is skipped instead of killing the writer
+                if not self.stats['errors']:
+                    print(f"[Recorder][ERROR]: {item[0]} record {item[1]} not written: {e!r}")
+                self.stats['errors'] += 1
+            self.stats['write_cpu_s'] += time.thread_time() - started
+
+    def _write(self, stream, seq, timestamp, value):
+        header = np.zeros((), RECORD)
+        header['stream'], header['seq'], header['timestamp'] = STREAMS.index(stream), seq, timestamp
+        if stream == "meta":
+            payload = json.dumps(value, default=_json_default).encode()
+            header['raw_length'] = len(payload)
+        else:
+            value = np.ascontiguousarray(value)
+            header['dtype'], header['ndim'] = DTYPES.index(value.dtype.name), value.ndim
+            header['shape'][:value.ndim] = value.shape
+            payload = memoryview(value).cast("B")
+            codec = self.codec if stream in self.compress_streams else 0
+            if codec == 1:
+                payload = zlib.compress(payload, 1)
+            elif codec == 2:
+                payload = lz4_frame.compress(payload)
+            header['codec'], header['raw_length'] = codec, value.nbytes
+        position = self._file.tell()
+        header['offset'] = -(-(position + len(MARK) + RECORD.itemsize) // ALIGN) * ALIGN
+        header['length'] = len(payload)
+        padding = header['offset'] - position - len(MARK) - RECORD.itemsize
+        self._file.write(MARK + header.tobytes() + b"\0" * int(padding))
+        self._file.write(payload)
+        self._index.append(header.tobytes())
+        self.stats['records'] += 1
+        self.stats['frames'] += stream == "frame"
+        self.stats['bytes'] += int(header['length'])
+        self.stats['raw_bytes'] += int(header['raw_length'])
+
+    def close(self):
+        """Drain the queue, then write the index and trailer."""
+        if self._thread is None:
+            return
+        while self._thread.is_alive():  # a writer that died can't make room in a full queue
+            try:
+                self._queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self._thread.join()
+        self._thread = None
+        position = self._file.tell()
+        self._file.write(b"".join(self._index))
+        self._file.write(TRAILER.pack(position, len(self._index), TRAILER_MAGIC))
+        self._file.close()
+        print(f"[Recorder] {self.report()}")
+
+    def report(self):
+        ratio = self.stats['raw_bytes'] / self.stats['bytes'] if self.stats['bytes'] else 1.0
+        frames = self.stats['frames'] or 1
+        return (f"{self.stats['frames']} frames, {self.stats['records']} records, "
+                f"{self.stats['bytes'] / 1e6:.1f} MB ({ratio:.1f}x {CODECS[self.codec]}), "
+                f"writer {self.stats['write_cpu_s'] * 1000 / frames:.2f} ms CPU/frame, dropped {self.stats['dropped']}, "
+                f"errors {self.stats['errors']}")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def recorder_from_env():
+    """A started SessionRecorder if FOLLOW_RECORD names a file, else None."""
+    path = os.environ.get("FOLLOW_RECORD")
+    if not path:
+        return None
+    return SessionRecorder(path, os.environ.get("FOLLOW_RECORD_COMPRESS", "zlib")).start()
+
+
+class SessionReader:
+    """Random access to a recorded session through mmap."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a recorded session")
+        self.recovered = False
+        position, count, magic = TRAILER.unpack_from(self._mm, len(self._mm) - TRAILER.size)
+        if magic == TRAILER_MAGIC:
+            self.index = np.frombuffer(self._mm, RECORD, count, position)
+        else:
+            self.index = self._scan()
+            self.recovered = True
+        self._lookup = {}
+
+    def _scan(self):
+        """Rebuild the index from the chunk headers of a file that was never closed."""
+        entries = []
+        position = HEADER_SIZE
+        size = len(self._mm)
+        while position + len(MARK) + RECORD.itemsize <= size and self._mm[position:position + len(MARK)] == MARK:
+            header = np.frombuffer(self._mm, RECORD, 1, position + len(MARK))[0].copy()
+            end = int(header['offset'] + header['length'])
+            if end > size:
+                break  # the last chunk was cut off
+            entries.append(header)
+            position = end
+        return np.array(entries, RECORD)
+
+    def rows(self, stream="frame"):
+        """(sorted seqs, index rows) of one stream."""
+        if stream not in self._lookup:
+            rows = np.flatnonzero(self.index['stream'] == STREAMS.index(stream))
+            rows = rows[np.argsort(self.index['seq'][rows], kind="stable")]
+            self._lookup[stream] = (self.index['seq'][rows], rows)
+        return self._lookup[stream]
+
+    def seqs(self, stream="frame"):
+        return self.rows(stream)[0]
+
+    def __len__(self):
+        return len(self.seqs("frame"))
+
+    def read(self, row):
+        """Decode one chunk: an array (a read-only view into the file when stored raw) or the meta dict."""
+        header = self.index[row]
+        start, length = int(header['offset']), int(header['length'])
+        if header['stream'] == STREAMS.index("meta"):
+            return json.loads(self._mm[start:start + length])
+        dtype = np.dtype(DTYPES[header['dtype']])
+        shape = tuple(int(n) for n in header['shape'][:header['ndim']])
+        codec = CODECS[header['codec']]
+        if codec == "none":
+            return np.frombuffer(self._mm, dtype, int(header['raw_length']) // dtype.itemsize, start).reshape(shape)
+        data = self._mm[start:start + length]
+        if codec == "lz4":
+            if lz4_frame is None:
+                raise ValueError("This session is lz4 compressed; install the lz4 package to read it")
+            data = lz4_frame.decompress(data)
+        else:
+            data = zlib.decompress(data)
+        return np.frombuffer(data, dtype).reshape(shape)
+
+    def get(self, stream, seq):
+        """The `stream` record for frame `seq`, or None if it was not recorded (or dropped)."""
+        seqs, rows = self.rows(stream)
+        i = np.searchsorted(seqs, seq)
+        if i == len(seqs) or seqs[i] != seq:
+            return None
+        return self.read(rows[i])
+
+    def frame(self, seq):
+        return self.get("frame", seq)
+
+    def meta(self, seq):
+        return self.get("meta", seq)
+
+    def at_time(self, timestamp, stream="frame"):
+        """Seq of the last `stream` record captured at or before `timestamp` (the first one if none was)."""
+        seqs, rows = self.rows(stream)
+        times = self.index['timestamp'][rows]
+        order = np.argsort(times, kind="stable")
+        i = max(0, np.searchsorted(times[order], timestamp, side="right") - 1)
+        return int(seqs[order][i])
+
+    def summary(self):
+        counts = {stream: len(self.seqs(stream)) for stream in STREAMS}
+        frames = self.rows("frame")[1]
+        times = self.index['timestamp'][frames]
+        duration = float(times.max() - times.min()) if len(times) > 1 else 0.0
+        codecs = sorted({CODECS[c] for c in self.index['codec'][frames]})
+        return {'records': len(self.index), 'streams': counts, 'duration_s': round(duration, 2),
+                'fps': round((len(frames) - 1) / duration, 1) if duration else 0.0,
+                'codecs': codecs, 'bytes': os.path.getsize(self.path), 'recovered': self.recovered}
+
+    def export_detections(self, path=None, frame_size=None):
+        """Write `<session>.detections.jsonl` (bbox, fist, path, command per frame) for threshold_tuner.py."""
+        path = path or self.path + ".detections.jsonl"
+        with open(path, "w") as f:
+            for seq in self.seqs("frame"):
+                meta = self.meta(seq) or {}
+                detection = meta.get('detection') or {}
+                frame = self.frame(seq)
+                bboxInfo = detection.get('bboxInfo')
+                line = {'bbox': bboxInfo['bbox'] if bboxInfo else None, 'fist': bool(detection.get('fist', False)),
+                        'frame_size': detection.get('frame_size') or frame_size or [frame.shape[1], frame.shape[0]]}
+                if detection.get('path') is not None:
+                    line['path'] = detection['path']
+                    line['width'] = detection.get('width', 256)
+                if meta.get('command'):
+                    line['command'] = meta['command']
+                f.write(json.dumps(line) + "\n")
+        return path
+
+    def close(self):
+        self.index = None
+        self._lookup = {}
+        try:
+            self._mm.close()
+        except BufferError:
+            pass  # frames handed out are still views into the file; the mapping goes with them
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SessionSource:
+    """A recorded session as a frame source, with its detections as replay metadata.
+
+    Frames carry ``meta`` like SyntheticSource's (``bbox``, ``fist``, ``mask``)
+    plus the recorded ``command``, so replay_bench.py's scripted detector replays
+    what the follower saw.
+    """
+
+    def __init__(self, path, width=None, height=None, loop=False, realtime=False, depth=True):
+        self.path = path
+        self.size = (width, height) if width and height else None
+        self.loop = loop
+        self.realtime = realtime
+        self.depth = depth
+        self.reader = None
+        self.position = 0
+        self.seq = 0
+        self.started = None
+
+    def open(self):
+        self.reader = SessionReader(self.path)
+        self.started = time.monotonic()
+        return self
+
+    def get(self):
+        """Return the next SourceFrame, or None at the end of the session."""
+        import cv2
+        from frame_source import SourceFrame
+
+        seqs = self.reader.seqs("frame")
+        if self.position >= len(seqs) and self.loop and len(seqs):
+            self.position = 0
+        if self.position >= len(seqs):
+            return None
+        seq = seqs[self.position]
+        frame = self.reader.frame(seq)
+        if self.size is not None and (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        recorded = self.reader.meta(seq) or {}
+        detection = recorded.get('detection') or {}
+        bboxInfo = detection.get('bboxInfo')
+        meta = {'bbox': bboxInfo['bbox'] if bboxInfo else None, 'fist': detection.get('fist', False),
+                'mask': self.reader.get("mask", seq), 'command': recorded.get('command')}
+        if self.realtime:
+            times = self.reader.index['timestamp'][self.reader.rows("frame")[1]]
+            delay = self.started + (times[self.position] - times[0]) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        depth = self.reader.get("depth", seq) if self.depth else None
+        packet = SourceFrame(frame, self.seq, time.monotonic(), meta, depth)
+        self.seq += 1
+        self.position += 1
+        return packet
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def bench(frames=600, size=(640, 360), work=8):
+    """Loop throughput with and without recording, file size, and random seek time per codec."""
+    import contextlib
+    import io
+    import tempfile
+
+    import cv2
+    from frame_source import SyntheticSource
+
+    source = SyntheticSource(*size, count=frames, depth=True).open()
+    packets = [source.get() for _ in range(frames)]
+
+    def loop(recorder):
+        started = time.perf_counter()
+        for packet in packets:
+            frame = packet.frame
+            if recorder is not None:
+                t0 = time.perf_counter()
+                recorder.record_frame(packet.seq, packet.timestamp, frame, packet.depth)
+                inline[0] += time.perf_counter() - t0
+            img = frame
+            for _ in range(work):  # stand-in detector cost
+                img = cv2.GaussianBlur(img, (9, 9), 0)
+            x, y, w, h = packet.meta['bbox'] or (0, 0, 0, 0)
+            detection = {'bboxInfo': {'bbox': (x, y, w, h), 'center': (x + w // 2, y + h // 2)},
+                         'lmList': [[i, x + i, y + i, 0] for i in range(33)], 'fist': packet.meta['fist'],
+                         'mask': packet.meta['mask']}
+            if recorder is not None:
+                t0 = time.perf_counter()
+                recorder.record_decision(packet.seq, packet.timestamp, detection, 'w', (0.5, 0.1))
+                inline[0] += time.perf_counter() - t0
+        return frames / (time.perf_counter() - started)
+
+    inline = [0.0]  # time the loop itself spends handing records over
+    baseline = max(loop(None) for _ in range(2))
+    print(f"[Recorder] {frames} frames {size[0]}x{size[1]} + depth + planner mask, "
+          f"{baseline:.0f} fps without recording")
+    setups = [("raw", None, None), ("zlib masks", "zlib", None), ("zlib everything", "zlib", STREAMS)]
+    if lz4_frame is not None:
+        setups.append(("lz4 everything", "lz4", None))
+    with tempfile.TemporaryDirectory() as directory:
+        for name, codec, streams in setups:
+            path = os.path.join(directory, "bench.session")
+            inline[0] = 0.0
+            with contextlib.redirect_stdout(io.StringIO()):
+                recorder = SessionRecorder(path, codec, streams).start()
+                fps = loop(recorder)
+                recorder.close()
+            with SessionReader(path) as reader:
+                picks = np.random.default_rng(0).choice(reader.seqs(), 200)
+                started = time.perf_counter()
+                for seq in picks:
+                    reader.frame(seq).sum()  # touch the pages
+                seek_ms = (time.perf_counter() - started) * 1000 / len(picks)
+                same = np.array_equal(reader.frame(picks[0]), packets[picks[0]].frame)
+                megabytes = reader.summary()['bytes'] / 1e6
+            cpu_ms = recorder.stats['write_cpu_s'] * 1000 / max(1, recorder.stats['frames'])
+            print(f"[Recorder] {name:16s} {fps:5.0f} fps ({(1 - fps / baseline) * 100:+5.1f}% overhead), "
+                  f"in-loop {inline[0] * 1000 / frames:.2f} ms/frame, writer {cpu_ms:5.2f} ms CPU/frame ({cpu_ms * 3:.1f}% of a core at 30 fps), dropped {recorder.stats['dropped']:4d}, {megabytes:6.1f} MB, "
+                  f"random frame {seek_ms:.3f} ms, identical: {same}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, export or benchmark recorded follower sessions")
+    parser.add_argument("command", nargs="?", choices=("info", "export"))
+    parser.add_argument("session", nargs="?")
+    parser.add_argument("--output", help="export: detections.jsonl path (default <session>.detections.jsonl)")
+    parser.add_argument("--bench", action="store_true", help="recording overhead and seek time on synthetic frames")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--work", type=int, default=8, help="--bench: blurs per frame standing in for the detector")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.frames, work=args.work)
+        return
+    if args.command is None or args.session is None:
+        parser.error("info/export and a session file are required (or --bench)")
+    with SessionReader(args.session) as reader:
+        if args.command == "info":
+            print(f"[Recorder] {args.session}: {json.dumps(reader.summary())}")
+        else:
+            print(f"[Recorder] Wrote {reader.export_detections(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+#Simulated Amiga controller.py for load and latency testing without the robot
+#One asyncio event loop serves every follower connection on port 9999. Each
+#connection speaks the legacy characters or the binary velocity protocol
+#(detected from its first byte: binary messages start with 'AV'), and every
+#command is timestamped on arrival. Commands drive a simulated vehicle per
+#connection, a Twist2d target reached under acceleration limits and
+#integrated into odometry, the way controller.py hands Twist2d messages to the
+#canbus service. With echo=True each received chunk is written back, so a
+#client can time round trips. Binary commands go through the same out-of-order,
+#stale and dead-man checks as stand_in_controller.py
+#
+#Serve on 9999 and print a report every 5 s:
+#  python3 sim_controller.py [--port 9999] [--echo]
+#Load test: N CommandSenders (one per simulated follower) at 30 Hz each:
+#  python3 sim_controller.py --load 200 [--protocol binary]
+
+import argparse
+import asyncio
+import contextlib
+import io
+import math
+import threading
+import time
+from dataclasses import dataclass
+
+from tracing import Histogram
+from velocity_protocol import COMMAND_TWIST, MAGIC, CommandFilter, Deadman, VelocityDecoder
+
+# Amiga acceleration limits used by the simulated vehicle
+MAX_LINEAR_ACCEL = 1.0   # m/s^2
+MAX_ANGULAR_ACCEL = 2.0  # rad/s^2
+
+
+@dataclass
+class Twist2d:
+    """Mirror of farm_ng.core Twist2d, the message controller.py sends to the canbus service."""
+    linear_velocity_x: float = 0.0
+    angular_velocity: float = 0.0
+
+
+class SimVehicle:
+    """Reaches the commanded Twist2d under acceleration limits and integrates odometry."""
+
+    def __init__(self):
+        self.target = Twist2d()
+        self.linear = 0.0
+        self.angular = 0.0
+        self.x = self.y = self.heading = 0.0
+        self.distance = 0.0
+
+    def command(self, twist: Twist2d):
+        self.target = twist
+
+    def step(self, dt):
+        dv = self.target.linear_velocity_x - self.linear
+        dw = self.target.angular_velocity - self.angular
+        self.linear += max(-MAX_LINEAR_ACCEL * dt, min(MAX_LINEAR_ACCEL * dt, dv))
+        self.angular += max(-MAX_ANGULAR_ACCEL * dt, min(MAX_ANGULAR_ACCEL * dt, dw))
+        self.heading += self.angular * dt
+        self.x += self.linear * math.cos(self.heading) * dt
+        self.y += self.linear * math.sin(self.heading) * dt
+        self.distance += abs(self.linear) * dt
+
+    def odometry(self):
+        return {'x': round(self.x, 2), 'y': round(self.y, 2),
+                'heading_deg': round(math.degrees(self.heading), 1), 'distance': round(self.distance, 2)}
+
+
+class SimConnection:
+    """Per-follower state: protocol, decoder and gates, vehicle, counters."""
+
+    def __init__(self, peer, max_age, deadman):
+        self.peer = peer
+        self.protocol = None
+        self.decoder = VelocityDecoder()
+        self.gate = CommandFilter(max_age)
+        self.watchdog = Deadman(deadman)
+        self.vehicle = SimVehicle()
+        self.commands = 0
+        self.open = True
+
+
+def percentiles_ms(histogram: Histogram):
+    return {'p50': round(histogram.percentile(50) * 1000, 2), 'p95': round(histogram.percentile(95) * 1000, 2),
+            'p99': round(histogram.percentile(99) * 1000, 2), 'max': round(histogram.max * 1000, 2)}
+
+
+class SimController:
+    """asyncio stand-in for controller.py; start() runs it on a background thread, serve() in the caller's loop.
+
+    ``protocol`` is "auto" (per connection, from the first byte), "legacy" or
+    "binary". ``rate`` is how often (Hz) vehicles are stepped and dead-man
+    timeouts checked; the same tick measures event-loop lag.
+    """
+
+    def __init__(self, host="127.0.0.1", port=9999, protocol="auto", simulate=True, echo=False,
+                 rate=50.0, max_age=0.25, deadman=0.5, verbose=False):
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.simulate = simulate
+        self.echo = echo
+        self.rate = rate
+        self.max_age = max_age
+        self.deadman = deadman
+        self.verbose = verbose
+        self.connections = []
+        self.stats = {'connections': 0, 'commands': 0, 'bytes': 0, 'accepted': 0, 'out_of_order': 0,
+                      'stale': 0, 'skipped_bytes': 0, 'deadman_stops': 0}
+        self.wire = Histogram()       # binary: send -> receive (same host clock only)
+        self.capture = Histogram()    # binary: frame capture -> receive
+        self.loop_lag = Histogram()   # tick lateness: how busy the event loop is
+        self.started = None
+        self._server = None
+        self._ready = threading.Event()
+        self._loop = None
+        self._task = None
+        self._thread = None
+
+    async def serve(self):
+        """Listen and tick until cancelled."""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.started = time.monotonic()
+        self._ready.set()
+        async with self._server:
+            await self._tick()
+
+    async def _tick(self):
+        period = 1.0 / self.rate
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(period)
+            now = time.monotonic()
+            self.loop_lag.add(max(0.0, now - last - period))
+            for conn in self.connections:
+                if not conn.open:
+                    continue
+                if self.simulate:
+                    conn.vehicle.step(now - last)
+                if conn.protocol == "binary" and self.deadman is not None and conn.watchdog.expired(now):
+                    self._stop(conn, f"No command for {self.deadman:.2f} s")
+            last = now
+
+    def _stop(self, conn, reason):
+        conn.vehicle.command(Twist2d())
+        self.stats['deadman_stops'] += 1
+        if self.verbose:
+            print(f"[SimController] {conn.peer}: {reason}, stopping")
+
+    async def _handle(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        conn = SimConnection(f"{peer[0]}:{peer[1]}", self.max_age, self.deadman)
+        self.connections.append(conn)
+        self.stats['connections'] += 1
+        if self.verbose:
+            print(f"[SimController] Connection from {conn.peer}")
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                self._receive(conn, data, time.monotonic())
+                if self.echo:
+                    writer.write(data)
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            conn.open = False
+            if conn.protocol == "binary" and self.deadman is not None and conn.watchdog.moving:
+                self._stop(conn, "Connection lost")
+            writer.close()
+
+    def _receive(self, conn, data, now):
+        self.stats['bytes'] += len(data)
+        if conn.protocol is None:
+            conn.protocol = self.protocol if self.protocol != "auto" else (
+                "binary" if data[:1] == MAGIC[:1] else "legacy")
+        if conn.protocol == "legacy":
+            for command in data.decode(errors="replace"):
+                if command in COMMAND_TWIST:
+                    conn.commands += 1
+                    self.stats['commands'] += 1
+                    conn.vehicle.command(Twist2d(*COMMAND_TWIST[command]))
+            return
+
+        skipped = conn.decoder.stats['skipped_bytes']
+        before = dict(conn.gate.stats)
+        newest = None
+        packets = conn.decoder.feed(data)
+        conn.commands += len(packets)
+        self.stats['commands'] += len(packets)
+        for packet in packets:
+            self.wire.add(max(0.0, now - packet.sent_ts))
+            if not math.isnan(packet.capture_ts):
+                self.capture.add(max(0.0, now - packet.capture_ts))
+            if conn.gate.accept(packet, now):
+                newest = packet
+        if newest is not None:  # latest wins within one read
+            conn.vehicle.command(Twist2d(newest.linear, newest.angular))
+            conn.watchdog.kick(newest, now)
+        for key, value in conn.gate.stats.items():
+            self.stats[key] += value - before[key]
+        self.stats['skipped_bytes'] += conn.decoder.stats['skipped_bytes'] - skipped
+
+    def start(self):
+        """Serve on a background thread; returns once the port is bound."""
+        self._loop = asyncio.new_event_loop()
+        self._task = self._loop.create_task(self.serve())
+
+        def run():
+            with contextlib.suppress(asyncio.CancelledError):
+                self._loop.run_until_complete(self._task)
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="sim-controller", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(5.0):
+            raise RuntimeError(f"SimController could not listen on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+            self._thread.join(2.0)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def report(self):
+        elapsed = time.monotonic() - self.started if self.started is not None else 0.0
+        report = dict(self.stats, open=sum(conn.open for conn in self.connections),
+                      per_second=round(self.stats['commands'] / elapsed, 1) if elapsed > 0 else 0.0,
+                      loop_lag_ms=percentiles_ms(self.loop_lag))
+        if self.wire.count:
+            report['wire_ms'] = percentiles_ms(self.wire)
+            report['capture_to_receive_ms'] = percentiles_ms(self.capture)
+        if self.simulate and self.connections:
+            distances = [conn.vehicle.distance for conn in self.connections]
+            report['odometry'] = {'mean_distance': round(sum(distances) / len(distances), 2),
+                                  'example': self.connections[0].vehicle.odometry()}
+        return report
+
+
+def serve_in_child(pipe, protocol):
+    """Child process body for load_test: send the port, serve until told to stop, send the report."""
+    with SimController(port=0, protocol=protocol) as controller:
+        pipe.send(controller.port)
+        pipe.recv()
+        pipe.send(controller.report())
+
+
+def load_test(clients, seconds, fps, protocol, heartbeat=0.5):
+    """Drive `clients` CommandSenders at `fps` each from one feeder thread.
+
+    The SimController runs in its own process, so its event-loop lag is not
+    the senders' threads competing for this interpreter.
+    """
+    import multiprocessing
+
+    from command_sender import CommandSender
+    from tracing import tracer
+
+    pipe, child_pipe = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve_in_child, args=(child_pipe, protocol), daemon=True)
+    server.start()
+    port = pipe.recv()
+    with contextlib.redirect_stdout(io.StringIO()):  # connect and "Sent command" lines from every sender
+        senders = [CommandSender("127.0.0.1", port, heartbeat=heartbeat, name=f"Load{i}",
+                                 protocol=protocol).start() for i in range(clients)]
+        started = time.monotonic()
+        late = 0.0
+        for frame in range(int(seconds * fps)):
+            for i, sender in enumerate(senders):
+                tracer.begin_frame(frame, time.monotonic())
+                command = 'wadsx'[(frame // 15 + i) % 5]  # a new command every half second
+                sender.send(command, (COMMAND_TWIST[command][0], round(0.3 * math.sin(frame / 10 + i), 2)))
+            wait = started + (frame + 1) / fps - time.monotonic()
+            late = max(late, -wait)
+            time.sleep(max(0.0, wait))
+        for sender in senders:
+            sender.close(timeout=0.5)
+        time.sleep(0.2)
+    pipe.send("stop")
+    report = pipe.recv()
+    server.join(5.0)
+    sent = {key: sum(sender.stats[key] for sender in senders) for key in senders[0].stats}
+    return report, sent, late
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="asyncio stand-in for the Amiga controller.py")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--protocol", choices=("auto", "legacy", "binary"), default="auto")
+    parser.add_argument("--echo", action="store_true", help="write every received chunk back to its sender")
+    parser.add_argument("--no-sim", action="store_true", help="only timestamp commands, do not simulate the vehicle")
+    parser.add_argument("--load", type=int, default=0, help="run a load test with this many simulated followers")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--fps", type=float, default=30.0)
+    args = parser.parse_args()
+
+    if args.load:
+        protocol = "legacy" if args.protocol == "auto" else args.protocol
+        report, sent, late = load_test(args.load, args.seconds, args.fps, protocol)
+        print(f"[SimController] {args.load} followers x {args.fps:.0f} fps, {protocol}: senders {sent}, "
+              f"feeder at most {late * 1000:.0f} ms behind")
+        print(f"[SimController] {report}")
+    else:
+        controller = SimController(args.host, args.port, args.protocol, simulate=not args.no_sim, echo=args.echo,
+                                   verbose=True)
+
+        async def report_every(seconds):
+            while True:
+                await asyncio.sleep(seconds)
+                print(f"[SimController] {controller.report()}")
+
+        async def main():
+            await asyncio.gather(controller.serve(), report_every(5.0))
+
+        print(f"[SimController] Listening on {args.host}:{args.port}. Ctrl+C to stop.")
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            print(f"[SimController] {controller.report()}")
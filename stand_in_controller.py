@@ -0,0 +1,218 @@
+#Local stand-in for the robot-side controller.py
+#Accepts the same single-character commands on a TCP port and records when
+#each one arrived, so the follower scripts and replay_bench.py can run
+#against it on a dev box without the Amiga. With protocol="binary" it reads
+#framed velocity messages instead (velocity_protocol.py), drops out-of-order
+#and stale ones the way controller.py should, and records the rest as the
+#closest legacy character. transport="udp" receives one message per datagram
+#and executes only the newest of any that queued up. With a deadman timeout it
+#stops the robot (records an 'x') when commands stop arriving while moving
+#
+#Run it on its own with:  python3 stand_in_controller.py --port 9999 [--protocol binary] [--transport udp]
+
+import argparse
+import socket
+import threading
+import time
+
+from velocity_protocol import CommandFilter, Deadman, VelocityDecoder, decode, to_legacy
+
+
+class StandInController:
+    """Threaded TCP (or UDP) server that records every executed command with its arrival time."""
+
+    def __init__(self, host="127.0.0.1", port=0, verbose=False, protocol="legacy", max_age=0.25,
+                 transport="tcp", deadman=None):
+        if transport == "udp" and protocol != "binary":
+            raise ValueError("The udp transport carries binary messages only")
+        self.host = host
+        self.port = port
+        self.verbose = verbose
+        self.protocol = protocol
+        self.max_age = max_age  # binary: oldest command frame still executed, seconds
+        self.transport = transport
+        self.deadman = deadman  # binary: stop after this many seconds without a command, None disables
+        self.commands = []  # (arrival time.perf_counter(), command)
+        self.velocities = []  # binary: (arrival time.monotonic(), VelocityCommand) executed
+        self.stats = {'packets': 0, 'accepted': 0, 'out_of_order': 0, 'stale': 0, 'skipped_bytes': 0,
+                      'superseded': 0, 'deadman_stops': 0}
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._running = threading.Event()
+
+    def start(self):
+        if self.transport == "udp":
+            self._server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._server.bind((self.host, self.port))
+            target = self._datagram_loop
+        else:
+            self._server = socket.create_server((self.host, self.port))
+            target = self._accept_loop
+        self.port = self._server.getsockname()[1]
+        self._server.settimeout(0.2)
+        self._running.set()
+        threading.Thread(target=target, name="stand-in-accept", daemon=True).start()
+        return self
+
+    def _accept_loop(self):
+        while self._running.is_set():
+            try:
+                conn, addr = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.connections += 1
+            if self.verbose:
+                print(f"[Controller] Connection from {addr[0]}:{addr[1]}")
+            threading.Thread(target=self._client_loop, args=(conn,), daemon=True).start()
+
+    def _client_loop(self, conn):
+        conn.settimeout(0.2 if self.deadman is None else min(0.2, self.deadman / 5))
+        if self.protocol == "binary":
+            decoder, gate, watchdog = VelocityDecoder(), CommandFilter(self.max_age), Deadman(self.deadman)
+        with conn:
+            while self._running.is_set():
+                try:
+                    data = conn.recv(1024)
+                except socket.timeout:
+                    if self.protocol == "binary":
+                        self._check_deadman(watchdog)
+                    continue
+                except OSError:
+                    break
+                if not data:
+                    break
+                now = time.perf_counter()
+                if self.protocol == "binary":
+                    skipped = decoder.stats['skipped_bytes']
+                    packets = decoder.feed(data)
+                    with self._lock:
+                        self.stats['skipped_bytes'] += decoder.stats['skipped_bytes'] - skipped
+                    self._execute(now, packets, gate, watchdog)
+                    continue
+                text = data.decode(errors="replace")
+                with self._lock:
+                    self.commands.extend((now, command) for command in text)
+                if self.verbose:
+                    print(f"[Controller] Received: {text}")
+        if self.protocol == "binary" and self.deadman is not None and watchdog.moving:
+            self._stop("Connection lost")  # controller.py stops as soon as its client goes away
+
+    def _datagram_loop(self):
+        """One message per datagram; everything already queued is read before executing the newest."""
+        senders = {}  # address -> (CommandFilter, Deadman)
+        while self._running.is_set():
+            self._server.settimeout(0.2 if self.deadman is None else min(0.2, self.deadman / 5))
+            try:
+                datagrams = [self._server.recvfrom(2048)]
+            except socket.timeout:
+                for _, watchdog in senders.values():
+                    self._check_deadman(watchdog)
+                continue
+            except OSError:
+                break
+            self._server.settimeout(0.0)
+            while True:
+                try:
+                    datagrams.append(self._server.recvfrom(2048))
+                except (BlockingIOError, socket.timeout):
+                    break
+            now = time.perf_counter()
+            batches = {}
+            for data, addr in datagrams:
+                try:
+                    batches.setdefault(addr, []).append(decode(data))
+                except ValueError:
+                    with self._lock:
+                        self.stats['skipped_bytes'] += len(data)
+            for addr, packets in batches.items():
+                if addr not in senders:
+                    senders[addr] = CommandFilter(self.max_age), Deadman(self.deadman)
+                    self.connections += 1
+                    if self.verbose:
+                        print(f"[Controller] Datagrams from {addr[0]}:{addr[1]}")
+                gate, watchdog = senders[addr]
+                last = gate.last_seq or 0
+                packets.sort(key=lambda packet: (packet.seq - last) & 0xFFFFFFFF)  # reordered in flight
+                self._execute(now, packets, gate, watchdog)
+            for _, watchdog in senders.values():
+                self._check_deadman(watchdog)
+
+    def _execute(self, now, packets, gate, watchdog):
+        """Filter decoded messages and execute the newest accepted one (latest wins)."""
+        received = time.monotonic()
+        before = dict(gate.stats)
+        accepted = [packet for packet in packets if gate.accept(packet, received)]
+        if self.verbose:
+            for packet in packets:
+                if packet not in accepted:
+                    print(f"[Controller] Dropped #{packet.seq}")
+        with self._lock:
+            for key, value in gate.stats.items():
+                self.stats[key] += value - before[key]
+            self.stats['packets'] += len(packets)
+            if not accepted:
+                return
+            self.stats['superseded'] += len(accepted) - 1
+            packet = accepted[-1]
+            self.velocities.append((received, packet))
+            self.commands.append((now, to_legacy(packet.linear, packet.angular)))
+        watchdog.kick(packet, received)
+        if self.verbose:
+            print(f"[Controller] Received #{packet.seq}: {packet.linear:+.2f} m/s {packet.angular:+.2f} rad/s"
+                  f"{' (heartbeat)' if packet.heartbeat else ''}")
+
+    def _check_deadman(self, watchdog):
+        if self.deadman is not None and watchdog.expired():
+            self._stop(f"No command for {self.deadman:.2f} s")
+
+    def _stop(self, reason):
+        with self._lock:
+            self.stats['deadman_stops'] += 1
+            self.commands.append((time.perf_counter(), 'x'))
+        if self.verbose:
+            print(f"[Controller] {reason}, stopping")
+
+    def received(self):
+        """Return the commands received so far as one string."""
+        with self._lock:
+            return "".join(command for _, command in self.commands)
+
+    def stop(self):
+        self._running.clear()
+        if self._server is not None:
+            self._server.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Amiga controller.py")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--protocol", choices=("legacy", "binary"), default="legacy")
+    parser.add_argument("--transport", choices=("tcp", "udp"), default="tcp")
+    parser.add_argument("--max-age", type=float, default=0.25, help="binary: drop commands from older frames (s)")
+    parser.add_argument("--deadman", type=float, default=0.5, help="binary: stop after this long without commands (s)")
+    args = parser.parse_args()
+
+    protocol = "binary" if args.transport == "udp" else args.protocol
+    controller = StandInController(args.host, args.port, verbose=True, protocol=protocol, max_age=args.max_age,
+                                   transport=args.transport, deadman=args.deadman).start()
+    print(f"[Controller] Listening on {args.transport} {args.host}:{controller.port}. Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        controller.stop()
+        print(f"[Controller] {len(controller.commands)} commands from {controller.connections} connections.")
+        if protocol == "binary":
+            print(f"[Controller] {controller.stats}")
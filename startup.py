@@ -0,0 +1,213 @@
+#Parallel startup for the follower scripts and planner.py
+#Opening the camera (device boot and pipeline upload) and loading the detectors
+#(MediaPipe graphs, the UNet) don't depend on each other, so Startup.run() does
+#them on their own threads while CommandSender connects to the robot in the
+#background; startup takes as long as the slowest step instead of the sum.
+#depthai, cvzone/MediaPipe and torch are only imported inside those steps, so
+#importing a script stays cheap.
+#warm_up() runs a detector once on a blank frame while the camera is still
+#booting, so the first real frame doesn't pay for lazy graph initialisation
+#
+#Prints a timing breakdown once ready, and the time to the first command sent.
+#Serial vs parallel benchmark with stand-in steps (sleeps for the camera,
+#a CPU-bound model load, a local stand-in controller):
+#  python3 startup.py [--camera 2.0 --model 1.5]
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+HEAVY_MODULES = ("depthai", "cvzone", "mediapipe", "torch", "torchvision", "segmentation_models_pytorch",
+                 "onnxruntime")
+
+_IMPORTED = time.perf_counter()
+_warmups = {}  # detector class name -> seconds spent in warm_up()
+
+
+def process_started() -> float:
+    """time.perf_counter() at process start (from /proc on Linux), else when this module was imported."""
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        age = time.clock_gettime(time.CLOCK_BOOTTIME) - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return time.perf_counter() - age
+    except (OSError, IndexError, ValueError, AttributeError):
+        return _IMPORTED
+
+
+def warm_up(detector, size):
+    """Run ``detector`` once on a blank ``size`` (width, height) frame and return it.
+
+    Dispatches like detection_cache.cached(): cvzone findPose/findHands, the
+    planner Segmenter's steer(), or a plain call (perception.PoseHandsPerception).
+    Call it on the bare detector, before any cache or tracker wraps it.
+    """
+    started = time.perf_counter()
+    blank = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+    if hasattr(detector, 'findPose'):
+        detector.findPose(blank, draw=False)
+    elif hasattr(detector, 'findHands'):
+        detector.findHands(blank, draw=False)
+    elif hasattr(detector, 'steer'):
+        detector.steer(blank)
+    else:
+        detector(blank)
+    name = type(detector).__name__
+    _warmups[name] = _warmups.get(name, 0.0) + time.perf_counter() - started
+    return detector
+
+
+class Startup:
+    """Runs independent startup steps concurrently and times them.
+
+    ``run(camera=source.open, detector=build)`` calls every step on its own
+    thread and returns their results by name. If a step raises, the others are
+    still waited for, any result with a close() (an opened camera) is closed and
+    the first error is raised. ``watch(sender)`` returns a send() that records
+    when the first command went out.
+    """
+
+    def __init__(self, name: str = "Follower", verbose: bool = True):
+        self.name = name
+        self.verbose = verbose  # print the breakdown when ready and the first command
+        self.process_start = process_started()
+        self.started = time.perf_counter()
+        self.steps = {}  # name -> (start, end), perf_counter
+        self.ready = None
+        self.sender = None
+        self.first_command = None
+
+    def run(self, **steps) -> dict:
+        results, errors = {}, []
+        self.steps = dict.fromkeys(steps)  # report in the order given
+
+        def step(name, target):
+            started = time.perf_counter()
+            try:
+                results[name] = target()
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                self.steps[name] = (started, time.perf_counter())
+
+        threads = [threading.Thread(target=step, args=item, name=f"startup-{item[0]}", daemon=True)
+                   for item in steps.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.ready = time.perf_counter()
+        if errors:
+            for result in results.values():
+                if hasattr(result, 'close'):
+                    result.close()
+            raise errors[0]
+        if self.verbose:
+            print(f"[{self.name}] Startup: {self.report()}")
+        return results
+
+    def watch(self, sender, send=None):
+        """``send`` (by default ``sender.send``) that also records the time of the first command."""
+        self.sender = sender
+        forward = send or sender.send
+
+        def send(*args):
+            if self.first_command is None:
+                self.first_command = time.perf_counter()
+                if self.verbose:
+                    print(f"[{self.name}] First command {args[0]!r} at "
+                          f"{self.first_command - self.process_start:.2f}s")
+            forward(*args)
+        return send
+
+    def report(self) -> str:
+        """Seconds since process start: imports, each step, ready, robot connected, first command."""
+        def at(t):
+            return f"{t - self.process_start:.2f}s"
+
+        parts = [f"imports {self.started - self.process_start:.2f}s"]
+        if self.steps:
+            durations = {name: end - start for name, (start, end) in self.steps.items()}
+            steps = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in durations.items())
+            if _warmups:
+                warmups = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in _warmups.items())
+                steps += f" (warm-up {warmups})"
+            parts.append(f"{steps} in parallel, {sum(durations.values()):.2f}s serial")
+        if self.ready is not None:
+            parts.append(f"ready at {at(self.ready)}")
+        if self.sender is not None:
+            connected = self.sender.first_connected
+            parts.append(f"robot connected at {at(connected)}" if connected is not None else "robot not connected")
+        if self.first_command is not None:
+            parts.append(f"first command at {at(self.first_command)}")
+        return " | ".join(parts)
+
+
+def heavy_imports(modules):
+    """Heavy libraries loaded by importing ``modules``, checked in a fresh interpreter."""
+    import subprocess
+    code = (f"import sys\nfor name in {list(modules)!r}: __import__(name)\n"
+            f"print(' '.join(sorted({{m.split('.')[0] for m in sys.modules}} & {set(HEAVY_MODULES)!r})))")
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.split()
+    return output, time.perf_counter() - started
+
+
+def bench(camera=2.0, model=1.5, rounds=3):
+    """Time to first command on the wire for the old serial startup vs Startup.run(), with stand-in steps."""
+    import contextlib
+    import io
+
+    from command_sender import CommandSender
+    from stand_in_controller import StandInController
+
+    scripts = ("follow", "full_follow", "backtrack_follow", "fist_follow", "center_follow", "depth_follow",
+               "height_follow", "tight_spaces", "planner")
+    loaded, seconds = heavy_imports(scripts)
+    print(f"[Startup] Importing all {len(scripts)} scripts: {seconds:.2f}s in a fresh interpreter, "
+          f"heavy libraries loaded: {', '.join(loaded) or 'none'}")
+
+    def open_camera():
+        time.sleep(camera)  # device boot + pipeline upload; depthai releases the GIL meanwhile
+
+    def load_model():
+        deadline = time.perf_counter() + model  # imports + graph init, holding the GIL
+        while time.perf_counter() < deadline:
+            sum(range(1000))
+
+    with StandInController() as controller:
+        for label in ("serial", "parallel"):
+            times = []
+            for _ in range(rounds):
+                del controller.commands[:]
+                startup = Startup(name="Startup", verbose=False)
+                startup.started = startup.process_start = time.perf_counter()  # time from here, not the process
+                with contextlib.redirect_stdout(io.StringIO()):  # the sender's connect messages
+                    sender = CommandSender("127.0.0.1", controller.port, name="Startup", verbose=False).start()
+                    if label == "parallel":
+                        startup.run(camera=open_camera, detector=load_model)
+                    else:
+                        load_model()  # what main() used to do: build the detector, then open the camera
+                        open_camera()
+                    startup.watch(sender)('w')
+                    sender.close(final_command=None)
+                while not controller.commands:
+                    time.sleep(0.001)
+                times.append(controller.commands[0][0] - startup.started)
+            print(f"[Startup] {label:8s}: first command at the controller after {np.median(times):.2f}s "
+                  f"(camera {camera:.1f}s, model load {model:.1f}s)")
+        print(f"[Startup] Last parallel run: {startup.report()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark serial vs parallel startup with stand-in steps")
+    parser.add_argument("--camera", type=float, default=2.0, help="stand-in camera open time, seconds")
+    parser.add_argument("--model", type=float, default=1.5, help="stand-in CPU-bound model load time, seconds")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    bench(args.camera, args.model, args.rounds)
@@ -0,0 +1,222 @@
+#Sequence/timestamp synchroniser for scripts that read more than one DepthAI stream
+#Reading each queue on its own with a blocking get() pairs whatever frame
+#happens to be at the head of each queue: after a single dropped or late frame
+#the depth, left and right images come from different captures, and one slow
+#stream holds up the others. StreamSynchronizer drains every queue into a small
+#bounded buffer per stream and hands out the newest complete set whose frames
+#share a sequence number (streams from one node, e.g. the stereo outputs) or
+#whose timestamps agree within max_skew (different cameras, e.g. RGB + depth).
+#Frames older than the set it hands out can no longer be matched and are dropped
+#
+#Simulated stereo streams with drops, jitter and a slow consumer:
+#  python3 stream_sync.py
+
+import argparse
+import random
+import time
+from collections import deque
+
+MATCHES = ("sequence", "timestamp")
+
+
+class StreamSynchronizer:
+    """Matches messages across DepthAI output queues by sequence number or timestamp.
+
+    ``queues`` maps a stream name to anything with get() and tryGetAll()/tryGet()
+    (a dai.DataOutputQueue or a frame source). get() blocks until a complete set
+    is available and returns it as {name: message}; tryGet() returns None instead.
+    With ``match="timestamp"`` the first stream is the reference the others are
+    matched to.
+    """
+
+    def __init__(self, queues, match="sequence", max_skew=0.02, max_buffer=8):
+        if match not in MATCHES:
+            raise ValueError(f"Unknown match {match!r}, expected one of {MATCHES}")
+        self.queues = dict(queues)
+        self.names = list(self.queues)
+        self.match = match
+        self.tolerance = 0 if match == "sequence" else max_skew
+        self.buffers = {name: deque(maxlen=max_buffer) for name in self.names}  # (key, message)
+        self.stats = {'sets': 0, 'waits': 0,
+                      'stale': dict.fromkeys(self.names, 0),  # unmatched, older than a handed-out set
+                      'overflow': dict.fromkeys(self.names, 0)}  # pushed out of a full buffer
+        self.skew_sum = 0.0
+        self.skew_max = 0.0
+
+    def _key(self, message):
+        if self.match == "sequence":
+            return message.getSequenceNum()
+        return message.getTimestamp().total_seconds()
+
+    def _push(self, name, message):
+        buffer = self.buffers[name]
+        if len(buffer) == buffer.maxlen:
+            self.stats['overflow'][name] += 1
+        buffer.append((self._key(message), message))
+
+    def _drain(self):
+        for name, queue in self.queues.items():
+            if hasattr(queue, 'tryGetAll'):
+                messages = queue.tryGetAll()
+            else:
+                messages = []
+                message = queue.tryGet()
+                while message is not None:
+                    messages.append(message)
+                    message = queue.tryGet()
+            for message in messages:
+                self._push(name, message)
+
+    def _match(self):
+        """Buffer index per stream of the newest complete set, or None."""
+        reference, others = self.buffers[self.names[0]], self.names[1:]
+        for i in range(len(reference) - 1, -1, -1):
+            key = reference[i][0]
+            found = [i]
+            for name in others:
+                buffer = self.buffers[name]
+                if not buffer:
+                    return None
+                j = min(range(len(buffer)), key=lambda j: abs(buffer[j][0] - key))
+                if abs(buffer[j][0] - key) > self.tolerance:
+                    break
+                found.append(j)
+            else:
+                return found
+        return None
+
+    def _take(self, found):
+        group, keys = {}, []
+        for name, index in zip(self.names, found):
+            buffer = self.buffers[name]
+            self.stats['stale'][name] += index
+            for _ in range(index):
+                buffer.popleft()
+            key, group[name] = buffer.popleft()
+            keys.append(key)
+        skew = max(keys) - min(keys)
+        self.skew_sum += skew
+        self.skew_max = max(self.skew_max, skew)
+        self.stats['sets'] += 1
+        return group
+
+    def _lagging(self):
+        """Stream to block on: an empty one, else the one whose newest message is oldest."""
+        return min(self.names, key=lambda name: self.buffers[name][-1][0] if self.buffers[name] else float('-inf'))
+
+    def tryGet(self):
+        """Newest complete set without blocking, or None."""
+        self._drain()
+        found = self._match()
+        return self._take(found) if found is not None else None
+
+    def get(self):
+        """Block until a complete set is available and return it."""
+        group = self.tryGet()
+        while group is None:
+            self.stats['waits'] += 1
+            name = self._lagging()
+            self._push(name, self.queues[name].get())
+            group = self.tryGet()
+        return group
+
+    def report(self):
+        report = {'sets': self.stats['sets'], 'waits': self.stats['waits'],
+                  'stale': dict(self.stats['stale']), 'overflow': dict(self.stats['overflow'])}
+        if self.match == "timestamp" and self.stats['sets']:
+            report['skew_ms'] = {'mean': round(self.skew_sum * 1000 / self.stats['sets'], 2),
+                                 'max': round(self.skew_max * 1000, 2)}
+        return report
+
+
+class EndOfStream(Exception):
+    pass
+
+
+class SimQueue:
+    """Non-blocking DepthAI-style output queue (maxSize, oldest dropped) fed from a timeline."""
+
+    def __init__(self, clock, arrivals, max_size=4):
+        self.clock = clock  # one-element list shared by every queue: the current time
+        self.pending = deque(sorted(arrivals, key=lambda arrival: arrival[0]))  # (arrival time, message)
+        self.buffer = deque(maxlen=max_size)
+
+    def _fill(self):
+        while self.pending and self.pending[0][0] <= self.clock[0]:
+            self.buffer.append(self.pending.popleft()[1])
+
+    def tryGet(self):
+        self._fill()
+        return self.buffer.popleft() if self.buffer else None
+
+    def tryGetAll(self):
+        self._fill()
+        messages = list(self.buffer)
+        self.buffer.clear()
+        return messages
+
+    def get(self):
+        self._fill()
+        if not self.buffer:
+            if not self.pending:
+                raise EndOfStream
+            self.clock[0] = self.pending[0][0]
+            self._fill()
+        return self.buffer.popleft()
+
+
+def simulated_stereo(clock, frames, fps=30.0, drop=0.03, seed=0):
+    """depth/left/right queues carrying the same captures with independent drops and delivery jitter."""
+    from frame_source import SourceFrame
+
+    rng = random.Random(seed)
+    latency = {'depth': 0.012, 'left': 0.006, 'right': 0.006}  # disparity leaves the device last
+    queues = {}
+    for name, delay in latency.items():
+        arrivals = []
+        for seq in range(frames):
+            if rng.random() < drop:
+                continue
+            captured = seq / fps
+            arrivals.append((captured + delay + rng.uniform(0, 0.015), SourceFrame(None, seq, captured)))
+        queues[name] = SimQueue(clock, arrivals)
+    return queues
+
+
+def consume(read, clock, rng, work=(0.02, 0.05)):
+    """Read sets until the streams end; the display loop takes `work` seconds per set."""
+    mismatched = total = 0
+    try:
+        while True:
+            group = read()
+            seqs = {message.getSequenceNum() for message in group.values()}
+            total += 1
+            mismatched += len(seqs) > 1
+            clock[0] += rng.uniform(*work)
+    except EndOfStream:
+        pass
+    return total, mismatched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare independent queue reads with the stream synchroniser")
+    parser.add_argument("--frames", type=int, default=3000)
+    parser.add_argument("--drop", type=float, default=0.03, help="per-stream frame drop probability")
+    args = parser.parse_args()
+
+    # depth.py before: one blocking get() per queue
+    clock = [0.0]
+    queues = simulated_stereo(clock, args.frames, drop=args.drop)
+    total, mismatched = consume(lambda: {name: queue.get() for name, queue in queues.items()},
+                                clock, random.Random(1))
+    print(f"[Sync] independent get(): {total} sets, {mismatched} ({mismatched / total * 100:.1f}%) "
+          f"mixed captures")
+
+    clock = [0.0]
+    sync = StreamSynchronizer(simulated_stereo(clock, args.frames, drop=args.drop))
+    started = time.perf_counter()
+    total, mismatched = consume(sync.get, clock, random.Random(1))
+    elapsed = time.perf_counter() - started
+    print(f"[Sync] synchroniser: {total} sets, {mismatched} mixed captures, "
+          f"{elapsed * 1e6 / max(total, 1):.1f} us/set host overhead")
+    print(f"[Sync] {sync.report()}")
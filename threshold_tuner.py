@@ -0,0 +1,386 @@
+#Threshold sweep and auto-tuner over recorded sessions
+#Replays labelled detections through a follower's zone/steering policy for a
+#whole grid of thresholds at once. Every policy is vectorised with NumPy over
+#(parameter sets x frames), the grid is split across a process pool, and each
+#setting is scored on agreement with the labelled commands minus a penalty for
+#one-frame command blips (a -> d -> a), which make the robot jitter
+#
+#Sessions are the `<video>.detections.jsonl` sidecars VideoFileSource reads,
+#one line per frame, with the command the robot should have sent:
+#  {"bbox": [x, y, w, h], "fist": false, "command": "w", "frame_size": [1280, 720]}
+#  {"path": [count, mean_x], "width": 256, "command": "a"}          (planner)
+#Frames without "command" are replayed but not scored.
+#
+#  python3 threshold_tuner.py full_follow walk1.mp4.detections.jsonl walk2.mp4.detections.jsonl
+#  python3 threshold_tuner.py center_follow *.jsonl --grid lower=0.6:1.0:0.02 center_tolerance=0.05,0.1
+#  python3 threshold_tuner.py --bench            # synthetic labelled sessions, vectorised vs decide()
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from mask_steering import TOLERANCE
+
+X, W, A, S, D = (np.uint8(ord(command)) for command in "xwasd")
+MODES = {  # follower -> (policy, a fist latches a permanent stop)
+    'full_follow': ("zone", True),
+    'backtrack_follow': ("zone", True),
+    'tight_spaces': ("zone", False),
+    'center_follow': ("center", True),
+    'planner': ("path", False),
+}
+GRIDS = {  # default sweep ranges, (start, stop, step) in frame fractions (pixels at width 256 for the planner)
+    'zone': {'lower': (0.40, 1.00, 0.025), 'upper': (0.60, 1.40, 0.025), 'center_tolerance': (0.02, 0.30, 0.02)},
+    'path': {'tolerance': (2, 80, 2)},
+}
+GRIDS['center'] = GRIDS['zone']
+OSCILLATION_WEIGHT = 0.5  # score = agreement - weight * blip rate
+BLOCK = 4_000_000  # (parameter sets x frames) evaluated per NumPy pass, bounds memory
+
+
+def load_session(path, frame_size=(1280, 720)):
+    """Read one detections.jsonl sidecar into per-frame arrays."""
+    with open(path) as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    return session_arrays(lines, frame_size)
+
+
+def session_arrays(lines, frame_size=(1280, 720)):
+    """Per-frame arrays (person box as in person_box(), path centroid, fist, label) from detection dicts."""
+    n = len(lines)
+    offset, w, h = np.full(n, np.nan), np.full(n, np.nan), np.full(n, np.nan)
+    count, path_x, width = np.zeros(n), np.full(n, np.nan), np.full(n, 256.0)
+    fist = np.zeros(n, bool)
+    label = np.zeros(n, np.uint8)  # 0 = not labelled
+    for i, line in enumerate(lines):
+        bbox = line.get('bbox')
+        if bbox is not None:
+            fw, fh = line.get('frame_size') or frame_size
+            x, _, bw, bh = (int(v) for v in bbox)
+            offset[i], w[i], h[i] = (x + bw // 2 - fw / 2) / fw, bw / fw, bh / fh
+        path = line.get('path')
+        if path is not None and path[0]:
+            count[i], path_x[i] = path[0], path[1]
+        width[i] = line.get('width', 256)
+        fist[i] = bool(line.get('fist', False))
+        if line.get('command'):
+            label[i] = ord(line['command'])
+    return {'offset': offset, 'w': w, 'h': h, 'count': count, 'path_x': path_x, 'width': width,
+            'fist': fist, 'label': label}
+
+
+def concat_sessions(sessions, latch_fist=True):
+    """One set of arrays for all sessions; `stopped` latches per session, `start` marks where each begins."""
+    merged = {key: np.concatenate([session[key] for session in sessions]) for key in sessions[0]}
+    stopped = [np.maximum.accumulate(session['fist']) if latch_fist else np.zeros(len(session['fist']), bool)
+               for session in sessions]
+    merged['stopped'] = np.concatenate(stopped)
+    start = np.zeros(len(merged['label']), bool)
+    start[np.cumsum([0] + [len(session['label']) for session in sessions[:-1]])] = True
+    merged['start'] = start
+    return merged
+
+
+def steer(offset, tolerance, centered):
+    """steer() of the follower scripts: centered inside the tolerance, else turn toward the offset."""
+    return np.where(np.abs(offset) < tolerance, centered, np.where(offset < 0, A, D)).astype(np.uint8)
+
+
+def zone_commands(data, lower, upper, center_tolerance, too_close=0.9, steer_all=False):
+    """Commands of full_follow/backtrack_follow/tight_spaces (or center_follow with steer_all) decide().
+
+    Parameters are (P, 1) columns, so the result is a (P, frames) uint8 array
+    of command characters. The occupancy guard is not modelled.
+    """
+    w, h, offset = data['w'], data['h'], data['offset']
+    close = (w >= too_close) | (h >= too_close)  # NaN (no person) compares False everywhere
+    mid = (lower <= h) & (h <= upper)
+    far = h < lower
+    if steer_all:
+        choices = [steer(offset, center_tolerance, S), steer(offset, center_tolerance, X),
+                   steer(offset, center_tolerance, W)]
+    else:
+        choices = [S, X, steer(offset, center_tolerance, W)]
+    commands = np.select([close, ~close & mid, ~close & ~mid & far], choices, X)
+    commands[:, data['stopped']] = X
+    return commands
+
+
+def path_commands(data, tolerance):
+    """command_from_centroid() of planner.py for (P, 1) tolerances in pixels."""
+    offset = data['path_x'] - data['width'] / 2
+    commands = steer(offset, tolerance, W)
+    commands[:, data['count'] == 0] = X
+    return commands
+
+
+def commands_for(policy, data, params, too_close=0.9):
+    """(P, frames) commands for the parameter sets in ``params`` (name -> (P,) array)."""
+    columns = {name: np.asarray(values, float)[:, None] for name, values in params.items()}
+    if policy == "path":
+        return path_commands(data, columns['tolerance'])
+    return zone_commands(data, columns['lower'], columns['upper'], columns['center_tolerance'],
+                         too_close, steer_all=policy == "center")
+
+
+def score(commands, data):
+    """Agreement, change and blip rates per row of a (P, frames) command array."""
+    labelled = data['label'] > 0
+    agreement = (commands[:, labelled] == data['label'][labelled]).mean(axis=1) if labelled.any() \
+        else np.full(len(commands), np.nan)
+    same_session = ~data['start'][1:]
+    changed = (commands[:, 1:] != commands[:, :-1]) & same_session
+    inner = same_session[1:] & same_session[:-1]
+    blips = (commands[:, 2:] == commands[:, :-2]) & changed[:, 1:] & inner
+    frames = commands.shape[1]
+    return {'agreement': agreement, 'changes': changed.sum(axis=1) / frames, 'blips': blips.sum(axis=1) / frames}
+
+
+_worker = {}
+
+
+def _init_worker(policy, data, too_close):
+    _worker.update(policy=policy, data=data, too_close=too_close)
+
+
+def evaluate(params):
+    """Score a chunk of parameter sets, BLOCK elements at a time, in the worker's data."""
+    policy, data, too_close = _worker['policy'], _worker['data'], _worker['too_close']
+    total = len(next(iter(params.values())))
+    step = max(1, BLOCK // len(data['label']))
+    parts = []
+    for i in range(0, total, step):
+        block = {name: values[i:i + step] for name, values in params.items()}
+        parts.append(score(commands_for(policy, data, block, too_close), data))
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def grid_points(grid, policy):
+    """Cartesian product of the grid axes as name -> (P,) arrays, dropping lower > upper."""
+    names = list(grid)
+    mesh = np.meshgrid(*(np.asarray(grid[name], float) for name in names), indexing="ij")
+    params = {name: axis.ravel() for name, axis in zip(names, mesh)}
+    if policy != "path":
+        keep = params['lower'] <= params['upper']
+        params = {name: values[keep] for name, values in params.items()}
+    return params
+
+
+def sweep(data, policy, grid, processes=None, too_close=0.9):
+    """Score every grid point, in `processes` workers; returns (params, metrics) arrays."""
+    params = grid_points(grid, policy)
+    total = len(next(iter(params.values())))
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        _init_worker(policy, data, too_close)
+        return params, evaluate(params)
+    bounds = np.linspace(0, total, min(total, processes * 4) + 1).astype(int)  # a few chunks per worker
+    chunks = [{name: values[a:b] for name, values in params.items()} for a, b in zip(bounds, bounds[1:])]
+    with multiprocessing.get_context().Pool(processes, _init_worker, (policy, data, too_close)) as pool:
+        parts = pool.map(evaluate, chunks)
+    return params, {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def ranked(params, metrics, top=5, prefer=None):
+    """The `top` settings by score, best first, as dicts; ties go to the setting nearest `prefer`.
+
+    Ties are common: in the zone policy, for example, heights above UPPER_HEIGHT
+    stop the robot just like the middle zone does, so UPPER_HEIGHT only matters
+    to center_follow.
+    """
+    agreement = np.nan_to_num(metrics['agreement'], nan=0.0)
+    total = agreement - OSCILLATION_WEIGHT * metrics['blips']
+    distance = sum(np.abs(values - prefer[name]) / (np.ptp(values) or 1)
+                   for name, values in params.items()) if prefer else np.zeros(len(total))
+    order = np.lexsort((distance, -total))[:top]
+    return [dict({name: round(float(values[i]), 4) for name, values in params.items()},
+                 score=round(float(total[i]), 4), agreement=round(float(agreement[i]), 4),
+                 changes=round(float(metrics['changes'][i]), 4), blips=round(float(metrics['blips'][i]), 4))
+            for i in order]
+
+
+def current_settings(mode):
+    """The hand-tuned values in the follower script (or mask_steering.py for the planner)."""
+    if mode == "planner":
+        return {'tolerance': TOLERANCE}
+    module = importlib.import_module(mode)
+    return {'lower': module.LOWER_HEIGHT, 'upper': module.UPPER_HEIGHT,
+            'center_tolerance': module.center_tolerance}
+
+
+def parse_grid(specs, policy):
+    """Default grid for the policy, with 'name=start:stop:step' or 'name=v1,v2,...' overrides."""
+    axes = {name: np.round(np.arange(start, stop + step / 2, step), 6)
+            for name, (start, stop, step) in GRIDS[policy].items()}
+    for spec in specs or []:
+        name, values = spec.split("=", 1)
+        if name not in axes:
+            raise ValueError(f"Unknown parameter '{name}' for the {policy} policy, expected one of {list(axes)}")
+        if ":" in values:
+            start, stop, step = (float(v) for v in values.split(":"))
+            axes[name] = np.round(np.arange(start, stop + step / 2, step), 6)
+        else:
+            axes[name] = np.array([float(v) for v in values.split(",")])
+    return axes
+
+
+def describe(setting, mode):
+    """A setting as the constants to paste back into the script."""
+    if mode == "planner":
+        return f"TOLERANCE = {setting['tolerance']:g}"
+    return (f"LOWER_HEIGHT = {round(setting['lower'] * 720)} / 720, "
+            f"UPPER_HEIGHT = {round(setting['upper'] * 720)} / 720, center_tolerance = {setting['center_tolerance']:g}")
+
+
+def synthetic_lines(count=4, frames=3000, seed=0):
+    """Stand-in sessions: SyntheticSource's scripted walk with detector jitter, a fist at the very end."""
+    from frame_source import SyntheticSource
+
+    rng = np.random.default_rng(seed)
+    source = SyntheticSource()
+    sessions = []
+    for s in range(count):
+        lines = []
+        for i, seq in enumerate(range(s * 997, s * 997 + frames)):
+            bbox, _, path_center = source.ground_truth(seq)
+            if bbox is not None:
+                x, y, w, h = bbox
+                bbox = [int(x + rng.normal(0, 8)), y, w, max(1, int(h + rng.normal(0, 12)))]  # pixels
+            lines.append({'bbox': bbox, 'fist': i >= frames - 30,
+                          'path': [1.0, float(path_center + rng.normal(0, 4))], 'width': 256})
+        sessions.append(lines)
+    return sessions
+
+
+def label_lines(lines, mode, truth, noise=0.03, seed=0):
+    """Add the 'command' an operator would have chosen: `truth` thresholds, plus a few mistakes."""
+    policy, latch = MODES[mode]
+    data = concat_sessions([session_arrays(lines)], latch)
+    labels = commands_for(policy, data, {name: [truth[name]] for name in GRIDS[policy]})[0]
+    rng = np.random.default_rng(seed)
+    flip = rng.random(len(labels)) < noise
+    labels[flip] = rng.choice(np.array([X, W, A, S, D], np.uint8), flip.sum())
+    for line, label in zip(lines, labels):
+        line['command'] = chr(label)
+
+
+def scalar_commands(module, lines, values):
+    """The script's own decide(), frame by frame, with its module constants set to `values`."""
+    names = ("LOWER_HEIGHT", "UPPER_HEIGHT", "center_tolerance")
+    saved = [getattr(module, name) for name in names]
+    for name, value in zip(names, values):
+        setattr(module, name, value)
+    try:
+        state = {'stopped': False}
+        with contextlib.redirect_stdout(io.StringIO()):  # "Fist detected" otherwise
+            return [ord(module.decide({'bboxInfo': line['bbox'] and {'bbox': line['bbox']}, 'fist': line['fist'],
+                                       'frame_size': (1280, 720)}, state)[0]) for line in lines]
+    finally:
+        for name, value in zip(names, saved):
+            setattr(module, name, value)
+
+
+def bench(sessions=4, frames=3000, processes=None):
+    """Vectorised vs per-frame decide(), then recover the thresholds synthetic sessions were labelled with."""
+    truth = {'lower': 0.75, 'upper': 1.2, 'center_tolerance': 0.08, 'tolerance': 18}
+    recorded = synthetic_lines(sessions, frames)
+    print(f"[Tuner] {sessions} synthetic sessions x {frames} frames, labelled with {truth}")
+
+    # Same commands as full_follow.decide() for a few settings, and how much faster per setting
+    module = importlib.import_module("full_follow")
+    data = concat_sessions([session_arrays(recorded[0])])
+    settings = [(0.5, 1.25, 0.1), (0.7, 0.9, 0.05), (0.6, 1.1, 0.2)]
+    started = time.perf_counter()
+    scalar = [scalar_commands(module, recorded[0], values) for values in settings]
+    scalar_s = (time.perf_counter() - started) / len(settings)
+    started = time.perf_counter()
+    vector = commands_for("zone", data, dict(zip(GRIDS['zone'], np.array(settings).T)))
+    vector_s = (time.perf_counter() - started) / len(settings)
+    same = all(row.tolist() == commands for row, commands in zip(vector, scalar))
+    print(f"[Tuner] decide() {frames / scalar_s / 1e6:.2f}M frame-evals/s, vectorised (3 settings at once) "
+          f"{frames / vector_s / 1e6:.0f}M frame-evals/s, identical commands: {same}")
+
+    for mode in ("full_follow", "center_follow", "planner"):
+        policy, latch = MODES[mode]
+        for i, lines in enumerate(recorded):
+            label_lines(lines, mode, truth, seed=i)
+        data = concat_sessions([session_arrays(lines) for lines in recorded], latch)
+        grid = parse_grid(None, policy)
+        for workers in sorted({1, processes or os.cpu_count() or 1}):
+            started = time.perf_counter()
+            params, metrics = sweep(data, policy, grid, workers)
+            elapsed = time.perf_counter() - started
+            points = len(next(iter(params.values())))
+            print(f"[Tuner] {mode}: {points} settings x {len(data['label'])} frames in {elapsed:.2f} s "
+                  f"with {workers} process(es), {points * len(data['label']) / elapsed / 1e6:.0f}M frame-evals/s")
+        best = ranked(params, metrics, 1, current_settings(mode))[0]
+        print(f"[Tuner] {mode}: best {describe(best, mode)}  {best}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep follower thresholds over recorded, labelled sessions")
+    parser.add_argument("mode", nargs="?", choices=sorted(MODES))
+    parser.add_argument("sessions", nargs="*", help="detections.jsonl files with a 'command' per frame")
+    parser.add_argument("--grid", nargs="+", help="override sweep axes: name=start:stop:step or name=v1,v2")
+    parser.add_argument("--frame-size", type=int, nargs=2, default=(1280, 720),
+                        help="bbox frame size for lines without 'frame_size'")
+    parser.add_argument("--too-close", type=float, default=0.9, help="TOO_CLOSE_*_RATIO, not swept")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--json", help="write the ranked settings to this file")
+    parser.add_argument("--bench", action="store_true", help="benchmark on synthetic labelled sessions")
+    parser.add_argument("--frames", type=int, default=3000, help="--bench: frames per session")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(frames=args.frames, processes=args.processes)
+        return
+    if args.mode is None or not args.sessions:
+        parser.error("a mode and at least one session file are required (or --bench)")
+
+    policy, latch = MODES[args.mode]
+    data = concat_sessions([load_session(path, tuple(args.frame_size)) for path in args.sessions], latch)
+    labelled = int((data['label'] > 0).sum())
+    if not labelled:
+        parser.error("no frame has a 'command' label")
+    try:
+        grid = parse_grid(args.grid, policy)
+    except ValueError as e:
+        parser.error(str(e))
+
+    current = current_settings(args.mode)
+    for name, value in current.items():
+        grid[name] = np.unique(np.round(np.append(grid[name], value), 6))  # so the current setting competes too
+
+    started = time.perf_counter()
+    params, metrics = sweep(data, policy, grid, args.processes, args.too_close)
+    points = len(next(iter(params.values())))
+    print(f"[Tuner] {points} settings x {len(data['label'])} frames ({labelled} labelled) "
+          f"in {time.perf_counter() - started:.2f} s")
+
+    _init_worker(policy, data, args.too_close)
+    now = ranked({name: np.array([value]) for name, value in current.items()},
+                 evaluate({name: np.array([value]) for name, value in current.items()}), 1)[0]
+    if labelled == len(data['label']):
+        reference = score(data['label'][None, :], data)  # how jittery the labels themselves are
+        print(f"[Tuner] Labels: {reference['changes'][0]:.4f} changes, {reference['blips'][0]:.4f} blips per frame")
+    print(f"[Tuner] Current: {describe(now, args.mode)}  {now}")
+    results = ranked(params, metrics, args.top, current)
+    for i, setting in enumerate(results, 1):
+        print(f"[Tuner] #{i}: {describe(setting, args.mode)}  {setting}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'mode': args.mode, 'current': now, 'ranked': results}, f, indent=2)
+        print(f"[Tuner] Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
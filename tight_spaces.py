@@ -1,107 +1,103 @@
-import cv2
-import socket
-import depthai as dai
-from cvzone.PoseModule import PoseDetector
+from command_sender import CommandSender
+from frame_source import DepthAISource
+from pose_tracker import PoseTracker
+from occupancy_grid import OccupancyGrid, guard, intrinsics_from_device
+from startup import warm_up
+from tracing import span
+from follower_runtime import COLOR_GREEN, COLOR_PURPLE, COLOR_RED, person_box, run_follower
 
 # TCP Connection Setup
 ROBOT_IP = "100.87.161.11"
 PORT = 9999
-client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-client_socket.connect((ROBOT_IP, PORT))
-print("[Follower] Connected to robot.")
-
-# Initialize pose detector
-pose_detector = PoseDetector()
-
-# Create pipeline and camera
-pipeline = dai.Pipeline()
-cam = pipeline.createColorCamera()
-cam.setPreviewSize(1280, 720)  # Higher resolution for better range
-cam.setInterleaved(False)
-cam.setBoardSocket(dai.CameraBoardSocket.CAM_A)
-xout = pipeline.createXLinkOut()
-xout.setStreamName("video")
-cam.preview.link(xout.input)
 
 # Frame and movement setup
-frame_width = 1280
+frame_width = 1280   # camera preview (field of view) the thresholds were tuned on
 frame_height = 720
-frame_center = frame_width // 2
-center_tolerance = frame_width // 10  # acceptable range to go straight
+INFER_SIZE = (640, 360)   # detector input, scaled on the camera (see frame_source.py)
+DISPLAY_SIZE = None       # e.g. (1280, 720) for a separate, sharper display stream
+DISPLAY_EVERY = 2         # display stream carries every Nth camera frame
+POSE_MAX_INTERVAL = 6     # findPose at least every Nth frame, bbox tracked in between (pose_tracker.py)
+LATENCY_BUDGET = 0.15
+SHED_ORDER = ("draw", "resolution")  # no hand detection to shed
+PROTOCOL = "legacy"       # or "binary": velocity messages with proportional steering (velocity_protocol.py)
+TRANSPORT = "tcp"         # or "udp": one datagram per message, binary protocol only (command_sender.py)
+USE_OCCUPANCY = True      # stereo depth -> occupancy grid; only turn/reverse into free space
+
+# Thresholds are fractions of the frame, so they hold at any resolution
+center_tolerance = 0.1  # acceptable range to go straight
 
 # Thresholds for distance zones (adjust these for your setup)
-LOWER_HEIGHT = 700   # below this -> move forward (green)
-UPPER_HEIGHT = 850   # between LOWER and UPPER -> stop (purple)
+LOWER_HEIGHT = 700 / 720   # below this -> move forward (green), 700 px at 720p
+UPPER_HEIGHT = 850 / 720   # between LOWER and UPPER -> stop (purple), 850 px at 720p
 TOO_CLOSE_WIDTH_RATIO = 0.9   # width or height > 90% of frame -> move backward (red)
 TOO_CLOSE_HEIGHT_RATIO = 0.9
 
-# Colors (BGR)
-COLOR_GREEN = (0, 255, 0)
-COLOR_PURPLE = (255, 0, 255)  # violet/purple
-COLOR_RED = (0, 0, 255)
-
-# Run on device
-with dai.Device(pipeline) as device:
-    video_queue = device.getOutputQueue(name="video", maxSize=4, blocking=False)
-
-    try:
-        while True:
-            in_frame = video_queue.get()
-            frame = in_frame.getCvFrame()
-
-            # Pose detection
-            img = pose_detector.findPose(frame)
-            lmList, bboxInfo = pose_detector.findPosition(img, bboxWithHands=True)
-
-            if bboxInfo is not None and 'bbox' in bboxInfo:
-                x, y, w, h = bboxInfo['bbox']
-
-                cx = x + w // 2
-                offset = cx - frame_center
-
-                # Decide movement command and bbox color
-                if w >= TOO_CLOSE_WIDTH_RATIO * frame_width or h >= TOO_CLOSE_HEIGHT_RATIO * frame_height:
-                    command = 's'  # move backward
-                    box_color = COLOR_RED
-                elif LOWER_HEIGHT <= h <= UPPER_HEIGHT:
-                    command = 'x'  # stop
-                    box_color = COLOR_PURPLE
-                elif h < LOWER_HEIGHT:
-                    # move forward or turn
-                    if abs(offset) < center_tolerance:
-                        command = 'w'
-                    elif offset < 0:
-                        command = 'a'
-                    else:
-                        command = 'd'
-                    box_color = COLOR_GREEN
-                else:
-                    # fallback, stop
-                    command = 'x'
-                    box_color = COLOR_PURPLE
-
-                # Draw bounding box and center dot with dynamic color
-                cv2.rectangle(img, (x, y), (x + w, y + h), box_color, thickness=3)
-                cv2.circle(img, (cx, y + h // 2), 5, (0, 0, 255), cv2.FILLED)
-
-            else:
-                command = 'x'  # stop if no person detected
-                # No bounding box drawn if no person detected
-
-            try:
-                client_socket.sendall(command.encode())
-                print(f"[Follower] Sent command: {command}")
-            except Exception as e:
-                print(f"[Follower][TCP ERROR]: {e}")
-
-            # Show the full annotated frame
-            cv2.imshow("Follower View", img)
-
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                client_socket.sendall('x'.encode())
-                break
-
-    finally:
-        client_socket.close()
-        cv2.destroyAllWindows()
-        print("[Follower] Shutdown complete.")
\ No newline at end of file
+
+def build_detect(state):
+    """Create the pose detector and return detect(frame) -> (img, detection)."""
+    from cvzone.PoseModule import PoseDetector
+    from detection_cache import cached
+    pose_detector = cached(warm_up(PoseDetector(), INFER_SIZE))
+    find_pose = state['pose_tracker'] = PoseTracker(pose_detector, max_interval=POSE_MAX_INTERVAL)
+
+    def detect(frame, depth=None):
+        # Obstacles around the robot, from the depth aligned to this frame
+        if depth is not None and 'grid' in state:
+            with span("occupancy"):
+                state['grid'].update(depth)
+
+        # Pose detection
+        with span("findPose"):
+            img, lmList, bboxInfo = find_pose(frame)
+        return img, {'lmList': lmList, 'bboxInfo': bboxInfo, 'frame_size': (frame.shape[1], frame.shape[0])}
+    return detect
+
+
+def decide(detection, state):
+    """Return (command, box_color) for one detection."""
+    box = person_box(detection, (frame_width, frame_height))
+    if box is None:
+        return 'x', None  # stop if no person detected, no bounding box drawn
+
+    offset, w, h = box
+
+    # Decide movement command and bbox color
+    if w >= TOO_CLOSE_WIDTH_RATIO or h >= TOO_CLOSE_HEIGHT_RATIO:
+        return guard(state.get('grid'), 's'), COLOR_RED  # move backward
+    elif LOWER_HEIGHT <= h <= UPPER_HEIGHT:
+        return 'x', COLOR_PURPLE  # stop
+    elif h < LOWER_HEIGHT:
+        # move forward or turn
+        if abs(offset) < center_tolerance:
+            command = 'w'
+        elif offset < 0:
+            command = 'a'
+        else:
+            command = 'd'
+        return guard(state.get('grid'), command), COLOR_GREEN
+    # fallback, stop
+    return 'x', COLOR_PURPLE
+
+
+def main():
+    sender = CommandSender(ROBOT_IP, PORT, protocol=PROTOCOL, transport=TRANSPORT).start()
+    camera = DepthAISource(frame_width, frame_height, infer_size=INFER_SIZE, display_size=DISPLAY_SIZE,
+                           display_every=DISPLAY_EVERY, depth=USE_OCCUPANCY)
+    state = {}
+    grid = state['grid'] = OccupancyGrid()  # obstacles around the robot (see occupancy_grid.py)
+
+    def send(command, velocity=None):
+        grid.drive(command, velocity)  # dead-reckon the grid with what the robot was actually told
+        sender.send(command, velocity)
+
+    def on_open(video_queue):
+        if USE_OCCUPANCY:
+            grid.intrinsics = intrinsics_from_device(video_queue.device, INFER_SIZE)
+
+    run_follower(sender, camera, build_detect, decide, state, LATENCY_BUDGET, SHED_ORDER, send=send, on_open=on_open,
+                 reports=lambda video_queue: {"Pose tracking": state['pose_tracker'].report(),
+                                              "Occupancy": grid.report()})
+
+
+if __name__ == "__main__":
+    main()
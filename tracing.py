@@ -0,0 +1,175 @@
+#Per-stage latency tracing for the follower scripts and planner.py
+#Spans are keyed by the DepthAI frame sequence number and device timestamp,
+#folded into fixed-size log-bucket histograms, and kept in a bounded ring
+#buffer that can be exported as Chrome trace JSON (chrome://tracing or
+#https://ui.perfetto.dev) on exit
+#
+#Tracing is on by default and costs a couple of microseconds per span.
+#Set FOLLOW_TRACE=trace.json to write the trace on exit, or
+#FOLLOW_TRACE_DISABLE=1 to turn span recording off entirely
+
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+# Histogram buckets: 4 per octave from 1us up to ~1000s
+BUCKETS_PER_OCTAVE = 4
+NUM_BUCKETS = 30 * BUCKETS_PER_OCTAVE
+
+
+class Histogram:
+    """Fixed-size log-bucket latency histogram (values in seconds)."""
+
+    def __init__(self):
+        self.buckets = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        us = seconds * 1e6
+        index = int(math.log2(us) * BUCKETS_PER_OCTAVE) if us > 1.0 else 0
+        self.buckets[min(index, NUM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """Upper edge of the bucket holding the p-th percentile, in seconds."""
+        if self.count == 0:
+            return 0.0
+        target = self.count * p / 100.0
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return min(2 ** ((index + 1) / BUCKETS_PER_OCTAVE) / 1e6, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'start')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, time.monotonic())
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Collects stage spans per frame.
+
+    Each thread declares which frame it is working on with ``begin_frame``; any
+    ``span`` opened on that thread is then tagged with that frame's sequence
+    number. Times use time.monotonic(), the clock DepthAI syncs device
+    timestamps to, so ``queue`` spans measure real time spent waiting on the host.
+    """
+
+    def __init__(self, enabled=True, max_events=200000):
+        self.enabled = enabled
+        self.histograms = {}
+        self.events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def begin_frame(self, seq, timestamp):
+        self._local.frame = (seq, timestamp)
+
+    def current_frame(self):
+        """Return (seq, device_timestamp) for this thread's frame, or (None, None)."""
+        return getattr(self._local, 'frame', (None, None))
+
+    def span(self, name):
+        """Context manager timing one stage of the current frame."""
+        return _Span(self, name) if self.enabled else _NULL_SPAN
+
+    def record(self, name, start, end, seq=None):
+        """Record a finished span; seq defaults to the current thread's frame."""
+        if not self.enabled:
+            return
+        if seq is None:
+            seq = self.current_frame()[0]
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(end - start)
+        self.events.append((name, threading.current_thread().name, start, end - start, seq))
+
+    def record_since_capture(self, name, end=None):
+        """Record a span from the current frame's device timestamp to now."""
+        seq, timestamp = self.current_frame()
+        if timestamp is None:
+            return
+        end = time.monotonic() if end is None else end
+        if 0.0 <= end - timestamp < 60.0:  # ignore sources not on the host monotonic clock
+            self.record(name, timestamp, end, seq)
+
+    def summary(self):
+        lines = [f"{'stage':20s} {'count':>7s} {'mean':>9s} {'p50':>9s} {'p90':>9s} {'p99':>9s} {'max':>9s}"]
+        with self._lock:
+            items = sorted(self.histograms.items())
+        for name, h in items:
+            lines.append(f"{name:20s} {h.count:7d} " + " ".join(
+                f"{value * 1000:8.2f}ms" for value in
+                (h.mean(), h.percentile(50), h.percentile(90), h.percentile(99), h.max)))
+        return "\n".join(lines)
+
+    def export_chrome(self, path):
+        """Write the buffered spans as Chrome trace event JSON."""
+        events = list(self.events)
+        thread_ids = {}
+        trace = []
+        for name, thread, start, duration, seq in events:
+            tid = thread_ids.setdefault(thread, len(thread_ids) + 1)
+            trace.append({"name": name, "ph": "X", "pid": 1, "tid": tid,
+                          "ts": start * 1e6, "dur": duration * 1e6,
+                          "args": {"seq": seq}})
+        for thread, tid in thread_ids.items():
+            trace.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+                          "args": {"name": thread}})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+
+tracer = Tracer(enabled=os.environ.get("FOLLOW_TRACE_DISABLE") != "1")
+span = tracer.span
+
+
+def _export_on_exit():
+    path = os.environ.get("FOLLOW_TRACE")
+    if path and tracer.events:
+        count = tracer.export_chrome(path)
+        print(f"[Trace] Wrote {count} spans to {path}")
+
+
+atexit.register(_export_on_exit)
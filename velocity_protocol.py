@@ -0,0 +1,279 @@
+#Binary framed velocity protocol between the vision scripts and controller.py
+#The legacy link is a stream of bare characters ('w', 'a', 'd', 's', 'x'): no
+#framing, no magnitude, and nothing that lets the robot tell a fresh command
+#from one that sat in a socket buffer. Each binary message is one fixed-size
+#little-endian struct:
+#  magic 'AV' | version | flags | message seq (uint32) |
+#  capture timestamp (f64) | send timestamp (f64) |
+#  linear m/s (f32) | angular rad/s (f32, counter-clockwise positive) | CRC-32
+#The capture timestamp is the device timestamp of the newest frame that produced
+#(or, for a heartbeat, confirmed) the command. VelocityDecoder is the reference
+#decoder for controller.py: it resynchronises on the magic + CRC after garbage,
+#and CommandFilter drops repeated/out-of-order sequence numbers and packets too
+#old to execute. The robot's clock is not the vision host's, so a packet's age
+#is its processing time (send - capture, one clock) plus how much longer than
+#the fastest packet seen so far it took to arrive. Deadman stops the robot when
+#commands stop arriving (the sender heartbeats an unchanged command)
+#
+#Encode/decode cost and a link that stalls and then delivers its backlog:
+#  python3 velocity_protocol.py
+
+import argparse
+import math
+import random
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+
+MAGIC = b'AV'
+VERSION = 1
+FLAG_STOP = 0x01       # a stop; always executed, never considered stale
+FLAG_HEARTBEAT = 0x02  # repeat of an unchanged command
+
+PACKET = struct.Struct('<2sBBIddff')
+CRC = struct.Struct('<I')
+PACKET_SIZE = PACKET.size + CRC.size  # 36 bytes
+
+# What controller.py drives for each legacy command (set these to your controller's speeds)
+LINEAR_SPEED = 0.5    # m/s for 'w' / 's'
+ANGULAR_SPEED = 0.6   # rad/s for 'a' / 'd', counter-clockwise positive
+COMMAND_TWIST = {
+    'w': (LINEAR_SPEED, 0.0),
+    's': (-LINEAR_SPEED, 0.0),
+    'a': (0.0, ANGULAR_SPEED),
+    'd': (0.0, -ANGULAR_SPEED),
+    'x': (0.0, 0.0),
+}
+
+# Proportional steering from the target's offset (fraction of the frame width, + = right of centre)
+STEER_GAIN = 2.4        # rad/s per frame width; a target at the frame edge turns at ANGULAR_SPEED
+MIN_TURN = 0.15         # rad/s, slowest in-place turn that still overcomes the tracks' friction
+FORWARD_STEER = 0.5     # while driving forward, steer at most this fraction of ANGULAR_SPEED
+
+
+@dataclass
+class VelocityCommand:
+    seq: int
+    capture_ts: float  # NaN when no frame produced it (e.g. the shutdown stop)
+    sent_ts: float
+    linear: float
+    angular: float
+    flags: int = 0
+
+    @property
+    def stop(self) -> bool:
+        return bool(self.flags & FLAG_STOP)
+
+    @property
+    def heartbeat(self) -> bool:
+        return bool(self.flags & FLAG_HEARTBEAT)
+
+
+def encode(seq, capture_ts, linear, angular, flags=0, sent_ts=None) -> bytes:
+    """One framed message; seq wraps at 2**32 and a missing capture_ts is sent as NaN."""
+    if sent_ts is None:
+        sent_ts = time.monotonic()
+    if linear == 0.0 and angular == 0.0:
+        flags |= FLAG_STOP
+    body = PACKET.pack(MAGIC, VERSION, flags, seq & 0xFFFFFFFF,
+                       math.nan if capture_ts is None else capture_ts, sent_ts, linear, angular)
+    return body + CRC.pack(zlib.crc32(body))
+
+
+def decode(data: bytes) -> VelocityCommand:
+    """Decode one PACKET_SIZE message; raises ValueError if it is not a valid one."""
+    if len(data) != PACKET_SIZE:
+        raise ValueError(f"Expected {PACKET_SIZE} bytes, got {len(data)}")
+    magic, version, flags, seq, capture_ts, sent_ts, linear, angular = PACKET.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Bad header {magic!r} v{version}")
+    if CRC.unpack_from(data, PACKET.size)[0] != zlib.crc32(data[:PACKET.size]):
+        raise ValueError("CRC mismatch")
+    return VelocityCommand(seq, capture_ts, sent_ts, linear, angular, flags)
+
+
+class VelocityDecoder:
+    """Splits a TCP byte stream into VelocityCommands, skipping bytes until a valid frame."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.stats = {'packets': 0, 'skipped_bytes': 0}
+
+    def feed(self, data: bytes):
+        """Append received bytes and return every complete message in them."""
+        self.buffer += data
+        packets = []
+        start = 0
+        while True:
+            start_magic = self.buffer.find(MAGIC, start)
+            if start_magic < 0:
+                keep = len(self.buffer) - 1 if self.buffer.endswith(MAGIC[:1]) else len(self.buffer)
+                keep = max(start, keep)  # a trailing 'A' may be the start of the next magic
+                self.stats['skipped_bytes'] += keep - start
+                start = keep
+                break
+            self.stats['skipped_bytes'] += start_magic - start
+            start = start_magic
+            if len(self.buffer) - start < PACKET_SIZE:
+                break
+            try:
+                packets.append(decode(bytes(self.buffer[start:start + PACKET_SIZE])))
+            except ValueError:
+                self.stats['skipped_bytes'] += 1  # a stray 'AV' in garbage, or a corrupt frame
+                start += 1
+                continue
+            start += PACKET_SIZE
+        del self.buffer[:start]
+        self.stats['packets'] += len(packets)
+        return packets
+
+
+def seq_newer(seq, last) -> bool:
+    """Whether seq comes after last, allowing for uint32 wrap-around."""
+    return 0 < (seq - last) & 0xFFFFFFFF < 0x80000000
+
+
+class CommandFilter:
+    """Robot-side gate: only newer, fresh-enough commands are executed.
+
+    One filter per connection. ``max_age`` is the oldest frame, in seconds, a
+    command may have been produced from; stops are never dropped as stale.
+    """
+
+    def __init__(self, max_age=0.25):
+        self.max_age = max_age
+        self.last_seq = None
+        self.min_transit = math.inf  # (receive clock - send clock) of the fastest packet so far
+        self.stats = {'accepted': 0, 'out_of_order': 0, 'stale': 0}
+
+    def age(self, packet: VelocityCommand, received=None) -> float:
+        """Estimated age of the packet's frame on arrival, in seconds."""
+        transit = (time.monotonic() if received is None else received) - packet.sent_ts
+        self.min_transit = min(self.min_transit, transit)
+        processing = 0.0 if math.isnan(packet.capture_ts) else max(0.0, packet.sent_ts - packet.capture_ts)
+        return processing + transit - self.min_transit
+
+    def accept(self, packet: VelocityCommand, received=None) -> bool:
+        age = self.age(packet, received)
+        if self.last_seq is not None and not seq_newer(packet.seq, self.last_seq):
+            self.stats['out_of_order'] += 1
+            return False
+        self.last_seq = packet.seq
+        if age > self.max_age and not packet.stop:
+            self.stats['stale'] += 1
+            return False
+        self.stats['accepted'] += 1
+        return True
+
+
+class Deadman:
+    """Robot-side watchdog: stop once no command has been executed for ``timeout`` seconds.
+
+    kick() after executing a command; expired() is polled between receives and
+    returns True once per silence that leaves the robot moving.
+    """
+
+    def __init__(self, timeout=0.5):
+        self.timeout = timeout
+        self.last = None
+        self.moving = False
+        self.trips = 0
+
+    def kick(self, packet: VelocityCommand, now=None):
+        self.last = time.monotonic() if now is None else now
+        self.moving = not packet.stop
+
+    def expired(self, now=None) -> bool:
+        if not self.moving or (time.monotonic() if now is None else now) - self.last < self.timeout:
+            return False
+        self.moving = False
+        self.trips += 1
+        return True
+
+
+def proportional(command, offset, gain=STEER_GAIN):
+    """(linear, angular) for a legacy command, turning in proportion to the target's offset.
+
+    ``offset`` is the target's distance from mid-frame in frame widths (+ = right).
+    'a' / 'd' keep their direction and turn faster the further off-centre the
+    target is; 'w' drives at full speed and steers gently toward it; 's' and 'x'
+    are unchanged. Rounded so a change-only sender is not flooded by jitter.
+    """
+    linear, angular = COMMAND_TWIST.get(command, COMMAND_TWIST['x'])
+    if offset is None:
+        return linear, angular
+    if command in ('a', 'd'):
+        angular = math.copysign(min(ANGULAR_SPEED, max(MIN_TURN, gain * abs(offset))), angular)
+    elif command == 'w':
+        limit = ANGULAR_SPEED * FORWARD_STEER
+        angular = max(-limit, min(limit, -gain * offset))
+    return round(linear, 2), round(angular, 2)
+
+
+def to_legacy(linear, angular, deadband=0.01) -> str:
+    """The legacy character closest to a velocity, for controllers that only drive fixed speeds."""
+    if abs(linear) > deadband:
+        return 'w' if linear > 0 else 's'
+    if abs(angular) > deadband:
+        return 'a' if angular > 0 else 'd'
+    return 'x'
+
+
+def simulate_link(frames, fps=30.0, stalls=((2.0, 0.6), (6.0, 0.4)), offset=1234.5, max_age=0.25, seed=0):
+    """Ages (s) of the commands executed by a legacy and a binary robot, one command per frame.
+
+    binary holds (age, stop) pairs. During each (start, duration) stall the link
+    delivers nothing; the backlog then arrives at once, as TCP does after a Wi-Fi
+    dropout. The robot's clock is ``offset`` seconds off the vision host's.
+    """
+    rng = random.Random(seed)
+    legacy, binary = [], []
+    decoder, gate = VelocityDecoder(), CommandFilter(max_age)
+    for i in range(frames):
+        captured = i / fps
+        sent = captured + rng.uniform(0.03, 0.06)  # detection + decision
+        arrival = sent + rng.uniform(0.002, 0.01)
+        for start, duration in stalls:
+            if start <= arrival < start + duration:
+                arrival = start + duration + rng.uniform(0, 0.005)
+        legacy.append(arrival - captured)  # every character is executed, however late
+        command = 'wadsx'[(i // 20) % 5]
+        for packet in decoder.feed(encode(i, captured, *COMMAND_TWIST[command], sent_ts=sent)):
+            if gate.accept(packet, received=arrival + offset):
+                binary.append((arrival - captured, packet.stop))
+    return legacy, binary, gate
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the binary velocity protocol")
+    parser.add_argument("--packets", type=int, default=100000)
+    parser.add_argument("--max-age", type=float, default=0.25)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    stream = b"".join(encode(i, i / 30, 0.5, -0.12) for i in range(args.packets))
+    encode_us = (time.perf_counter() - started) * 1e6 / args.packets
+
+    decoder = VelocityDecoder()
+    started = time.perf_counter()
+    decoded = sum(len(decoder.feed(stream[i:i + 4096])) for i in range(0, len(stream), 4096))
+    decode_us = (time.perf_counter() - started) * 1e6 / args.packets
+    assert decoded == args.packets
+    print(f"[Protocol] {PACKET_SIZE}-byte packets: encode {encode_us:.2f} us, stream decode {decode_us:.2f} us")
+
+    # Garbage and a flipped bit between packets: the decoder drops only what it must
+    corrupt = bytearray(encode(1, 0.0, 0.5, 0.0) + b'\x00AVgarbage' + encode(2, 0.1, 0.5, 0.0) + encode(3, 0.2, 0, 0))
+    corrupt[len(corrupt) - PACKET_SIZE - 5] ^= 0x10
+    decoder = VelocityDecoder()
+    seqs = [packet.seq for packet in decoder.feed(bytes(corrupt))]
+    print(f"[Protocol] Corrupted stream -> seqs {seqs}, {decoder.stats}")
+
+    legacy, binary, gate = simulate_link(900, max_age=args.max_age)
+    late = args.max_age
+    moving = [age for age, stop in binary if not stop]
+    print(f"[Protocol] Link with two stalls, 900 commands: legacy executes {len(legacy)}, "
+          f"{sum(age > late for age in legacy)} older than {late * 1000:.0f} ms (max {max(legacy) * 1000:.0f} ms); "
+          f"binary executes {len(binary)}, {sum(age > late for age in moving)} moving ones older "
+          f"(max {max(moving) * 1000:.0f} ms), {sum(age > late for age, stop in binary if stop)} late stops")
+    print(f"[Protocol] Filter: {gate.stats}")